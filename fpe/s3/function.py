@@ -4,10 +4,14 @@ import hashlib
 import pandas as pd
 import json
 import os
+import sys
 from typing import Dict, List, Any
 import io
 import boto3
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from token_vault import key_fingerprint
+
 s3 = boto3.client("s3")
 
 # class logs:
@@ -213,15 +217,19 @@ class FormatPreservingEncryption:
 
 
 class DataEncryptor:
-    def __init__(self, key=None, data_dictionary_path=None):
+    def __init__(self, key=None, data_dictionary_path=None, vault=None):
         """
         Initialize Data Encryptor with optional key and data dictionary
         :param key: bytes - encryption key (if None, generates new key)
         :param data_dictionary_path: str - path to data dictionary CSV file
+        :param vault: TokenVault - optional token vault (fpe/token_vault.py); values
+                      already in the vault are looked up instead of re-encrypted
         """
         self.key = key if key else get_random_bytes(16)
         self.fpe = FormatPreservingEncryption(self.key)
         self.data_dictionary = self._load_data_dictionary(data_dictionary_path)
+        self.vault = vault
+        self.key_fingerprint = key_fingerprint(self.key)
     
     def _load_data_dictionary(self, path):
         """
@@ -328,12 +336,19 @@ class DataEncryptor:
 
         if field_type == "numeric":
             format_template = field_config.get("format", None)
-            return self.fpe.encrypt_numeric(str(value), format_template)
+            encrypt = lambda v: self.fpe.encrypt_numeric(v, format_template)
         elif field_type == "alphanumeric":
-            return self.fpe.encrypt_alphanumeric(str(value))
+            format_template = None
+            encrypt = self.fpe.encrypt_alphanumeric
         else:
             return value
 
+        if self.vault is None:
+            return encrypt(str(value))
+        # tokens depend on key + type + format, so those make up the vault namespace
+        namespace = f"fpe:{self.key_fingerprint}:{field_type}:{format_template}"
+        return self.vault.get_or_create(namespace, str(value), encrypt)
+
     def decrypt_value(self, value, field_config):
         """
         Decrypt a single value based on field configuration
@@ -370,6 +385,9 @@ class DataEncryptor:
                 print(f"Encrypting column: {column} (type: {field_config.get('type')})")
                 df[column] = df[column].apply(lambda x: self.encrypt_value(x, field_config))
 
+        if self.vault is not None:
+            self.vault.flush()
+
         return df
 
     def decrypt_dataframe(self, df, inplace=False):
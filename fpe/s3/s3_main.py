@@ -28,6 +28,8 @@ if __name__ == "__main__":
         enc_s3_key = params["enc_s3_key"]
         output_key = params["output_key"]
         log_key = params["log_key"]
+        vault_path = params.get("vault_path", "")
+        vault_max_pending = int(params.get("vault_max_pending", 100000))
         # ------------------------------------------------------------------
         # loging
         # ------------------------------------------------------------------
@@ -81,7 +83,15 @@ if __name__ == "__main__":
         print(dict_path)
 
 
-        encryptor = DataEncryptor(key = encryption_key, data_dictionary_path = dict_path)
+        # optional token vault: values seen in earlier runs are looked up, not re-encrypted
+        vault = None
+        if vault_path:
+            sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+            from token_vault import TokenVault
+            vault = TokenVault(vault_path, hash_key = encryption_key, max_pending = vault_max_pending)
+            print(f"Using token vault: {vault_path} ({len(vault)} tokens)")
+
+        encryptor = DataEncryptor(key = encryption_key, data_dictionary_path = dict_path, vault = vault)
         print("\nLoaded Sensitive Fields:")
         for field, config in encryptor.data_dictionary['sensitive_fields'].items():
             desc = config.get('description', 'N/A')
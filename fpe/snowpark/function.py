@@ -0,0 +1,721 @@
+# ===========================
+#  Obfuscation Framework (Snowpark runner)
+# ===========================
+# Rules are the same as in fpe/obfuscation_1; this module adds the pieces needed
+# to run them against full tables instead of a 10-row pandas sample.
+import os, sys, re, random, hashlib, json, time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from token_vault import key_fingerprint
+
+CFG_TABLE = "PUBLIC_OBF.OBF_CFG_COLUMNS"
+AUDIT_TABLE = "PUBLIC_OBF.OBF_RUN_AUDIT"
+WATERMARK_TABLE = "PUBLIC_OBF.OBF_WATERMARKS"
+
+# ---------- 1) BASIC RULES ----------
+def keep(value: Optional[str]) -> Optional[str]:
+    return value
+
+def nullify(value: Optional[str]) -> None:
+    return None
+
+def mask_fixed(value: Optional[str], mask_char: str = "X") -> Optional[str]:
+    if value is None:
+        return None
+    return mask_char * len(str(value))
+
+def mask_lastn(value: Optional[str], n: int = 4, mask_char: str = "X") -> Optional[str]:
+    if value is None:
+        return None
+    s = str(value)
+    if len(s) <= n:
+        return s
+    return (mask_char * (len(s) - n)) + s[-n:]
+
+def mask_firstn(value: Optional[str], n: int = 4, mask_char: str = "X") -> Optional[str]:
+    if value is None:
+        return None
+    s = str(value)
+    if len(s) <= n:
+        return s
+    return s[:n] + (mask_char * (len(s) - n))
+
+# ---------- 2) SCRAMBLE HELPERS ----------
+# Tokenizer: treat letter/digit groups as tokens; punctuation/separators kept verbatim.
+TOKEN_RE = re.compile(r"[A-Za-z0-9]+(?:['\-][A-Za-z0-9]+)*")
+
+def _case_pattern(w: str) -> str:
+    letters = ''.join(ch for ch in w if ch.isalpha())
+    if not letters:
+        return 'NA'
+    if letters.isupper():
+        return 'UP'
+    if letters.islower():
+        return 'LO'
+    if letters[0].isupper() and letters[1:].islower():
+        return 'TI'
+    return 'MX'
+
+def _apply_case(w: str, pattern: str) -> str:
+    if pattern == 'UP': return w.upper()
+    if pattern == 'LO': return w.lower()
+    if pattern == 'TI':
+        out, first = [], True
+        for ch in w:
+            if ch.isalpha() and first:
+                out.append(ch.upper()); first = False
+            elif ch.isalpha():
+                out.append(ch.lower())
+            else:
+                out.append(ch)
+        return ''.join(out)
+    return w
+
+def _seed_int(scope_key: str, token: str, salt: str) -> int:
+    src = f"{scope_key}|{token}|{salt}".encode("utf-8")
+    return int(hashlib.sha256(src).hexdigest(), 16)
+
+def _full_shuffle_chars(base: str, scope_key: str, salt: str) -> str:
+    if len(base) <= 1:
+        return base
+    chars = list(base)
+    rng = random.Random(_seed_int(scope_key, base, salt))
+    rng.shuffle(chars)
+    return ''.join(chars)
+
+def _rotate_chars(base: str, scope_key: str, salt: str, direction: str = "left") -> str:
+    n = len(base)
+    if n <= 1:
+        return base
+    k = _seed_int(scope_key, base, salt) % n
+    if k == 0:
+        k = 1  # avoid identity
+    if direction == "right":
+        k = n - k
+    return base[k:] + base[:k]
+
+def _reverse_chars(base: str) -> str:
+    return base[::-1]
+
+def _scramble_token(token: str, scope_key: str, salt: str, variant: str) -> str:
+    if token.isdigit():
+        base = token
+        if variant == "ROTATE_LEFT":
+            return _rotate_chars(base, scope_key, salt, "left")
+        if variant == "ROTATE_RIGHT":
+            return _rotate_chars(base, scope_key, salt, "right")
+        if variant == "REVERSE":
+            return _reverse_chars(base)
+        # FULL_SHUFFLE, and INTERNAL shuffle which makes no sense for digits
+        return _full_shuffle_chars(base, scope_key, salt)
+
+    pat = _case_pattern(token)
+    letters_lower = ''.join(ch.lower() if ch.isalpha() else ch for ch in token)
+    if variant == "FULL_SHUFFLE":
+        out = _full_shuffle_chars(letters_lower, scope_key, salt)
+    elif variant == "ROTATE_LEFT":
+        out = _rotate_chars(letters_lower, scope_key, salt, "left")
+    elif variant == "ROTATE_RIGHT":
+        out = _rotate_chars(letters_lower, scope_key, salt, "right")
+    elif variant == "REVERSE":
+        out = _reverse_chars(letters_lower)
+    else:  # INTERNAL_SHUFFLE_KEEP_FIRST_LAST on letters
+        chars = list(letters_lower)
+        alpha_idx = [i for i, ch in enumerate(chars) if ch.isalpha()]
+        if len(alpha_idx) <= 2:
+            out = letters_lower
+        else:
+            mid_idx = alpha_idx[1:-1]
+            mid_vals = [chars[i] for i in mid_idx]
+            rng = random.Random(_seed_int(scope_key, ''.join(chars), salt))
+            rng.shuffle(mid_vals)
+            for i, j in enumerate(mid_idx):
+                chars[j] = mid_vals[i]
+            out = ''.join(chars)
+    return _apply_case(out, pat)
+
+def scramble_words(text: Optional[str], scope_key: str, salt: str,
+                   variant: str = "INTERNAL_SHUFFLE_KEEP_FIRST_LAST") -> Optional[str]:
+    if text is None:
+        return None
+    out = []
+    last = 0
+    for m in TOKEN_RE.finditer(text):
+        if m.start() > last:
+            out.append(text[last:m.start()])
+        out.append(_scramble_token(m.group(0), scope_key, salt, variant))
+        last = m.end()
+    if last < len(text):
+        out.append(text[last:])
+    return ''.join(out)
+
+# ---------- 3) DISPATCHER ----------
+def parse_obf_params(obf_params) -> dict:
+    if obf_params is None:
+        return {}
+    if isinstance(obf_params, dict):
+        return obf_params
+    try:
+        return json.loads(str(obf_params))
+    except Exception:
+        return {}
+
+def apply_rule_value(rule_name: str, value, obf_params, scope_key: str, salt: str):
+    return compile_rule(rule_name, obf_params, scope_key, salt)(value)
+
+def compile_rule(rule_name: str, obf_params, scope_key: str, salt: str, vault=None):
+    """
+    Resolve rule + params once; returns a value -> value callable.
+    With a TokenVault (fpe/token_vault.py), SCRAMBLE_WORDS looks values up in the
+    vault and only scrambles (and stages) the ones it has not seen.
+    """
+    params = parse_obf_params(obf_params)
+    if rule_name == "KEEP":
+        return keep
+    if rule_name == "NULLIFY":
+        return nullify
+    if rule_name == "MASK_FIXED":
+        return lambda v: mask_fixed(v, **params)
+    if rule_name == "MASK_LASTN":
+        return lambda v: mask_lastn(v, **params)
+    if rule_name == "MASK_FIRSTN":
+        return lambda v: mask_firstn(v, **params)
+    if rule_name == "SCRAMBLE_WORDS":
+        variant = params.get("variant", "INTERNAL_SHUFFLE_KEEP_FIRST_LAST")
+        scramble = lambda v: scramble_words(v, scope_key, salt, variant)
+        if vault is None:
+            return scramble
+        salt_id = key_fingerprint(salt)
+        namespace = f"scramble:{salt_id}:{variant}:{scope_key}"
+        return lambda v: vault.get_or_create(namespace, v, scramble)
+    # Fallback: no change
+    return keep
+
+def compile_rules(cfg_rows, salt: str, vault=None) -> list:
+    """Turn OBF_CFG_COLUMNS rows into [(column_name, rule, fn), ...]."""
+    compiled = []
+    for r in cfg_rows:
+        col = r["COLUMN_NAME"]
+        rule = r["OBF_RULE"]
+        scope = r["SCOPE_KEY"] or col
+        compiled.append((col, rule, compile_rule(rule, r["OBF_PARAMS"], scope, salt, vault)))
+    return compiled
+
+def apply_compiled_rules(pdf, compiled):
+    """Apply compiled rules to a pandas batch in place (no copy of the batch)."""
+    for col, rule, fn in compiled:
+        if col not in pdf.columns or rule == "KEEP":
+            continue
+        if rule == "NULLIFY":
+            pdf[col] = None
+            continue
+        pdf[col] = pdf[col].map(lambda v: None if v is None or v != v else fn(v))
+    return pdf
+
+# ---------- 4) CONFIG ----------
+def load_params(param_file_path):
+    """Reads .param file into a dictionary (key=value per line)."""
+    params = {}
+    with open(param_file_path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if "=" in line:
+                key, value = line.split("=", 1)
+                params[key.strip()] = value.strip()
+    return params
+
+def load_cfg_rows(session, dataset: str, with_data_type: bool = False):
+    cols = ["COLUMN_NAME", "OBF_RULE", "OBF_PARAMS", "SCOPE_KEY"]
+    if with_data_type:
+        cols.append("DATA_TYPE")
+    return session.table(CFG_TABLE) \
+        .filter(f"dataset_name = '{dataset}' AND enabled = TRUE") \
+        .select(*cols) \
+        .collect()
+
+def split_table_name(name: str):
+    """'DB.SCHEMA.TABLE' -> (db, schema, table); missing parts are None."""
+    parts = [p.strip() for p in name.split(".")]
+    parts = [None] * (3 - len(parts)) + parts
+    return parts[0], parts[1], parts[2]
+
+# ---------- 5) STREAMED RUNNER ----------
+def _write_batch(session, pdf, target: str):
+    db, schema, table = split_table_name(target)
+    session.write_pandas(pdf, table, database=db, schema=schema,
+                         auto_create_table=False, overwrite=False)
+    return len(pdf)
+
+def run_streamed(session, dataset: str, source: str, target: str, salt: str,
+                 max_in_flight: int = 4, replace_target: bool = True, vault=None) -> dict:
+    """
+    Obfuscate SOURCE into TARGET batch by batch.
+    Source rows come from Snowpark's to_pandas_batches() so only the current batch
+    is materialised locally; each obfuscated batch is bulk-loaded with write_pandas
+    on a small pool. At most max_in_flight batches are waiting on the pool, so peak
+    memory is roughly (max_in_flight + 1) batches regardless of table size.
+    :param vault: TokenVault - optional; scrambled values are read from / added to it
+    :return: dict - batches and rows written
+    """
+    cfg_rows = load_cfg_rows(session, dataset)
+    compiled = compile_rules(cfg_rows, salt, vault)
+    print(f"Compiled {len(compiled)} rules for {dataset}")
+
+    if replace_target:
+        session.sql(f"create or replace table {target} like {source}").collect()
+
+    batches, rows = 0, 0
+    in_flight = deque()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        for pdf in session.table(source).to_pandas_batches():
+            apply_compiled_rules(pdf, compiled)
+            in_flight.append(pool.submit(_write_batch, session, pdf, target))
+            del pdf
+            batches += 1
+            while len(in_flight) >= max_in_flight:
+                rows += in_flight.popleft().result()
+        while in_flight:
+            rows += in_flight.popleft().result()
+
+    if vault is not None:
+        vault.flush()
+
+    print(f"Obfuscated {rows} rows in {batches} batches: {source} -> {target}")
+    return {"dataset": dataset, "batches": batches, "rows": rows}
+
+# ---------- 6) PUSH-DOWN COMPILER ----------
+# Rules that Snowflake can evaluate itself; SCRAMBLE_WORDS goes through a
+# vectorized UDF, anything else is kept as-is (same fallback as the dispatcher).
+PUSHDOWN_RULES = {"KEEP", "NULLIFY", "MASK_FIXED", "MASK_LASTN", "MASK_FIRSTN"}
+SCRAMBLE_UDF = "PUBLIC_OBF.OBF_SCRAMBLE_WORDS"
+
+def quote_ident(name: str) -> str:
+    name = str(name)
+    if name.startswith('"') and name.endswith('"'):
+        return name
+    return '"' + name.upper().replace('"', '""') + '"'
+
+def sql_literal(value) -> str:
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "''") + "'"
+
+def rule_to_sql(col: str, rule: str, obf_params, scope_key: str, data_type: Optional[str] = None,
+                udf_name: str = SCRAMBLE_UDF) -> str:
+    """SQL expression equivalent to compile_rule(...) for one column."""
+    params = parse_obf_params(obf_params)
+    c = quote_ident(col)
+    s = f"{c}::STRING"
+    if rule == "NULLIFY":
+        return f"CAST(NULL AS {data_type})" if data_type else "NULL"
+    if rule == "MASK_FIXED":
+        mask = sql_literal(params.get("mask_char", "X"))
+        return f"REPEAT({mask}, LENGTH({s}))"
+    if rule in ("MASK_LASTN", "MASK_FIRSTN"):
+        n = int(params.get("n", 4))
+        mask = sql_literal(params.get("mask_char", "X"))
+        if rule == "MASK_LASTN":
+            masked = f"REPEAT({mask}, LENGTH({s}) - {n}) || RIGHT({s}, {n})"
+        else:
+            masked = f"LEFT({s}, {n}) || REPEAT({mask}, LENGTH({s}) - {n})"
+        return f"IFF(LENGTH({s}) <= {n}, {s}, {masked})"
+    if rule == "SCRAMBLE_WORDS":
+        variant = params.get("variant", "INTERNAL_SHUFFLE_KEEP_FIRST_LAST")
+        return f"{udf_name}({s}, {sql_literal(scope_key)}, {sql_literal(variant)})"
+    return c
+
+def build_select_list(columns, cfg_rows, udf_name: str = SCRAMBLE_UDF) -> list:
+    """One SQL expression per source column, obfuscated where OBF_CFG_COLUMNS says so."""
+    cfg_by_col = {quote_ident(r["COLUMN_NAME"]): r for r in cfg_rows}
+    select_list = []
+    for col in columns:
+        c = quote_ident(col)
+        r = cfg_by_col.get(c)
+        if r is None:
+            select_list.append(c)
+            continue
+        try:
+            data_type = r["DATA_TYPE"]
+        except (KeyError, IndexError):
+            data_type = None
+        expr = rule_to_sql(col, r["OBF_RULE"], r["OBF_PARAMS"], r["SCOPE_KEY"] or r["COLUMN_NAME"],
+                           data_type, udf_name)
+        select_list.append(expr if expr == c else f"{expr} AS {c}")
+    return select_list
+
+def build_pushdown_sql(source: str, target: str, columns, cfg_rows,
+                       udf_name: str = SCRAMBLE_UDF) -> str:
+    """
+    Compile OBF_CFG_COLUMNS rows into one CREATE TABLE ... AS SELECT.
+    :param columns: list - source column names in table order
+    :param cfg_rows: rows with COLUMN_NAME, OBF_RULE, OBF_PARAMS, SCOPE_KEY (DATA_TYPE optional)
+    """
+    select_list = build_select_list(columns, cfg_rows, udf_name)
+    return (f"CREATE OR REPLACE TABLE {target} AS\nSELECT\n    "
+            + ",\n    ".join(select_list)
+            + f"\nFROM {source}")
+
+def register_scramble_udf(session, salt: str, udf_name: str = SCRAMBLE_UDF):
+    """Register SCRAMBLE_WORDS as a vectorized UDF; the salt is bound in the closure, not the SQL text."""
+    import os
+    from snowflake.snowpark.types import PandasSeriesType, StringType
+
+    def scramble_batch(text, scope, variant):
+        import pandas as pd
+        out = [scramble_words(t, sk, salt, v) if isinstance(t, str) else None
+               for t, sk, v in zip(text, scope, variant)]
+        return pd.Series(out, index=text.index)
+
+    return session.udf.register(
+        scramble_batch,
+        name=udf_name,
+        return_type=PandasSeriesType(StringType()),
+        input_types=[PandasSeriesType(StringType())] * 3,
+        imports=[(os.path.abspath(__file__), "function")],
+        packages=["pandas"],
+        replace=True,
+        is_permanent=False,
+    )
+
+def run_pushdown(session, dataset: str, source: str, target: str, salt: str,
+                 udf_name: str = SCRAMBLE_UDF, register_udf: bool = True) -> dict:
+    """Obfuscate SOURCE into TARGET entirely inside the warehouse (no rows leave Snowflake)."""
+    cfg_rows = load_cfg_rows(session, dataset, with_data_type=True)
+
+    if register_udf and any(r["OBF_RULE"] == "SCRAMBLE_WORDS" for r in cfg_rows):
+        register_scramble_udf(session, salt, udf_name)
+
+    columns = session.table(source).columns
+    stmt = build_pushdown_sql(source, target, columns, cfg_rows, udf_name)
+    print(stmt)
+    session.sql(stmt).collect()
+
+    rows = session.sql(f"select count(*) as N from {target}").collect()[0]["N"]
+    print(f"Obfuscated {rows} rows in-warehouse: {source} -> {target}")
+    return {"dataset": dataset, "rows": rows, "mode": "pushdown"}
+
+# ---------- 7) MULTI-DATASET SCHEDULER ----------
+def load_datasets(session) -> list:
+    """One job per enabled dataset in OBF_CFG_COLUMNS; "scramble" says whether it needs the scramble UDF."""
+    rows = session.sql(
+        f"select DATASET_NAME, SOURCE_DB, SOURCE_SCHEMA, SOURCE_TABLE, "
+        f"boolor_agg(OBF_RULE = 'SCRAMBLE_WORDS') as HAS_SCRAMBLE "
+        f"from {CFG_TABLE} where enabled = TRUE "
+        f"group by DATASET_NAME, SOURCE_DB, SOURCE_SCHEMA, SOURCE_TABLE order by DATASET_NAME"
+    ).collect()
+    return [
+        {
+            "dataset": r["DATASET_NAME"],
+            "source": f'{r["SOURCE_DB"]}.{r["SOURCE_SCHEMA"]}.{r["SOURCE_TABLE"]}',
+            "scramble": bool(r["HAS_SCRAMBLE"]),
+        }
+        for r in rows
+    ]
+
+def ensure_audit_table(session, audit_table: str = AUDIT_TABLE):
+    session.sql(f"""
+        create table if not exists {audit_table} (
+          run_id         string,
+          dataset_name   string,
+          source_table   string,
+          target_table   string,
+          mode           string,
+          status         string,
+          attempts       integer,
+          rows_processed number,
+          runtime_sec    float,
+          rows_per_sec   float,
+          error_message  string,
+          started_at     timestamp_ntz,
+          finished_at    timestamp_ntz
+        )""").collect()
+
+def write_audit(session, audit: dict, audit_table: str = AUDIT_TABLE):
+    cols = ["run_id", "dataset_name", "source_table", "target_table", "mode", "status",
+            "attempts", "rows_processed", "runtime_sec", "rows_per_sec", "error_message",
+            "started_at", "finished_at"]
+    values = []
+    for c in cols:
+        v = audit.get(c)
+        if v is None:
+            values.append("NULL")
+        elif isinstance(v, (int, float)):
+            values.append(str(v))
+        else:
+            values.append(sql_literal(v))
+    session.sql(f"insert into {audit_table} ({', '.join(cols)}) values ({', '.join(values)})").collect()
+
+def run_dataset_job(session, job: dict, salt: str, mode: str = "pushdown", max_retries: int = 2,
+                    retry_delay_sec: float = 30, max_in_flight: int = 4) -> dict:
+    """Run one dataset with retries; never raises, the outcome is in the returned audit row."""
+    started = datetime.now()
+    t0 = time.perf_counter()
+    audit = {
+        "dataset_name": job["dataset"],
+        "source_table": job["source"],
+        "target_table": job["target"],
+        "mode": mode,
+        "started_at": started.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    attempt_runtime = None
+    for attempt in range(1, max_retries + 2):
+        audit["attempts"] = attempt
+        attempt_t0 = time.perf_counter()
+        try:
+            if mode == "pushdown":
+                result = run_pushdown(session, job["dataset"], job["source"], job["target"], salt,
+                                      register_udf=False)
+            else:
+                result = run_streamed(session, job["dataset"], job["source"], job["target"], salt,
+                                      max_in_flight=max_in_flight)
+            attempt_runtime = time.perf_counter() - attempt_t0
+            audit["status"] = "SUCCESS"
+            audit["rows_processed"] = int(result["rows"])
+            audit["error_message"] = None
+            break
+        except Exception as e:
+            audit["status"] = "FAILED"
+            audit["error_message"] = str(e)[:4000]
+            print(f"{job['dataset']}: attempt {attempt} failed: {e}")
+            if attempt <= max_retries:
+                time.sleep(retry_delay_sec * attempt)
+
+    audit["runtime_sec"] = round(time.perf_counter() - t0, 3)
+    # throughput of the successful attempt only, excluding failed attempts and retry backoff
+    rows = audit.get("rows_processed") or 0
+    audit["rows_per_sec"] = round(rows / attempt_runtime, 1) if attempt_runtime else None
+    audit["finished_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return audit
+
+def run_all_datasets(session, salt: str, target_schema: str, mode: str = "pushdown",
+                     max_concurrency: int = 8, max_retries: int = 2, retry_delay_sec: float = 30,
+                     max_in_flight: int = 4, datasets=None, audit_table: str = AUDIT_TABLE) -> list:
+    """
+    Obfuscate every enabled dataset concurrently.
+    Each dataset lands in <target_schema>.<DATASET_NAME>; one audit row per dataset
+    is written to audit_table with runtime, rows processed and throughput.
+    :param datasets: list - optional subset of dataset names
+    :return: list - audit rows
+    """
+    jobs = load_datasets(session)
+    if datasets:
+        wanted = {d.strip().upper() for d in datasets}
+        jobs = [j for j in jobs if j["dataset"].upper() in wanted]
+    for j in jobs:
+        j["target"] = f"{target_schema}.{j['dataset']}"
+
+    ensure_audit_table(session, audit_table)
+    if mode == "pushdown" and any(j["scramble"] for j in jobs):
+        # register once up front, and only if a selected dataset scrambles;
+        # concurrent CREATE OR REPLACE FUNCTION calls would race
+        register_scramble_udf(session, salt)
+
+    run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+    print(f"Run {run_id}: {len(jobs)} datasets, max_concurrency={max_concurrency}, mode={mode}")
+
+    audits = []
+    with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+        futures = {
+            pool.submit(run_dataset_job, session, j, salt, mode, max_retries,
+                        retry_delay_sec, max_in_flight): j
+            for j in jobs
+        }
+        for future in as_completed(futures):
+            audit = future.result()
+            audit["run_id"] = run_id
+            write_audit(session, audit, audit_table)
+            audits.append(audit)
+            print(f"{audit['dataset_name']}: {audit['status']} | rows={audit.get('rows_processed')} "
+                  f"| {audit['runtime_sec']}s | {audit['rows_per_sec']} rows/s")
+
+    failed = [a["dataset_name"] for a in audits if a["status"] != "SUCCESS"]
+    print(f"Run {run_id} finished: {len(audits) - len(failed)} succeeded, {len(failed)} failed")
+    return audits
+
+# ---------- 8) INCREMENTAL (WATERMARK / STREAM) ----------
+# watermark: rows with watermark_column in (last high-watermark, current max] are
+#            obfuscated and MERGEd on key_columns.
+# stream:    a Snowflake stream on the source supplies inserts/updates/deletes; the
+#            MERGE consumes it, which advances the offset.
+# Either way a full CTAS refresh runs when the target is missing or the last one
+# is older than full_refresh_days. Key columns should be KEEP (or deterministic).
+def table_exists(session, name: str) -> bool:
+    try:
+        session.sql(f"describe table {name}").collect()
+        return True
+    except Exception:
+        return False
+
+def stream_exists(session, name: str) -> bool:
+    try:
+        session.sql(f"describe stream {name}").collect()
+        return True
+    except Exception:
+        return False
+
+def ensure_watermark_table(session, watermark_table: str = WATERMARK_TABLE):
+    session.sql(f"""
+        create table if not exists {watermark_table} (
+          dataset_name         string,
+          incremental_mode     string,
+          watermark_column     string,
+          high_watermark       string,
+          last_full_refresh_at timestamp_ntz,
+          updated_at           timestamp_ntz
+        )""").collect()
+
+def column_type(session, table: str, column: str) -> str:
+    """Declared SQL type of column in table, as reported by describe table."""
+    wanted = quote_ident(column)
+    for r in session.sql(f"describe table {table}").collect():
+        if quote_ident(r["name"]) == wanted:
+            return r["type"]
+    raise ValueError(f"column {column} not found in {table}")
+
+def get_watermark(session, dataset: str, watermark_table: str = WATERMARK_TABLE):
+    """
+    Stored high-watermark, hours since the last full refresh (aged in SQL, not client time),
+    and the incremental_mode / watermark_column the stored state was taken with.
+    """
+    rows = session.sql(
+        f"select HIGH_WATERMARK, INCREMENTAL_MODE, WATERMARK_COLUMN, "
+        f"datediff('hour', LAST_FULL_REFRESH_AT, current_timestamp()::timestamp_ntz) as FULL_REFRESH_AGE_HOURS "
+        f"from {watermark_table} where dataset_name = {sql_literal(dataset)}"
+    ).collect()
+    if not rows:
+        return None, None, None, None
+    r = rows[0]
+    return r["HIGH_WATERMARK"], r["FULL_REFRESH_AGE_HOURS"], r["INCREMENTAL_MODE"], r["WATERMARK_COLUMN"]
+
+def set_watermark(session, dataset: str, mode: str, watermark_column: Optional[str],
+                  high_watermark, full_refresh: bool, watermark_table: str = WATERMARK_TABLE):
+    hw = "NULL" if high_watermark is None else sql_literal(high_watermark)
+    wc = "NULL" if not watermark_column else sql_literal(watermark_column)
+    refreshed = "current_timestamp()::timestamp_ntz" if full_refresh else "t.last_full_refresh_at"
+    session.sql(f"""
+        merge into {watermark_table} t
+        using (select {sql_literal(dataset)} as dataset_name) s
+        on t.dataset_name = s.dataset_name
+        when matched then update set
+          incremental_mode = {sql_literal(mode)}, watermark_column = {wc},
+          high_watermark = {hw}, last_full_refresh_at = {refreshed},
+          updated_at = current_timestamp()::timestamp_ntz
+        when not matched then insert
+          (dataset_name, incremental_mode, watermark_column, high_watermark,
+           last_full_refresh_at, updated_at)
+        values
+          (s.dataset_name, {sql_literal(mode)}, {wc}, {hw},
+           current_timestamp()::timestamp_ntz, current_timestamp()::timestamp_ntz)
+        """).collect()
+
+def build_merge_sql(target: str, source_select: str, columns, key_columns,
+                    with_deletes: bool = False) -> str:
+    """MERGE the obfuscated rows of source_select into target on key_columns."""
+    cols = [quote_ident(c) for c in columns]
+    keys = [quote_ident(k) for k in key_columns]
+    on = " AND ".join(f"t.{k} = s.{k}" for k in keys)
+    updates = ", ".join(f"t.{c} = s.{c}" for c in cols if c not in keys)
+    stmt = f"MERGE INTO {target} t\nUSING (\n{source_select}\n) s\nON {on}\n"
+    if with_deletes:
+        stmt += "WHEN MATCHED AND s.OBF_ACTION_ = 'DELETE' THEN DELETE\n"
+        stmt += f"WHEN MATCHED AND s.OBF_ACTION_ = 'INSERT' THEN UPDATE SET {updates}\n"
+        stmt += "WHEN NOT MATCHED AND s.OBF_ACTION_ = 'INSERT' THEN "
+    else:
+        stmt += f"WHEN MATCHED THEN UPDATE SET {updates}\n"
+        stmt += "WHEN NOT MATCHED THEN "
+    stmt += f"INSERT ({', '.join(cols)}) VALUES ({', '.join('s.' + c for c in cols)})"
+    return stmt
+
+def run_incremental(session, dataset: str, source: str, target: str, salt: str, key_columns,
+                    incremental_mode: str = "watermark", watermark_column: Optional[str] = None,
+                    full_refresh_days: int = 7, force_full_refresh: bool = False,
+                    udf_name: str = SCRAMBLE_UDF, register_udf: bool = True,
+                    watermark_table: str = WATERMARK_TABLE) -> dict:
+    """
+    Obfuscate only rows that changed since the last run and MERGE them into TARGET.
+    :param key_columns: list - business key used to MERGE (matched on the obfuscated value)
+    :param incremental_mode: str - 'watermark' (needs watermark_column) or 'stream'
+    :param full_refresh_days: int - force a full CTAS refresh after this many days (0 = never)
+    :return: dict - rows merged and whether a full refresh ran
+    """
+    if incremental_mode == "watermark" and not watermark_column:
+        raise ValueError("watermark_column is required when incremental_mode is 'watermark'")
+    if not key_columns:
+        raise ValueError("key_columns is required for incremental obfuscation")
+
+    ensure_watermark_table(session, watermark_table)
+    old_hw, full_refresh_age_hours, old_mode, old_column = get_watermark(session, dataset, watermark_table)
+    stream_name = f"{target}_OBF_STREAM"
+
+    full_refresh = force_full_refresh or not table_exists(session, target) or full_refresh_age_hours is None
+    if not full_refresh and full_refresh_days:
+        full_refresh = full_refresh_age_hours >= full_refresh_days * 24
+    # the stored state only describes changes for the mode (and column) it was taken with:
+    # a stream-mode run has no offset to read from after a watermark run, and an old
+    # high-watermark says nothing about a different column
+    if old_mode is not None and old_mode != incremental_mode:
+        print(f"{dataset}: incremental_mode changed from {old_mode} to {incremental_mode}")
+        full_refresh = True
+    if incremental_mode == "watermark" and (
+            old_hw is None or quote_ident(old_column or "") != quote_ident(watermark_column)):
+        full_refresh = True
+    if incremental_mode == "stream" and not full_refresh and not stream_exists(session, stream_name):
+        full_refresh = True
+
+    # capture the new high-watermark before reading so rows landing mid-run are
+    # picked up (and MERGEd idempotently) by the next run
+    new_hw = None
+    if incremental_mode == "watermark":
+        new_hw = session.sql(
+            f"select max({quote_ident(watermark_column)})::string as HW from {source}"
+        ).collect()[0]["HW"]
+
+    if full_refresh:
+        print(f"{dataset}: full refresh of {target}")
+        if incremental_mode == "stream":
+            # new offset first, so changes made during the CTAS are replayed next run
+            session.sql(f"create or replace stream {stream_name} on table {source}").collect()
+        result = run_pushdown(session, dataset, source, target, salt, udf_name, register_udf)
+        set_watermark(session, dataset, incremental_mode, watermark_column, new_hw, True, watermark_table)
+        result.update({"mode": "full_refresh", "high_watermark": new_hw})
+        return result
+
+    cfg_rows = load_cfg_rows(session, dataset, with_data_type=True)
+    if register_udf and any(r["OBF_RULE"] == "SCRAMBLE_WORDS" for r in cfg_rows):
+        register_scramble_udf(session, salt, udf_name)
+    columns = session.table(source).columns
+    select_list = build_select_list(columns, cfg_rows, udf_name)
+
+    if incremental_mode == "stream":
+        source_select = (
+            "SELECT\n    " + ",\n    ".join(select_list) + ",\n    METADATA$ACTION AS OBF_ACTION_"
+            + f"\nFROM {stream_name}"
+            + "\nWHERE METADATA$ACTION = 'INSERT' OR NOT METADATA$ISUPDATE"
+        )
+        stmt = build_merge_sql(target, source_select, columns, key_columns, with_deletes=True)
+    else:
+        if new_hw is None:
+            print(f"{dataset}: source is empty, nothing to merge")
+            return {"dataset": dataset, "rows": 0, "mode": "incremental", "high_watermark": old_hw}
+        wc = quote_ident(watermark_column)
+        # watermarks are stored as strings; cast back so the predicate compares in the column's type
+        wc_type = column_type(session, source, watermark_column)
+        source_select = (
+            "SELECT\n    " + ",\n    ".join(select_list)
+            + f"\nFROM {source}"
+            + f"\nWHERE {wc} > CAST({sql_literal(old_hw)} AS {wc_type})"
+            + f" AND {wc} <= CAST({sql_literal(new_hw)} AS {wc_type})"
+        )
+        stmt = build_merge_sql(target, source_select, columns, key_columns)
+
+    print(stmt)
+    res = session.sql(stmt).collect()
+    rows = sum(int(v or 0) for v in res[0]) if res else 0
+    set_watermark(session, dataset, incremental_mode, watermark_column,
+                  new_hw if incremental_mode == "watermark" else old_hw, False, watermark_table)
+    print(f"{dataset}: merged {rows} changed rows into {target}")
+    return {"dataset": dataset, "rows": rows, "mode": "incremental", "high_watermark": new_hw}
@@ -0,0 +1,36 @@
+import sys
+from snowflake.snowpark import Session
+from function import *
+
+
+def main(session: Session, salt: str, target_schema: str, mode: str = "pushdown",
+         max_concurrency: int = 8, max_retries: int = 2, datasets: str = "") -> str:
+    audits = run_all_datasets(
+        session,
+        salt=salt,
+        target_schema=target_schema,
+        mode=mode,
+        max_concurrency=max_concurrency,
+        max_retries=max_retries,
+        datasets=[d for d in datasets.split(",") if d.strip()],
+    )
+    failed = [a["dataset_name"] for a in audits if a["status"] != "SUCCESS"]
+    if failed:
+        raise Exception(f"Obfuscation failed for datasets: {', '.join(failed)}")
+    return json.dumps({"datasets": len(audits), "failed": 0})
+
+
+if __name__ == "__main__":
+    param_file = sys.argv[1] if len(sys.argv) > 1 else "parameters_snowpark.param"
+    params = load_params(param_file)
+
+    session = Session.builder.getOrCreate()
+    print(main(
+        session,
+        salt=params["salt"],
+        target_schema=params["target_schema"],
+        mode=params.get("mode", "pushdown"),
+        max_concurrency=int(params.get("max_concurrency", 8)),
+        max_retries=int(params.get("max_retries", 2)),
+        datasets=params.get("datasets", ""),
+    ))
@@ -0,0 +1,55 @@
+import os
+import sys
+from snowflake.snowpark import Session
+from function import *
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from token_vault import DEFAULT_MAX_PENDING, TokenVault
+
+
+def main(session: Session, dataset: str, source: str, target: str, salt: str,
+         max_in_flight: int = 4, mode: str = "pushdown", key_columns: str = "",
+         incremental_mode: str = "watermark", watermark_column: str = "",
+         full_refresh_days: int = 7, vault_path: str = "",
+         vault_max_pending: int = DEFAULT_MAX_PENDING) -> str:
+    if mode == "pushdown":
+        result = run_pushdown(session, dataset, source, target, salt)
+    elif mode == "incremental":
+        result = run_incremental(
+            session, dataset, source, target, salt,
+            key_columns=[k.strip() for k in key_columns.split(",") if k.strip()],
+            incremental_mode=incremental_mode,
+            watermark_column=watermark_column or None,
+            full_refresh_days=full_refresh_days,
+        )
+    else:
+        vault = TokenVault(vault_path, hash_key=salt, max_pending=vault_max_pending) if vault_path else None
+        try:
+            result = run_streamed(session, dataset, source, target, salt,
+                                  max_in_flight=max_in_flight, vault=vault)
+        finally:
+            if vault is not None:
+                vault.close()
+    return json.dumps(result, default=str)
+
+
+if __name__ == "__main__":
+    param_file = sys.argv[1] if len(sys.argv) > 1 else "parameters_snowpark.param"
+    params = load_params(param_file)
+
+    session = Session.builder.getOrCreate()
+    print(main(
+        session,
+        dataset=params["dataset"],
+        source=params["source"],
+        target=params["target"],
+        salt=params["salt"],
+        max_in_flight=int(params.get("max_in_flight", 4)),
+        mode=params.get("mode", "pushdown"),
+        key_columns=params.get("key_columns", ""),
+        incremental_mode=params.get("incremental_mode", "watermark"),
+        watermark_column=params.get("watermark_column", ""),
+        full_refresh_days=int(params.get("full_refresh_days", 7)),
+        vault_path=params.get("vault_path", ""),
+        vault_max_pending=int(params.get("vault_max_pending", DEFAULT_MAX_PENDING)),
+    ))
@@ -0,0 +1,329 @@
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import function
+from function import (apply_compiled_rules, build_pushdown_sql, build_select_list, compile_rules, quote_ident,
+                      rule_to_sql, run_incremental, run_streamed, scramble_words)
+
+CFG_ROWS = [
+    {"COLUMN_NAME": "NAME", "OBF_RULE": "SCRAMBLE_WORDS", "OBF_PARAMS": None, "SCOPE_KEY": None},
+    {"COLUMN_NAME": "PHONE", "OBF_RULE": "MASK_LASTN", "OBF_PARAMS": '{"n": 2}', "SCOPE_KEY": None},
+    {"COLUMN_NAME": "EMAIL", "OBF_RULE": "NULLIFY", "OBF_PARAMS": None, "SCOPE_KEY": None},
+    {"COLUMN_NAME": "ID", "OBF_RULE": "KEEP", "OBF_PARAMS": None, "SCOPE_KEY": None},
+]
+
+
+class FakeQuery:
+    def __init__(self, rows=None, batches=None):
+        self.rows = rows or []
+        self.batches = batches
+
+    def filter(self, *args):
+        return self
+
+    def select(self, *args):
+        return self
+
+    @property
+    def columns(self):
+        return ["ID", "NAME", "PHONE", "EMAIL", "UPDATED_AT"]
+
+    def collect(self):
+        return self.rows
+
+    def to_pandas_batches(self):
+        return self.batches()
+
+
+class FakeSession:
+    """Stands in for a Snowpark session: yields pandas batches and records write_pandas calls."""
+
+    def __init__(self, n_batches, rows_per_batch=3, write_delay=0.0):
+        self.n_batches = n_batches
+        self.rows_per_batch = rows_per_batch
+        self.write_delay = write_delay
+        self.written = []
+        self.sql_text = []
+        self.yielded = 0
+        self.max_pending = 0
+        self._lock = threading.Lock()
+
+    def _batches(self):
+        for b in range(self.n_batches):
+            with self._lock:
+                self.max_pending = max(self.max_pending, self.yielded - len(self.written))
+                self.yielded += 1
+            ids = [b * self.rows_per_batch + i for i in range(self.rows_per_batch)]
+            yield pd.DataFrame({
+                "ID": ids,
+                "NAME": [f"Alice Walker {i}" for i in ids],
+                "PHONE": [f"55512{i:02d}" for i in ids],
+                "EMAIL": [f"u{i}@x.com" for i in ids],
+            })
+
+    def table(self, name):
+        return FakeQuery(rows=CFG_ROWS, batches=self._batches)
+
+    def sql(self, text):
+        self.sql_text.append(text)
+        return FakeQuery()
+
+    def write_pandas(self, pdf, table, database=None, schema=None, auto_create_table=False, overwrite=False):
+        time.sleep(self.write_delay)
+        with self._lock:
+            self.written.append((database, schema, table, pdf.copy()))
+
+
+def test_apply_compiled_rules_obfuscates_batch_in_place():
+    pdf = pd.DataFrame({
+        "ID": [1, 2],
+        "NAME": ["Alice Walker", None],
+        "PHONE": ["5551234", "12"],
+        "EMAIL": ["a@x.com", "b@x.com"],
+    })
+    out = apply_compiled_rules(pdf, compile_rules(CFG_ROWS, "salt"))
+
+    assert out is pdf
+    assert list(pdf["ID"]) == [1, 2]
+    assert pdf["NAME"][0] == scramble_words("Alice Walker", "NAME", "salt")
+    assert pd.isna(pdf["NAME"][1])
+    assert list(pdf["PHONE"]) == ["XXXXX34", "12"]
+    assert pdf["EMAIL"].isna().all()
+
+
+def test_run_streamed_writes_every_batch_with_bounded_backpressure():
+    session = FakeSession(n_batches=12, write_delay=0.01)
+    result = run_streamed(session, "DS", "DB.SRC.T", "DB.TGT.T_OBF", "salt", max_in_flight=3)
+
+    assert result == {"dataset": "DS", "batches": 12, "rows": 36}
+    assert session.sql_text == ["create or replace table DB.TGT.T_OBF like DB.SRC.T"]
+    assert {(db, schema, table) for db, schema, table, _ in session.written} == {("DB", "TGT", "T_OBF")}
+    assert sorted(i for *_, pdf in session.written for i in pdf["ID"]) == list(range(36))
+    assert all(pdf["EMAIL"].isna().all() for *_, pdf in session.written)
+    # a new batch is only pulled once fewer than max_in_flight writes are outstanding
+    assert session.max_pending <= 3
+
+
+class IncrementalSession:
+    """Answers the statements run_incremental issues and records the SQL text."""
+
+    def __init__(self, age_hours, stored_mode="watermark", stored_column="UPDATED_AT", has_stream=False):
+        self.age_hours = age_hours
+        self.stored_mode = stored_mode
+        self.stored_column = stored_column
+        self.has_stream = has_stream
+        self.sql_text = []
+
+    def table(self, name):
+        return FakeQuery(rows=CFG_ROWS)
+
+    def sql(self, text):
+        self.sql_text.append(text)
+        if "FULL_REFRESH_AGE_HOURS" in text:
+            return FakeQuery([{"HIGH_WATERMARK": "2024-01-01 00:00:00.000", "FULL_REFRESH_AGE_HOURS": self.age_hours,
+                               "INCREMENTAL_MODE": self.stored_mode, "WATERMARK_COLUMN": self.stored_column}])
+        if text.startswith("describe stream") and not self.has_stream:
+            raise RuntimeError("stream does not exist")
+        if text.startswith("describe table"):
+            return FakeQuery([{"name": "ID", "type": "NUMBER(38,0)"},
+                              {"name": "UPDATED_AT", "type": "TIMESTAMP_NTZ(9)"}])
+        if " as HW " in text:
+            return FakeQuery([{"HW": "2024-01-02 00:00:00.000"}])
+        if text.startswith("MERGE"):
+            return FakeQuery([(4, 1)])
+        if text.startswith("select count(*)"):
+            return FakeQuery([{"N": 7}])
+        return FakeQuery()
+
+
+def test_run_incremental_merges_with_typed_watermark_bounds():
+    session = IncrementalSession(age_hours=24 * 7 - 1)
+    result = run_incremental(session, "DS", "DB.SRC.T", "DB.TGT.T_OBF", "salt", ["ID"],
+                             watermark_column="updated_at", register_udf=False)
+
+    assert result == {"dataset": "DS", "rows": 5, "mode": "incremental", "high_watermark": "2024-01-02 00:00:00.000"}
+    merge = next(t for t in session.sql_text if t.startswith("MERGE"))
+    assert ("WHERE \"UPDATED_AT\" > CAST('2024-01-01 00:00:00.000' AS TIMESTAMP_NTZ(9))"
+            " AND \"UPDATED_AT\" <= CAST('2024-01-02 00:00:00.000' AS TIMESTAMP_NTZ(9))") in merge
+
+
+def test_run_incremental_full_refresh_age_is_computed_in_sql():
+    session = IncrementalSession(age_hours=24 * 7)
+    result = run_incremental(session, "DS", "DB.SRC.T", "DB.TGT.T_OBF", "salt", ["ID"],
+                             watermark_column="updated_at", register_udf=False)
+
+    assert (result["mode"], result["rows"]) == ("full_refresh", 7)
+    assert any("datediff('hour', LAST_FULL_REFRESH_AT" in t for t in session.sql_text)
+
+
+def test_run_incremental_switching_modes_forces_a_full_refresh():
+    session = IncrementalSession(age_hours=1, stored_mode="watermark")
+    result = run_incremental(session, "DS", "DB.SRC.T", "DB.TGT.T_OBF", "salt", ["ID"],
+                             incremental_mode="stream", register_udf=False)
+
+    assert result["mode"] == "full_refresh"
+    assert "create or replace stream DB.TGT.T_OBF_OBF_STREAM on table DB.SRC.T" in session.sql_text
+    assert not any(t.startswith("MERGE") for t in session.sql_text)
+
+    session = IncrementalSession(age_hours=1, stored_column="CREATED_AT")
+    result = run_incremental(session, "DS", "DB.SRC.T", "DB.TGT.T_OBF", "salt", ["ID"],
+                             watermark_column="updated_at", register_udf=False)
+    assert result["mode"] == "full_refresh"
+
+
+def test_run_incremental_stream_mode_needs_the_stream():
+    session = IncrementalSession(age_hours=1, stored_mode="stream", stored_column=None)
+    result = run_incremental(session, "DS", "DB.SRC.T", "DB.TGT.T_OBF", "salt", ["ID"],
+                             incremental_mode="stream", register_udf=False)
+    assert result["mode"] == "full_refresh"
+
+    session = IncrementalSession(age_hours=1, stored_mode="stream", stored_column=None, has_stream=True)
+    result = run_incremental(session, "DS", "DB.SRC.T", "DB.TGT.T_OBF", "salt", ["ID"],
+                             incremental_mode="stream", register_udf=False)
+    assert result["mode"] == "incremental"
+    assert "FROM DB.TGT.T_OBF_OBF_STREAM" in next(t for t in session.sql_text if t.startswith("MERGE"))
+
+
+def test_run_dataset_job_rows_per_sec_excludes_failed_attempts_and_backoff(monkeypatch):
+    calls = []
+
+    def flaky_pushdown(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise RuntimeError("warehouse suspended")
+        time.sleep(0.05)
+        return {"rows": 100}
+
+    monkeypatch.setattr(function, "run_pushdown", flaky_pushdown)
+    job = {"dataset": "DS", "source": "DB.SRC.T", "target": "DB.TGT.T_OBF"}
+    audit = function.run_dataset_job(None, job, "salt", max_retries=1, retry_delay_sec=0.3)
+
+    assert (audit["status"], audit["attempts"], audit["rows_processed"]) == ("SUCCESS", 2, 100)
+    assert audit["runtime_sec"] >= 0.35
+    # 100 rows over ~0.05s of successful work, not over the ~0.35s including backoff
+    assert audit["rows_per_sec"] > 100 / 0.2
+
+
+def test_rule_to_sql_per_rule():
+    assert rule_to_sql("name", "KEEP", None, "NAME") == '"NAME"'
+    assert rule_to_sql("name", "NULLIFY", None, "NAME") == "NULL"
+    assert rule_to_sql("name", "NULLIFY", None, "NAME", "VARCHAR(20)") == "CAST(NULL AS VARCHAR(20))"
+    assert rule_to_sql("name", "MASK_FIXED", {"mask_char": "'"}, "NAME") == "REPEAT('''', LENGTH(\"NAME\"::STRING))"
+    assert rule_to_sql("phone", "MASK_LASTN", '{"n": 2}', "PHONE") == (
+        "IFF(LENGTH(\"PHONE\"::STRING) <= 2, \"PHONE\"::STRING, "
+        "REPEAT('X', LENGTH(\"PHONE\"::STRING) - 2) || RIGHT(\"PHONE\"::STRING, 2))"
+    )
+    assert rule_to_sql("phone", "MASK_FIRSTN", {"mask_char": "*"}, "PHONE") == (
+        "IFF(LENGTH(\"PHONE\"::STRING) <= 4, \"PHONE\"::STRING, "
+        "LEFT(\"PHONE\"::STRING, 4) || REPEAT('*', LENGTH(\"PHONE\"::STRING) - 4))"
+    )
+    assert rule_to_sql("name", "SCRAMBLE_WORDS", {"variant": "REVERSE"}, "o'brien\\", udf_name="U") == \
+        "U(\"NAME\"::STRING, 'o''brien\\\\', 'REVERSE')"
+    # unknown rules keep the column as-is, the same fallback compile_rule uses row-wise
+    assert rule_to_sql("name", "ENCRYPT_ME", None, "NAME") == '"NAME"'
+
+
+def test_quote_ident_and_select_list_match_columns_case_insensitively():
+    assert quote_ident("name") == '"NAME"'
+    assert quote_ident('"MixedCase"') == '"MixedCase"'
+    assert quote_ident('a"b') == '"A""B"'
+
+    cfg_rows = [{"COLUMN_NAME": "email", "OBF_RULE": "NULLIFY", "OBF_PARAMS": None, "SCOPE_KEY": None,
+                 "DATA_TYPE": "VARCHAR(50)"},
+                {"COLUMN_NAME": "NAME", "OBF_RULE": "KEEP", "OBF_PARAMS": None, "SCOPE_KEY": None}]
+    assert build_select_list(["ID", "Email", "name"], cfg_rows) == [
+        '"ID"', 'CAST(NULL AS VARCHAR(50)) AS "EMAIL"', '"NAME"'
+    ]
+    assert build_pushdown_sql("DB.SRC.T", "DB.TGT.T_OBF", ["ID", "EMAIL"], cfg_rows[:1]) == (
+        "CREATE OR REPLACE TABLE DB.TGT.T_OBF AS\nSELECT\n    \"ID\",\n"
+        "    CAST(NULL AS VARCHAR(50)) AS \"EMAIL\"\nFROM DB.SRC.T"
+    )
+
+
+def sqlite_with_snowflake_functions(salt):
+    """sqlite plus the Snowflake functions rule_to_sql emits, NULL-propagating like Snowflake."""
+    db = sqlite3.connect(":memory:")
+
+    def nullable(fn):
+        return lambda *args: None if any(a is None for a in args) else fn(*args)
+
+    db.create_function("REPEAT", 2, nullable(lambda s, n: s * max(n, 0)))
+    db.create_function("SF_LEFT", 2, nullable(lambda s, n: s[:max(n, 0)]))
+    db.create_function("SF_RIGHT", 2, nullable(lambda s, n: s[-n:] if n > 0 else ""))
+    db.create_function("IFF", 3, lambda cond, a, b: a if cond else b)
+    # same body as the vectorized UDF register_scramble_udf installs
+    db.create_function("SCRAMBLE", 3, lambda t, sk, v: scramble_words(t, sk, salt, v) if isinstance(t, str) else None)
+    return db
+
+
+def test_pushdown_select_matches_row_wise_rules():
+    cfg_rows = [
+        {"COLUMN_NAME": "NAME", "OBF_RULE": "SCRAMBLE_WORDS", "OBF_PARAMS": None, "SCOPE_KEY": None},
+        {"COLUMN_NAME": "CITY", "OBF_RULE": "SCRAMBLE_WORDS", "OBF_PARAMS": '{"variant": "ROTATE_LEFT"}',
+         "SCOPE_KEY": "ADDR"},
+        {"COLUMN_NAME": "PHONE", "OBF_RULE": "MASK_LASTN", "OBF_PARAMS": '{"n": 2}', "SCOPE_KEY": None},
+        {"COLUMN_NAME": "CARD", "OBF_RULE": "MASK_FIRSTN", "OBF_PARAMS": '{"mask_char": "#"}', "SCOPE_KEY": None},
+        {"COLUMN_NAME": "PIN", "OBF_RULE": "MASK_FIXED", "OBF_PARAMS": None, "SCOPE_KEY": None},
+        {"COLUMN_NAME": "EMAIL", "OBF_RULE": "NULLIFY", "OBF_PARAMS": None, "SCOPE_KEY": None, "DATA_TYPE": "TEXT"},
+        {"COLUMN_NAME": "NOTE", "OBF_RULE": "UNKNOWN", "OBF_PARAMS": None, "SCOPE_KEY": None},
+    ]
+    columns = ["ID", "NAME", "CITY", "PHONE", "CARD", "PIN", "EMAIL", "NOTE"]
+    rows = [
+        (1, "Alice O'Neil-Walker", "New York 10001", "5551234", "4111111111111111", "1234", "a@x.com", "n1"),
+        (2, None, None, None, None, None, None, None),
+        (3, "Bo", "LA", "12", "411", "", "b@x.com", "n3"),
+    ]
+
+    db = sqlite_with_snowflake_functions("salt")
+    db.execute(f"CREATE TABLE SRC ({', '.join(quote_ident(c) for c in columns)})")
+    db.executemany(f"INSERT INTO SRC VALUES ({', '.join('?' * len(columns))})", rows)
+    select_list = build_select_list(columns, cfg_rows, udf_name="SCRAMBLE")
+    # sqlite has no ::STRING cast (every masked column is already text) and reserves LEFT / RIGHT
+    sql = f"SELECT {', '.join(select_list)} FROM SRC ORDER BY 1"
+    sql = sql.replace("::STRING", "").replace("LEFT(", "SF_LEFT(").replace("RIGHT(", "SF_RIGHT(")
+    pushed = db.execute(sql).fetchall()
+
+    pdf = pd.DataFrame(rows, columns=columns, dtype=object)
+    apply_compiled_rules(pdf, compile_rules(cfg_rows, "salt"))
+    row_wise = [tuple(None if pd.isna(v) else v for v in row) for row in pdf.itertuples(index=False)]
+
+    assert pushed == row_wise
+    assert pushed[0][:4] != rows[0][:4] and pushed[0][3:6] == ("XXXXX34", "4111############", "XXXX")
+
+
+class SchedulerSession:
+    """Answers load_datasets and records every other statement."""
+
+    def __init__(self, datasets):
+        self.datasets = datasets
+        self.sql_text = []
+
+    def sql(self, text):
+        self.sql_text.append(text)
+        if "HAS_SCRAMBLE" in text:
+            return FakeQuery([{"DATASET_NAME": name, "SOURCE_DB": "DB", "SOURCE_SCHEMA": "SRC", "SOURCE_TABLE": name,
+                               "HAS_SCRAMBLE": scramble} for name, scramble in self.datasets])
+        return FakeQuery()
+
+
+def test_run_all_datasets_registers_scramble_udf_only_when_a_dataset_scrambles(monkeypatch):
+    registered = []
+    monkeypatch.setattr(function, "register_scramble_udf", lambda session, salt: registered.append(salt))
+    monkeypatch.setattr(function, "run_dataset_job", lambda session, job, *args: {
+        "dataset_name": job["dataset"], "status": "SUCCESS", "runtime_sec": 0, "rows_per_sec": None
+    })
+
+    session = SchedulerSession([("CUSTOMERS", True), ("ORDERS", False)])
+    function.run_all_datasets(session, "salt", "DB.TGT", datasets=["orders"])
+    function.run_all_datasets(session, "salt", "DB.TGT", mode="streamed")
+    assert registered == []
+
+    function.run_all_datasets(session, "salt", "DB.TGT")
+    assert registered == ["salt"]
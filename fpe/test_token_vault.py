@@ -0,0 +1,93 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from token_vault import TokenVault, key_fingerprint
+
+
+def test_build_binary_search_finds_every_token(tmp_path):
+    path = str(tmp_path / "v.tvlt")
+    items = [("ns", f"value {i}", f"token {i}") for i in range(500)]
+
+    vault = TokenVault.build(path, items, hash_key="k")
+
+    keys = [k for k, _ in vault.records()]
+    assert len(vault) == 500 and keys == sorted(keys)
+    assert all(vault.get("ns", f"value {i}") == f"token {i}" for i in range(500))
+    assert vault.get("ns", "value 500") is None
+    assert vault.get("other", "value 1") is None
+    vault.close()
+
+
+def test_merge_staged_tokens_win_over_the_file(tmp_path):
+    path = str(tmp_path / "v.tvlt")
+    TokenVault.build(path, [("ns", "a", "old a"), ("ns", "b", "old b")]).close()
+
+    vault = TokenVault(path)
+    vault.merge([("ns", "a", "new a"), ("ns", "c", "new c")])
+    vault.close()
+
+    reopened = TokenVault(path)
+    assert len(reopened) == 3
+    assert [reopened.get("ns", p) for p in "abc"] == ["new a", "old b", "new c"]
+    reopened.close()
+
+
+def test_flush_reopens_the_vault_another_writer_replaced(tmp_path):
+    path = str(tmp_path / "v.tvlt")
+    first = TokenVault(path, max_pending=0)
+    second = TokenVault(path, max_pending=0)
+
+    first.put("ns", "a", "A")
+    second.put("ns", "b", "B")
+    first.flush()
+    second.flush()
+
+    assert second.get("ns", "a") == "A" and second.get("ns", "b") == "B"
+    first.close()
+    second.close()
+    reopened = TokenVault(path)
+    assert len(reopened) == 2
+    reopened.close()
+
+
+def test_max_pending_merges_staged_tokens_into_the_file(tmp_path):
+    path = str(tmp_path / "v.tvlt")
+    vault = TokenVault(path, max_pending=3)
+
+    vault.put("ns", "a", "A")
+    vault.put("ns", "b", "B")
+    assert vault.pending and not os.path.exists(path)
+    vault.put("ns", "c", "C")
+
+    assert not vault.pending and len(vault) == 3
+    vault.close()
+
+    unbounded = TokenVault(path, max_pending=0)
+    for i in range(10):
+        unbounded.put("ns", str(i), str(i))
+    assert len(unbounded.pending) == 10 and len(unbounded) == 3
+    unbounded.close()
+
+
+def test_get_or_create_round_trips_across_instances(tmp_path):
+    path = str(tmp_path / "v.tvlt")
+    calls = []
+
+    def encrypt(value):
+        calls.append(value)
+        return value[::-1]
+
+    namespace = f"fpe:{key_fingerprint(b'secret')}:name"
+    with TokenVault(path, hash_key=b"secret") as vault:
+        assert [vault.get_or_create(namespace, v, encrypt) for v in ("ann", "bob", "ann")] == ["nna", "bob", "nna"]
+    assert calls == ["ann", "bob"]
+
+    with TokenVault(path, hash_key=b"secret") as vault:
+        assert vault.get_or_create(namespace, "bob", encrypt) == "bob"
+        assert vault.get_or_create(namespace, "cy", encrypt) == "yc"
+    assert calls == ["ann", "bob", "cy"]
+
+    with TokenVault(path, hash_key=b"other") as vault:
+        assert len(vault) == 3 and vault.get(namespace, "ann") is None
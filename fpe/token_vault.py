@@ -0,0 +1,254 @@
+# ===========================
+#  Tokenization vault
+# ===========================
+# Persistent plaintext-hash -> token map shared by the FPE engine (DataEncryptor)
+# and the scramble engine (scramble_words). Each distinct value is encrypted /
+# scrambled once; every later occurrence, in any process, is a lookup.
+#
+# File layout (little endian):
+#   header   32 bytes   magic "TVLT" | version u32 | count u64 | blob_offset u64 | reserved u64
+#   keys     count * 16 bytes, sorted   (truncated HMAC-SHA256 of namespace|plaintext)
+#   offsets  (count + 1) * u64          token i = blob[offsets[i]:offsets[i + 1]]
+#   blob     utf-8 tokens, concatenated
+#
+# The file is opened with mmap(ACCESS_READ), so every process reading the same
+# vault shares the page cache: lookups are a binary search over the mapped keys
+# with no per-process copy. Writes are bulk only (build / merge into a new file,
+# then atomic os.replace), so readers never see a half-written vault. Staged
+# tokens are merged whenever max_pending of them accumulate, so memory stays
+# bounded on large runs; merges hold an exclusive lock file and re-read the
+# current vault first, so concurrent writers add to each other's tokens
+# instead of the last os.replace winning.
+import hashlib
+import heapq
+import hmac
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Iterable, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: in-process lock only
+    fcntl = None
+
+MAGIC = b"TVLT"
+VERSION = 1
+HEADER = struct.Struct("<4sIQQQ")
+KEY_SIZE = 16
+OFFSET = struct.Struct("<Q")
+DEFAULT_MAX_PENDING = 100_000
+
+
+@contextmanager
+def _write_lock(path):
+    """Exclusive, cross-process lock for merging into the vault at path."""
+    with open(path + ".lock", "a+b") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def key_fingerprint(key) -> str:
+    """Short, non-reversible id for a secret (FPE key / salt) to use inside namespaces."""
+    if isinstance(key, str):
+        key = key.encode("utf-8")
+    return hashlib.sha256(key).hexdigest()[:12]
+
+
+class TokenVault:
+    def __init__(self, path, hash_key=b"", max_pending=DEFAULT_MAX_PENDING):
+        """
+        Open (or lazily create) a vault file
+        :param path: str - vault file path
+        :param hash_key: bytes - HMAC key for plaintext hashes, so the file cannot be
+                         reversed with a dictionary of candidate plaintexts
+        :param max_pending: int - merge staged tokens into the file once this many
+                            accumulate (0 = only on flush())
+        """
+        self.path = path
+        self.hash_key = hash_key.encode("utf-8") if isinstance(hash_key, str) else hash_key
+        self.max_pending = max_pending
+        self.pending = {}
+        self._lock = threading.RLock()
+        self._file = None
+        self._mm = None
+        self.count = 0
+        self._blob_offset = 0
+        self._open()
+
+    # ---------- hashing ----------
+    def hash_value(self, namespace: str, plaintext) -> bytes:
+        msg = f"{namespace}|{plaintext}".encode("utf-8")
+        return hmac.new(self.hash_key, msg, hashlib.sha256).digest()[:KEY_SIZE]
+
+    # ---------- reading ----------
+    def _open(self):
+        self.close()
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < HEADER.size:
+            self.count = 0
+            return
+        self._file = open(self.path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, blob_offset, _ = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"Not a token vault file: {self.path}")
+        self.count = count
+        self._blob_offset = blob_offset
+
+    def close(self):
+        with self._lock:
+            if self._mm is not None:
+                self._mm.close()
+                self._mm = None
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def _key_at(self, i: int) -> bytes:
+        pos = HEADER.size + i * KEY_SIZE
+        return self._mm[pos:pos + KEY_SIZE]
+
+    def _token_at(self, i: int) -> str:
+        base = HEADER.size + self.count * KEY_SIZE
+        start = OFFSET.unpack_from(self._mm, base + i * OFFSET.size)[0]
+        end = OFFSET.unpack_from(self._mm, base + (i + 1) * OFFSET.size)[0]
+        return self._mm[self._blob_offset + start:self._blob_offset + end].decode("utf-8")
+
+    def _find(self, h: bytes) -> Optional[str]:
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            k = self._key_at(mid)
+            if k < h:
+                lo = mid + 1
+            elif k > h:
+                hi = mid
+            else:
+                return self._token_at(mid)
+        return None
+
+    def get(self, namespace: str, plaintext) -> Optional[str]:
+        h = self.hash_value(namespace, plaintext)
+        with self._lock:
+            if h in self.pending:
+                return self.pending[h]
+            if self._mm is None:
+                return None
+            return self._find(h)
+
+    def put(self, namespace: str, plaintext, token: str):
+        """Stage a token; it is written to disk on the next flush() or once max_pending are staged."""
+        h = self.hash_value(namespace, plaintext)
+        with self._lock:
+            self.pending[h] = token
+            if self.max_pending and len(self.pending) >= self.max_pending:
+                self.flush()
+
+    def get_or_create(self, namespace: str, plaintext, fn):
+        token = self.get(namespace, plaintext)
+        if token is None:
+            token = fn(plaintext)
+            if token is not None:
+                self.put(namespace, plaintext, str(token))
+        return token
+
+    def records(self) -> Iterable[Tuple[bytes, str]]:
+        for i in range(self.count):
+            yield self._key_at(i), self._token_at(i)
+
+    # ---------- writing ----------
+    def flush(self):
+        """Merge staged tokens into the vault file (bulk, atomic replace)."""
+        with self._lock:
+            if not self.pending:
+                return
+            with _write_lock(self.path):
+                # pick up tokens other writers merged since this vault was opened
+                self._open()
+                new = sorted(self.pending.items())
+                self.pending = {}
+                merged = heapq.merge(new, self.records(), key=lambda kv: kv[0])
+                write_vault(self.path, merged)
+                self._open()
+
+    @classmethod
+    def build(cls, path, items, hash_key=b""):
+        """
+        Bulk build a vault from (namespace, plaintext, token) tuples, replacing any existing file
+        :return: TokenVault - opened vault
+        """
+        vault = cls.__new__(cls)
+        vault.path = path
+        vault.hash_key = hash_key.encode("utf-8") if isinstance(hash_key, str) else hash_key
+        hashed = sorted((vault.hash_value(ns, p), str(t)) for ns, p, t in items)
+        with _write_lock(path):
+            write_vault(path, hashed)
+        return cls(path, hash_key)
+
+    def merge(self, items):
+        """Bulk merge (namespace, plaintext, token) tuples; new tokens win on conflicts."""
+        for ns, p, t in items:
+            self.put(ns, p, t)
+        self.flush()
+
+
+def write_vault(path, sorted_records):
+    """
+    Write sorted (key, token) records to path. When a key repeats, the first one wins
+    (flush() puts the staged records first). Keys, offsets and blob are spooled to
+    separate temp files so memory stays flat for large vaults.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    count = 0
+    blob_len = 0
+    last_key = None
+    with tempfile.TemporaryFile(dir=directory) as keys_f, \
+         tempfile.TemporaryFile(dir=directory) as offs_f, \
+         tempfile.TemporaryFile(dir=directory) as blob_f:
+        offs_f.write(OFFSET.pack(0))
+        for k, token in sorted_records:
+            k = bytes(k)
+            if k == last_key:
+                continue
+            last_key = k
+            data = token.encode("utf-8")
+            keys_f.write(k)
+            blob_f.write(data)
+            blob_len += len(data)
+            offs_f.write(OFFSET.pack(blob_len))
+            count += 1
+
+        blob_offset = HEADER.size + count * KEY_SIZE + (count + 1) * OFFSET.size
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tvlt.tmp")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                out.write(HEADER.pack(MAGIC, VERSION, count, blob_offset, 0))
+                for f in (keys_f, offs_f, blob_f):
+                    f.seek(0)
+                    shutil.copyfileobj(f, out, 1024 * 1024)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    return count
@@ -0,0 +1,184 @@
+"""
+Threaded vs async S3 engine benchmark against a local S3 stand-in.
+
+Both engines run the pipeline's own code paths over LocalObjectStore, with a
+fixed per-request delay standing in for the S3 round trip (the time the
+threaded engine spends parked on the network):
+
+  moves    head + CopyObject (pinned to the source ETag) + DeleteObject per key,
+           i.e. archive/reject moves: copy_s3_object on a thread pool vs
+           AsyncS3Engine.move_object
+  uploads  UploadPart calls from one SplitPartWriter: pool vs engine
+
+Usage:
+  python bench_s3_engines.py [--objects 200] [--parts 200] [--latency-ms 20]
+                             [--threads 12] [--async-concurrency 256]
+
+The store's own file I/O runs inline on the engine's event loop, so keep
+--object-kb / --part-kb small enough that the simulated latency dominates.
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from unzip_common import AsyncS3Engine, SplitPartWriter, wait_for_futures
+from unzip_rom import LocalObjectStore, copy_s3_object
+
+S3_CALLS = {
+    "head_object", "get_object", "put_object", "copy_object", "delete_object",
+    "create_multipart_upload", "upload_part", "upload_part_copy",
+    "complete_multipart_upload", "abort_multipart_upload"
+}
+
+
+class LatencyStore:
+    """Blocking client: every S3 call sleeps for the simulated round trip first."""
+
+    def __init__(self, store, latency):
+        self.store = store
+        self.latency = latency
+
+    def __getattr__(self, name):
+        method = getattr(self.store, name)
+        if name not in S3_CALLS:
+            return method
+
+        def call(**kwargs):
+            time.sleep(self.latency)
+            return method(**kwargs)
+
+        return call
+
+
+class AsyncLatencyStore:
+    """Async client for AsyncS3Engine: the round trip is awaited, not slept."""
+
+    def __init__(self, store, latency):
+        self.store = store
+        self.latency = latency
+
+    def __getattr__(self, name):
+        method = getattr(self.store, name)
+
+        async def call(**kwargs):
+            await asyncio.sleep(self.latency)
+            return method(**kwargs)
+
+        return call
+
+
+def seed_objects(store, bucket, prefix, count, size):
+    body = os.urandom(size)
+    keys = [f"{prefix}/obj{i:05d}.bin" for i in range(count)]
+    for key in keys:
+        store.put_object(Bucket=bucket, Key=key, Body=body)
+    return keys
+
+
+def bench_moves_threads(store, bucket, keys, threads, copy_part_size):
+    def move(key):
+        copy_s3_object(store, bucket, key, "DONE/" + key, copy_part_size)
+        store.delete_object(Bucket=bucket, Key=key)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        wait_for_futures([pool.submit(move, key) for key in keys])
+
+
+def bench_moves_async(engine, bucket, keys):
+    async def move_all():
+        await asyncio.gather(*(engine.move_object(bucket, key, "DONE/" + key) for key in keys))
+
+    engine.run(move_all())
+
+
+def bench_uploads(store, bucket, key, parts, part_size, pool=None, engine=None, in_flight=12):
+    writer = SplitPartWriter(store, bucket, key, pool, part_size, threading.BoundedSemaphore(in_flight), engine=engine)
+    chunk = os.urandom(part_size)
+    for _ in range(parts):
+        writer.write(chunk)
+    writer.close()
+    writer.complete()
+
+
+def run_benchmark(objects=200, object_kb=64, parts=200, part_kb=64, latency_ms=20.0, threads=12,
+                  async_concurrency=256, root=None):
+    latency = latency_ms / 1000.0
+    bucket = "bench"
+    results = []
+
+    with tempfile.TemporaryDirectory(dir=root) as workdir:
+        store = LocalObjectStore(workdir)
+        sync_client = LatencyStore(store, latency)
+        engine = AsyncS3Engine(
+            max_concurrency=async_concurrency,
+            copy_part_size=object_kb * 1024,
+            client=AsyncLatencyStore(store, latency)
+        )
+        try:
+            for name, run in (
+                ("threads", lambda keys: bench_moves_threads(sync_client, bucket, keys, threads, object_kb * 1024)),
+                ("async", lambda keys: bench_moves_async(engine, bucket, keys))
+            ):
+                keys = seed_objects(store, bucket, f"SRC-{name}", objects, object_kb * 1024)
+                started = time.perf_counter()
+                run(keys)
+                seconds = time.perf_counter() - started
+                moved = store.list_keys(bucket, f"DONE/SRC-{name}/")
+                if len(moved) != objects or store.list_keys(bucket, f"SRC-{name}/"):
+                    raise RuntimeError(f"{name} moves did not complete")
+                results.append({"workload": "moves", "engine": name, "requests": objects * 3, "seconds": seconds})
+
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                for name, kwargs in (
+                    ("threads", {"pool": pool, "in_flight": threads}),
+                    ("async", {"engine": engine, "in_flight": async_concurrency})
+                ):
+                    key = f"UP-{name}/part.bin"
+                    started = time.perf_counter()
+                    bench_uploads(sync_client, bucket, key, parts, part_kb * 1024, **kwargs)
+                    seconds = time.perf_counter() - started
+                    size = store.head_object(Bucket=bucket, Key=key)["ContentLength"]
+                    if size != parts * part_kb * 1024:
+                        raise RuntimeError(f"{name} upload is {size} bytes")
+                    results.append({"workload": "uploads", "engine": name, "requests": parts, "seconds": seconds})
+        finally:
+            engine.close()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--objects", type=int, default=200, help="keys moved per engine")
+    parser.add_argument("--object-kb", type=int, default=64)
+    parser.add_argument("--parts", type=int, default=200, help="UploadPart calls per engine")
+    parser.add_argument("--part-kb", type=int, default=64)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="simulated S3 round trip per request")
+    parser.add_argument("--threads", type=int, default=12, help="threaded engine pool size (the scripts' max_threads)")
+    parser.add_argument("--async-concurrency", type=int, default=256, help="async_max_concurrency")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = run_benchmark(
+        args.objects, args.object_kb, args.parts, args.part_kb, args.latency_ms, args.threads, args.async_concurrency
+    )
+
+    print(f"latency={args.latency_ms}ms threads={args.threads} async_concurrency={args.async_concurrency}")
+    print(f"{'workload':<10}{'engine':<10}{'requests':>10}{'seconds':>10}{'req/s':>10}")
+    for r in results:
+        print(f"{r['workload']:<10}{r['engine']:<10}{r['requests']:>10}{r['seconds']:>10.2f}{r['requests'] / r['seconds']:>10.0f}")
+    for workload in ("moves", "uploads"):
+        by_engine = {r["engine"]: r["seconds"] for r in results if r["workload"] == workload}
+        print(f"{workload}: async is {by_engine['threads'] / by_engine['async']:.1f}x the threaded engine")
+
+
+if __name__ == "__main__":
+    main()
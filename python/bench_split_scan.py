@@ -0,0 +1,82 @@
+"""
+Split boundary scan throughput: quote-aware SplitCutter vs cutting at the next
+newline (csv_quotechar ""), over in-memory blocks so no upload or disk cost is
+included. Newline-only cutting does one find() per part and is effectively
+free; the quote-aware scan touches every byte, so the figure that matters is
+its headroom over inflate of the same data, since the split loop reads from a
+decompressing stream.
+
+Usage:
+  python bench_split_scan.py [--mb 256] [--read-block-mb 16] [--split-size-mb 64]
+"""
+import os
+import sys
+import time
+import zlib
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from unzip_common import SplitCutter
+
+
+def make_data(size, quoted):
+    rng = random.Random(1)
+    rows = []
+    for i in range(50000):
+        if quoted:
+            rows.append(b'%d,"name %d","street, ""%d""\nsuite %d",%d\n' % (i, i, i, i, rng.randint(0, 10 ** 9)))
+        else:
+            rows.append(b"%d,name %d,street %d suite %d,%d\n" % (i, i, i, i, rng.randint(0, 10 ** 9)))
+    sample = b"".join(rows)
+    data = sample * (size // len(sample) + 1)
+    return data[:data.rfind(b"\n", 0, size) + 1]
+
+
+def scan(blocks, split_size, quotechar):
+    cutter = SplitCutter(split_size, quotechar)
+    parts = 0
+    started = time.perf_counter()
+    for block in blocks:
+        offset = 0
+        while offset < len(block):
+            cut = cutter.next_cut(block, offset)
+            if cut == -1:
+                break
+            parts += 1
+            offset = cut
+    return time.perf_counter() - started, parts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mb", type=int, default=256, help="data scanned per case")
+    parser.add_argument("--read-block-mb", type=int, default=16)
+    parser.add_argument("--split-size-mb", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=3, help="best of N runs")
+    args = parser.parse_args()
+
+    mb = 1024 * 1024
+    read_block = args.read_block_mb * mb
+    print(f"{'data':<8}{'quote density':>14}{'newline MB/s':>14}{'quoted MB/s':>13}{'inflate MB/s':>14}{'headroom':>10}")
+    for label, quoted in (("plain", False), ("quoted", True)):
+        data = make_data(args.mb * mb, quoted)
+        blocks = [data[i:i + read_block] for i in range(0, len(data), read_block)]
+        rates = {}
+        for quotechar in (b"", b'"'):
+            seconds = min(scan(blocks, args.split_size_mb * mb, quotechar)[0] for _ in range(args.repeat))
+            rates[quotechar] = len(data) / seconds / 1e6
+
+        compressed = zlib.compress(data[:64 * mb], 6)
+        started = time.perf_counter()
+        zlib.decompress(compressed)
+        inflate = min(64 * mb, len(data)) / (time.perf_counter() - started) / 1e6
+
+        density = data.count(b'"') / len(data)
+        naive, aware = rates[b""], rates[b'"']
+        print(f"{label:<8}{density:>14.3f}{naive:>14.0f}{aware:>13.0f}{inflate:>14.0f}{aware / inflate:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
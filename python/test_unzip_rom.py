@@ -0,0 +1,774 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import unzip_common
+import unzip_rom
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+
+
+def make_zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return buffer.getvalue()
+
+
+def s3_event(key, bucket="bkt"):
+    return json.dumps({
+        "Records": [{
+            "eventName": "ObjectCreated:Put",
+            "s3": {"bucket": {"name": bucket}, "object": {"key": key}}
+        }]
+    })
+
+
+class FakeSqs:
+    def __init__(self, bodies, stop_event):
+        self.messages = {f"r{i}": body for i, body in enumerate(bodies)}
+        self.visible = list(self.messages)
+        self.deleted = []
+        self.stop_event = stop_event
+        self._lock = threading.Lock()
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages, WaitTimeSeconds, VisibilityTimeout):
+        with self._lock:
+            batch, self.visible = self.visible[:MaxNumberOfMessages], self.visible[MaxNumberOfMessages:]
+        if not batch:
+            self.stop_event.set()
+        return {"Messages": [{"MessageId": r, "ReceiptHandle": r, "Body": self.messages[r]} for r in batch]}
+
+    def delete_message(self, QueueUrl, ReceiptHandle):
+        with self._lock:
+            self.deleted.append(ReceiptHandle)
+
+    def change_message_visibility(self, QueueUrl, ReceiptHandle, VisibilityTimeout):
+        pass
+
+
+def zip_kwargs(store, file_config):
+    return dict(
+        s3=store,
+        bucket="bkt",
+        target_folder="TGT",
+        rejected_folder="REJ",
+        archive_enabled=True,
+        archive_folder="ARCH",
+        file_config=file_config,
+        split_enabled=False,
+        has_header=True,
+        split_size=1024 * 1024,
+        read_block=1024 * 1024,
+        max_threads=2,
+        transfer_config=TransferConfig()
+    )
+
+
+def run_daemon(store, sqs, stop_event, file_config):
+    kwargs = zip_kwargs(store, file_config)
+    unzip_rom.run_unzip_daemon(
+        sqs=sqs,
+        queue_url="local",
+        s3=store,
+        bucket="bkt",
+        source_folder="SRC",
+        process_zip=lambda zip_key: unzip_rom.process_zip_or_reject(zip_key, **kwargs),
+        max_parallel_zips=2,
+        wait_time_seconds=0,
+        visibility_timeout=30,
+        stop_event=stop_event
+    )
+
+
+def test_daemon_archives_zip_and_acks_every_notification(tmp_path):
+    store = unzip_rom.LocalObjectStore(str(tmp_path))
+    store.put_object(Bucket="bkt", Key="SRC/good.zip", Body=make_zip({"a.csv": b"id\n1\n2\n"}))
+    stop_event = threading.Event()
+    sqs = FakeSqs([s3_event("SRC/good.zip"), s3_event("SRC/notes.txt"), s3_event("SRC/gone.zip")], stop_event)
+
+    run_daemon(store, sqs, stop_event, {"all_file": True})
+
+    keys = store.list_keys("bkt")
+    assert not [k for k in keys if k.startswith("SRC/")]
+    assert f"ARCH/{unzip_rom.today_folder()}/good.zip" in keys
+    assert store.get_object(Bucket="bkt", Key=f"TGT/{unzip_rom.today_folder()}/good/a.csv")["Body"].read() == b"id\n1\n2\n"
+    assert sorted(sqs.deleted) == ["r0", "r1", "r2"]
+
+
+def test_daemon_rejects_zip_that_fails_validation(tmp_path):
+    store = unzip_rom.LocalObjectStore(str(tmp_path))
+    store.put_object(Bucket="bkt", Key="SRC/bad.zip", Body=make_zip({"other.csv": b"id\n1\n"}))
+    stop_event = threading.Event()
+    sqs = FakeSqs([s3_event("SRC/bad.zip")], stop_event)
+
+    run_daemon(store, sqs, stop_event, {"all_file": False, "file_names": ["CUSTOMER.csv"]})
+
+    assert store.list_keys("bkt") == [f"REJ/{unzip_rom.today_folder()}/bad.zip"]
+    assert sqs.deleted == ["r0"]
+
+
+class FakeRangeS3:
+    def __init__(self, data, short_reads=False):
+        self.data = data
+        self.short_reads = short_reads
+        self.ranges = []
+
+    def head_object(self, Bucket, Key):
+        return {"ContentLength": len(self.data), "ETag": '"e"'}
+
+    def get_object(self, Bucket, Key, Range, IfMatch):
+        start, end = (int(x) for x in Range.replace("bytes=", "").split("-"))
+        self.ranges.append((start, end))
+        body = self.data[start:end + 1]
+        if self.short_reads:
+            body = body[:len(body) // 2]
+        return {"Body": io.BytesIO(body)}
+
+
+def test_range_reader_opens_zip_with_ranged_gets():
+    payload = make_zip({"a.csv": b"id\n" + b"".join(b"%d\n" % i for i in range(50000))})
+    s3 = FakeRangeS3(payload)
+    reader = unzip_rom.S3RangeReader(s3, "bkt", "x.zip", block_size=4096, read_ahead_blocks=4, cache_blocks=8)
+
+    with unzip_rom.open_zip(reader) as zf, zf.open("a.csv") as member:
+        assert member.read().splitlines()[-1] == b"49999"
+    assert reader.stats["bytes"] >= len(payload)
+    assert all(end - start + 1 <= 4 * 4096 for start, end in s3.ranges)
+
+
+def test_range_reader_raises_on_short_read():
+    reader = unzip_rom.S3RangeReader(FakeRangeS3(b"x" * 10000, short_reads=True), "bkt", "x.zip", block_size=4096)
+
+    try:
+        reader.read(100)
+    except IOError as e:
+        assert "Short ranged read" in str(e)
+    else:
+        raise AssertionError("short read was not detected")
+
+
+def test_stored_member_is_copied_server_side(tmp_path):
+    store = unzip_rom.LocalObjectStore(str(tmp_path))
+    data = b"id,name\n" + b"".join(b"%d,n%d\n" % (i, i) for i in range(20000))
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as zf:
+        zf.writestr("big.csv", data)
+    store.put_object(Bucket="bkt", Key="SRC/s.zip", Body=buffer.getvalue())
+
+    reader = unzip_rom.open_zip_source(store, "bkt", "SRC/s.zip")
+    member = unzip_rom.open_zip(reader).getinfo("big.csv")
+    assert unzip_rom.can_copy_stored_member(reader, member, 1)
+
+    parts = unzip_rom.copy_stored_member(store, "bkt", reader, member, "TGT/big.csv", 64 * 1024)
+    assert parts == -(-len(data) // (64 * 1024))
+    assert store.get_object(Bucket="bkt", Key="TGT/big.csv")["Body"].read() == data
+
+
+class AsyncStoreClient:
+    """Async facade over LocalObjectStore that records every call, standing in for aiobotocore."""
+
+    def __init__(self, store, fail_part=None):
+        self.store = store
+        self.fail_part = fail_part
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def __getattr__(self, name):
+        method = getattr(self.store, name)
+
+        async def call(**kwargs):
+            self.calls.append((name, kwargs))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                await asyncio.sleep(0.01)
+                if name == "upload_part_copy" and kwargs["PartNumber"] == self.fail_part:
+                    raise IOError("part copy failed")
+                return method(**kwargs)
+            finally:
+                self.in_flight -= 1
+
+        return call
+
+
+def test_async_engine_copies_parts_concurrently_pinned_to_source_etag(tmp_path):
+    store = unzip_rom.LocalObjectStore(str(tmp_path))
+    data = os.urandom(10 * 1024)
+    store.put_object(Bucket="bkt", Key="SRC/big.bin", Body=data, ContentType="application/zip", Metadata={"k": "v"})
+    etag = store.head_object(Bucket="bkt", Key="SRC/big.bin")["ETag"]
+    client = AsyncStoreClient(store)
+    engine = unzip_rom.AsyncS3Engine(max_concurrency=8, copy_part_size=1024, client=client)
+    try:
+        engine.run(engine.move_object("bkt", "SRC/big.bin", "ARCH/big.bin"))
+    finally:
+        engine.close()
+
+    part_copies = [kwargs for name, kwargs in client.calls if name == "upload_part_copy"]
+    assert len(part_copies) == 10
+    assert {kwargs["CopySourceIfMatch"] for kwargs in part_copies} == {etag}
+    assert client.max_in_flight > 1
+    assert store.get_object(Bucket="bkt", Key="ARCH/big.bin")["Body"].read() == data
+    head = store.head_object(Bucket="bkt", Key="ARCH/big.bin")
+    assert (head["ContentType"], head["Metadata"]) == ("application/zip", {"k": "v"})
+    assert store.list_keys("bkt") == ["ARCH/big.bin"]
+
+
+def test_async_engine_single_copy_and_abort_on_failed_part(tmp_path):
+    store = unzip_rom.LocalObjectStore(str(tmp_path))
+    store.put_object(Bucket="bkt", Key="SRC/small.bin", Body=b"x" * 100)
+    store.put_object(Bucket="bkt", Key="SRC/big.bin", Body=b"y" * 4096)
+    client = AsyncStoreClient(store, fail_part=3)
+    engine = unzip_rom.AsyncS3Engine(max_concurrency=8, copy_part_size=1024, client=client)
+    try:
+        engine.run(engine.copy_object("bkt", "SRC/small.bin", "TGT/small.bin"))
+        try:
+            engine.run(engine.copy_object("bkt", "SRC/big.bin", "TGT/big.bin"))
+        except IOError:
+            pass
+        else:
+            raise AssertionError("failed part copy was not raised")
+    finally:
+        engine.close()
+
+    names = [name for name, _ in client.calls]
+    assert names.count("copy_object") == 1
+    assert names.count("abort_multipart_upload") == 1
+    assert "complete_multipart_upload" not in names
+    assert [k for k in store.list_keys("bkt") if k.startswith("TGT/")] == ["TGT/small.bin"]
+
+
+def test_local_reader_unmaps_on_close_and_pool_closes_its_readers(tmp_path):
+    store = unzip_rom.LocalObjectStore(str(tmp_path))
+    store.put_object(Bucket="bkt", Key="SRC/a.zip", Body=make_zip({"a.csv": b"id\n1\n"}))
+
+    with unzip_rom.open_zip_source(store, "bkt", "SRC/a.zip") as reader:
+        pool = unzip_rom.ZipHandlePool(lambda: unzip_rom.open_zip(reader))
+        zf = pool.get()
+        clone = zf.fp
+        assert zf.read("a.csv") == b"id\n1\n"
+        pool.close()
+        assert clone.closed
+        # closing a clone leaves the shared mapping usable
+        assert not reader._shared["data"].closed
+    assert reader.closed
+    assert reader._shared["data"].closed
+
+
+def test_local_delete_prunes_empty_directories(tmp_path):
+    store = unzip_rom.LocalObjectStore(str(tmp_path))
+    store.put_object(Bucket="bkt", Key="CKPT/2024/z/a.json", Body=b"{}", ContentType="application/json")
+    store.put_object(Bucket="bkt", Key="CKPT/2024/z/b.json", Body=b"{}")
+    store.put_object(Bucket="bkt", Key="KEEP/c.csv", Body=b"x")
+
+    store.delete_objects(Bucket="bkt", Delete={"Objects": [{"Key": "CKPT/2024/z/a.json"}]})
+    assert os.path.isdir(os.path.join(str(tmp_path), "bkt", "CKPT", "2024", "z"))
+
+    store.delete_objects(Bucket="bkt", Delete={"Objects": [{"Key": "CKPT/2024/z/b.json"}]})
+    assert sorted(os.listdir(os.path.join(str(tmp_path), "bkt"))) == ["KEEP"]
+    assert os.listdir(os.path.join(store.meta_dir, "bkt")) == []
+    assert store.list_keys("bkt") == ["KEEP/c.csv"]
+
+
+def test_small_uploads_never_wait_on_the_budget_inside_the_shared_pool(tmp_path):
+    mb = 1024 * 1024
+    payload = b"x" * 100
+    store = unzip_rom.LocalObjectStore(str(tmp_path))
+    store.put_object(Bucket="bkt", Key="SRC/a.zip", Body=make_zip({
+        "big.csv": b"id,v\n" + b"".join(b"%d,%s\n" % (i, payload) for i in range(80000))
+    }))
+    store.put_object(Bucket="bkt", Key="SRC/b.zip", Body=make_zip({
+        f"s{n}.csv": b"id,v\n" + b"".join(b"%d,%s\n" % (i, payload) for i in range(20000)) for n in range(3)
+    }))
+    transfer_config = TransferConfig(multipart_threshold=5 * mb, multipart_chunksize=5 * mb)
+    # fits one 5 MB split chunk but not a chunk plus a ~2 MB small-file buffer
+    budget = unzip_rom.MemoryBudget(6 * mb)
+    pool = ThreadPoolExecutor(max_workers=1)
+    gate = threading.Event()
+    errors = []
+
+    def process(zip_key):
+        try:
+            unzip_rom.process_zip_file(
+                store, "bkt", "TGT", zip_key, {"all_file": True}, True, True, 6 * mb, mb, 1, transfer_config,
+                upload_pool=pool, memory_budget=budget, max_in_flight_chunks=2
+            )
+        except Exception as e:
+            errors.append(e)
+
+    # hold the only worker so b.zip's small files are queued before a.zip's first split chunk
+    pool.submit(gate.wait)
+    threads = [threading.Thread(target=process, args=(key,), daemon=True) for key in ("SRC/b.zip", "SRC/a.zip")]
+    try:
+        for thread in threads:
+            thread.start()
+            time.sleep(0.3)
+        gate.set()
+        for thread in threads:
+            thread.join(30)
+        assert not any(thread.is_alive() for thread in threads), "upload pool deadlocked on the memory budget"
+    finally:
+        pool.shutdown(wait=False)
+
+    assert errors == []
+    assert budget.in_use == 0
+    keys = store.list_keys("bkt")
+    assert sum(k.startswith(f"TGT/{unzip_rom.today_folder()}/b/") for k in keys) == 3
+    assert sum(k.startswith(f"TGT/{unzip_rom.today_folder()}/a/big/") for k in keys) == 2
+
+
+def test_engine_benchmark_runs_both_engines(tmp_path):
+    import bench_s3_engines
+
+    results = bench_s3_engines.run_benchmark(objects=8, object_kb=4, parts=6, part_kb=4, latency_ms=1, threads=2,
+                                             async_concurrency=8, root=str(tmp_path))
+
+    assert [(r["workload"], r["engine"]) for r in results] == [
+        ("moves", "threads"), ("moves", "async"), ("uploads", "threads"), ("uploads", "async")
+    ]
+    assert all(r["seconds"] > 0 for r in results)
+
+
+def quoted_csv(rows):
+    # every third row has a quoted field with an embedded newline and escaped "" quotes
+    lines = [b'id,comment,tail\n']
+    for i in range(rows):
+        comment = b'"line %d\nsaid ""hi"", then\nleft"' % i if i % 3 == 0 else b"plain %d" % i
+        lines.append(b"%d,%s,x%d\n" % (i, comment, i))
+    return b"".join(lines)
+
+
+def parse_csv(data):
+    return list(csv.reader(io.StringIO(data.decode(), newline="")))
+
+
+def cut_parts(data, split_size, block_size, quotechar=b'"'):
+    # feeds blocks to SplitCutter the way split_large_file does
+    cutter = unzip_rom.SplitCutter(split_size, quotechar)
+    parts, current = [], bytearray()
+    for start in range(0, len(data), block_size):
+        block = data[start:start + block_size]
+        offset = 0
+        while offset < len(block):
+            cut = cutter.next_cut(block, offset)
+            if cut == -1:
+                current += block[offset:]
+                break
+            current += block[offset:cut]
+            parts.append(bytes(current))
+            current = bytearray()
+            offset = cut
+    if current:
+        parts.append(bytes(current))
+    return parts
+
+
+def test_split_cuts_only_between_records_across_block_boundaries():
+    data = quoted_csv(200)
+    expected = parse_csv(data)
+
+    # 7-byte blocks put block edges inside quoted fields and between escaped "" pairs
+    for split_size, block_size in ((50, 7), (120, 64), (1, 3), (10 ** 6, 16)):
+        parts = cut_parts(data, split_size, block_size)
+        assert b"".join(parts) == data
+        assert [row for part in parts for row in parse_csv(part)] == expected
+        assert all(part.endswith(b"\n") for part in parts[:-1])
+        assert all(len(part) >= split_size for part in parts[:-1])
+
+
+def test_split_without_quotechar_cuts_at_the_next_newline():
+    data = b"".join(b"%d,a\n" % i for i in range(100))
+    parts = cut_parts(data, 20, 8, quotechar=b"")
+
+    assert b"".join(parts) == data
+    assert all(part.endswith(b"\n") and 20 <= len(part) < 20 + 6 for part in parts[:-1])
+    # quoted newlines are not protected when quote tracking is disabled
+    quoted = b'1,"a\nb"\n' * 10
+    assert any(part.count(b'"') % 2 for part in cut_parts(quoted, 4, 8, quotechar=b""))
+
+
+def test_read_header_spans_blocks_and_quoted_newlines():
+    data = b'id,"multi\nline ""header"""\n1,2\n3,4\n'
+    stream = io.BytesIO(data)
+
+    header, pending = unzip_rom.read_header(stream, 4)
+
+    assert header == b'id,"multi\nline ""header"""\n'
+    assert header + pending + stream.read() == data
+    assert unzip_rom.read_header(io.BytesIO(b"id,name"), 4) == (b"id,name", b"")
+
+
+def test_split_large_file_parts_end_on_record_boundaries(tmp_path):
+    store = unzip_rom.LocalObjectStore(str(tmp_path))
+    data = quoted_csv(300)
+    store.put_object(Bucket="bkt", Key="SRC/q.zip", Body=make_zip({"big.csv": data}))
+    zip_source = unzip_rom.open_zip_source(store, "bkt", "SRC/q.zip")
+
+    rows = unzip_rom.split_large_file(
+        store, "bkt", "TGT", zip_source, "q", "big.csv", True, 400, 64, 2, TransferConfig()
+    )
+
+    parts = [store.get_object(Bucket="bkt", Key=r["target_full_csv_file_name"])["Body"].read() for r in rows]
+    header, *records = parse_csv(data)
+    assert len(parts) > 5
+    assert all(parse_csv(part)[0] == header for part in parts)
+    assert [row for part in parts for row in parse_csv(part)[1:]] == records
+    assert all(part.endswith(b"\n") for part in parts)
+
+
+def test_plan_records_failed_zips_and_totals_the_rest(tmp_path):
+    store = unzip_rom.LocalObjectStore(str(tmp_path))
+    stored = io.BytesIO()
+    with zipfile.ZipFile(stored, "w", zipfile.ZIP_STORED) as zf:
+        zf.writestr("CUSTOMER.csv", b"id\n" + b"1\n" * 5000)
+    store.put_object(Bucket="bkt", Key="SRC/stored.zip", Body=stored.getvalue())
+    store.put_object(Bucket="bkt", Key="SRC/big.zip", Body=make_zip({"CUSTOMER.csv": b"id\n" + b"2\n" * 5000}))
+    store.put_object(Bucket="bkt", Key="SRC/other.zip", Body=make_zip({"ORDERS.csv": b"id\n1\n"}))
+    transfer_config = TransferConfig(multipart_chunksize=5 * 1024 * 1024)
+
+    zip_plans = [
+        unzip_rom.plan_zip(
+            store, "bkt", zip_key, {"all_file": False, "file_names": ["CUSTOMER.csv"]},
+            split_enabled=zip_key == "SRC/big.zip", split_size=4096, read_block=1024,
+            transfer_config=transfer_config, stored_copy_min_size=1, max_in_flight_chunks=2
+        )
+        for zip_key in ("SRC/stored.zip", "SRC/big.zip", "SRC/other.zip", "SRC/gone.zip")
+    ]
+
+    stored_plan, big_plan, other_plan, gone_plan = zip_plans
+    assert other_plan == {"zip_key": "SRC/other.zip", "error": "failed validation"}
+    assert gone_plan == {"zip_key": "SRC/gone.zip", "error": "failed validation"}
+    assert [m["mode"] for m in stored_plan["members"]] == ["stored_copy"]
+    assert stored_plan["upload_bytes"] == 0 and stored_plan["server_side_copy_bytes"] == 10003
+    assert [(m["mode"], m["parts"]) for m in big_plan["members"]] == [("split", 3)]
+    assert big_plan["peak_memory_bytes"] == unzip_rom.split_peak_memory(1024, 5 * 1024 * 1024, 2)
+
+    plan = unzip_rom.summarize_plan(zip_plans, max_parallel_zips=2, memory_budget=unzip_rom.MemoryBudget(1024 * 1024))
+    assert plan["totals"]["zips"] == 4 and plan["totals"]["failed"] == 2
+    assert plan["totals"]["parts"] == 4
+    assert plan["totals"]["uncompressed_bytes"] == 20006
+    assert plan["totals"]["unthrottled_peak_memory_bytes"] == big_plan["peak_memory_bytes"]
+    assert plan["totals"]["peak_memory_bytes"] == 1024 * 1024
+
+
+def count_in_chunks(data, chunk_size, **kwargs):
+    counter = unzip_rom.RecordCounter(**kwargs)
+    for start in range(0, len(data), chunk_size):
+        counter.update(data[start:start + chunk_size])
+    return counter
+
+
+def test_record_counter_carries_quotes_across_update_calls():
+    data = quoted_csv(20)
+    rows = len(parse_csv(data)) - 1
+
+    # every chunk size splits a quoted newline or an escaped "" pair somewhere
+    for chunk_size in range(1, 40):
+        counter = count_in_chunks(data, chunk_size)
+        assert counter.row_count() == rows, chunk_size
+        assert counter.summary() == {"bytes": len(data), "row_count": rows, "crc32": "%08x" % zipfile.crc32(data)}
+
+    assert count_in_chunks(data, 7, has_header=False).row_count() == rows + 1
+    # no quote tracking: every newline ends a record
+    assert count_in_chunks(data, 7, quotechar=b"").row_count() == data.count(b"\n") - 1
+
+
+def test_record_counter_counts_a_last_record_without_newline():
+    data = quoted_csv(4) + b'4,"open\nquoted",x4'
+
+    assert count_in_chunks(data, 3).row_count() == 5
+    assert count_in_chunks(data, 3, has_header=False).row_count() == 6
+    assert count_in_chunks(b"id,name", 3).row_count() == 0
+    assert count_in_chunks(b"", 3).row_count() == 0
+
+    # update() with offsets counts only the slice, as split_large_file passes it
+    counter = unzip_rom.RecordCounter()
+    counter.update(b"xxid\n1\n2", 2)
+    counter.update(b'\n"a\nb"\nyy', 0, 7)
+    assert (counter.bytes, counter.row_count()) == (13, 3)
+
+
+def decompress_output(codec, body):
+    if codec.name == "gzip":
+        return gzip.decompress(body)
+    # one zstd frame per compressed chunk; a plain decompress() stops after the first
+    reader = codec.zstandard.ZstdDecompressor().stream_reader(io.BytesIO(body), read_across_frames=True)
+    return reader.read()
+
+
+def test_compressed_multipart_output_round_trips(tmp_path):
+    store = unzip_rom.LocalObjectStore(str(tmp_path))
+    header = b"id,value\n"
+    data = b"".join(b"%d,%d\n" % (i, (i * 7919) % 1000003) for i in range(40000))
+
+    for name in ("gzip", "zstd"):
+        codec = unzip_rom.load_output_codec(name)
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            writer = unzip_rom.SplitPartWriter(
+                store, "bkt", f"TGT/part{codec.suffix}", pool, 16 * 1024, threading.BoundedSemaphore(4),
+                header=header, codec=codec
+            )
+            for start in range(0, len(data), 10000):
+                writer.write(data[start:start + 10000])
+            writer.close()
+            writer.complete()
+
+        body = store.get_object(Bucket="bkt", Key=f"TGT/part{codec.suffix}")["Body"].read()
+        assert writer.chunk_count > 3, name
+        assert (writer.raw_bytes, writer.output_bytes) == (len(header) + len(data), len(body))
+        assert decompress_output(codec, body) == header + data, name
+
+        reader = unzip_rom.upload_stream(
+            store, "bkt", f"TGT/whole{codec.suffix}", io.BytesIO(header + data), TransferConfig(), codec=codec
+        )
+        body = store.get_object(Bucket="bkt", Key=f"TGT/whole{codec.suffix}")["Body"].read()
+        assert reader.bytes == len(header) + len(data)
+        assert decompress_output(codec, body) == header + data, name
+
+
+class FailingPutStore:
+    """LocalObjectStore that fails the first put_object of one key, like a crash mid-split."""
+
+    def __init__(self, store, fail_key):
+        self.store = store
+        self.fail_key = fail_key
+
+    def put_object(self, Key, **kwargs):
+        if Key == self.fail_key:
+            self.fail_key = None
+            raise RuntimeError("interrupted")
+        return self.store.put_object(Key=Key, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+
+def test_interrupted_split_resumes_with_the_same_cuts_and_parts(tmp_path):
+    data = quoted_csv(400)
+    checkpoint_key = "CKPT/q/big.csv.json"
+
+    def split(store):
+        zip_source = unzip_rom.open_zip_source(store, "bkt", "SRC/q.zip")
+        try:
+            return unzip_rom.split_large_file(
+                store, "bkt", "TGT", zip_source, "q", "big.csv", True, 700, 64, 1, TransferConfig(),
+                count_rows=True, checkpoint_folder="CKPT"
+            )
+        finally:
+            zip_source.close()
+
+    def outputs(store, rows):
+        checkpoint = json.loads(store.get_object(Bucket="bkt", Key=checkpoint_key)["Body"].read())
+        cuts = [(p["part_number"], p["start_offset"], p["end_offset"], p["row"]) for p in checkpoint["parts"]]
+        bodies = [store.get_object(Bucket="bkt", Key=r["target_full_csv_file_name"])["Body"].read() for r in rows]
+        return cuts, bodies
+
+    stores = []
+    for name in ("straight", "resumed"):
+        store = unzip_rom.LocalObjectStore(str(tmp_path / name))
+        store.put_object(Bucket="bkt", Key="SRC/q.zip", Body=make_zip({"big.csv": data}))
+        stores.append(store)
+    straight, resumed = stores
+
+    expected = outputs(straight, split(straight))
+
+    part2 = unzip_rom.build_large_file_key("TGT", "q", "big", 2)
+    try:
+        split(FailingPutStore(resumed, part2))
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("split was not interrupted")
+    checkpoint = json.loads(resumed.get_object(Bucket="bkt", Key=checkpoint_key)["Body"].read())
+    assert [p["part_number"] for p in checkpoint["parts"]] == [1] and not checkpoint["complete"]
+
+    cuts, bodies = outputs(resumed, split(resumed))
+    assert len(cuts) > 5
+    assert cuts == expected[0]
+    assert bodies == expected[1]
+    header, *records = parse_csv(data)
+    assert all(parse_csv(body)[0] == header for body in bodies)
+    assert [row for body in bodies for row in parse_csv(body)[1:]] == records
+
+
+class RecordingStore:
+    """LocalObjectStore that records which output keys get written."""
+
+    def __init__(self, store):
+        self.store = store
+        self.written = []
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, **kwargs):
+        self.written.append(Key)
+        return self.store.upload_fileobj(Fileobj, Bucket, Key, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+
+def test_ledger_skips_unchanged_members_and_force_reprocesses(tmp_path):
+    store = RecordingStore(unzip_rom.LocalObjectStore(str(tmp_path)))
+    target = f"TGT/{unzip_rom.today_folder()}/z"
+
+    def run(members=None, force=False):
+        if members is not None:
+            store.put_object(Bucket="bkt", Key="SRC/z.zip", Body=make_zip(members))
+        store.written = []
+        unzip_rom.process_zip_file(
+            s3=store, bucket="bkt", target_folder="TGT", zip_key="SRC/z.zip", file_config={"all_file": True},
+            split_enabled=False, has_header=True, split_size=1024 * 1024, read_block=1024 * 1024, max_threads=2,
+            transfer_config=TransferConfig(), ledger_folder="LED", force=force
+        )
+        return sorted(store.written)
+
+    assert run({"a.csv": b"id\n1\n", "b.csv": b"id\n2\n"}) == [f"{target}/a.csv", f"{target}/b.csv"]
+    # same members in a rewritten ZIP: nothing to do
+    assert run({"a.csv": b"id\n1\n", "b.csv": b"id\n2\n"}) == []
+    # b.csv changed (new CRC): only it is processed again
+    assert run({"a.csv": b"id\n1\n", "b.csv": b"id\n3\n"}) == [f"{target}/b.csv"]
+    assert store.get_object(Bucket="bkt", Key=f"{target}/b.csv")["Body"].read() == b"id\n3\n"
+    # same ZIP object: the completed ledger skips it without reading members
+    assert run() == []
+    # an output removed behind the ledger's back is re-created
+    store.delete_object(Bucket="bkt", Key=f"{target}/a.csv")
+    assert run({"a.csv": b"id\n1\n", "b.csv": b"id\n3\n"}) == [f"{target}/a.csv"]
+    assert run(force=True) == [f"{target}/a.csv", f"{target}/b.csv"]
+
+    ledger = json.loads(store.get_object(Bucket="bkt", Key="LED/z.json")["Body"].read())
+    assert ledger["complete"] and sorted(ledger["members"]) == ["a.csv", "b.csv"]
+    assert ledger["members"]["b.csv"]["crc32"] == "%08x" % zipfile.crc32(b"id\n3\n")
+
+
+def test_plan_split_size_table():
+    adaptive = {"strategy": "adaptive", "min_size": 10, "max_size": 100}
+    cases = [
+        # (file_size, split_size, config, planned split size)
+        (0, 100, {}, None),
+        (99, 100, {}, None),
+        (100, 100, {}, 100),
+        (250, 100, {"strategy": "fixed", "target_parts": 8}, 100),
+        (5, 100, dict(adaptive), None),
+        (5, 100, dict(adaptive, target_parts=8), None),
+        (50, 100, dict(adaptive), None),
+        (50, 100, dict(adaptive, target_parts=0), None),
+        (50, 100, dict(adaptive, target_parts=8), 10),
+        (100, 100, dict(adaptive), None),
+        (101, 100, dict(adaptive), 51),
+        (250, 100, dict(adaptive), 84),
+        (200, 100, dict(adaptive, target_parts=8), 25),
+        (1000, 100, dict(adaptive, target_parts=8), 100),
+        (1001, 100, dict(adaptive, target_parts=1), 91),
+    ]
+    for file_size, split_size, config, expected in cases:
+        planned = unzip_common.plan_split_size(file_size, split_size, **config)
+        assert planned == expected, (file_size, split_size, config, planned)
+        if planned is not None and config.get("strategy") == "adaptive":
+            assert config["min_size"] <= planned <= config["max_size"]
+
+
+def test_plan_member_splits_keys_sizes_by_member_name():
+    members = []
+    for name, size in (("dir/small.csv", 40), ("big.csv", 250)):
+        member = zipfile.ZipInfo(name)
+        member.file_size = size
+        members.append(member)
+
+    assert unzip_rom.plan_member_splits(members, 100) == {"dir/small.csv": None, "big.csv": 100}
+    assert unzip_rom.plan_member_splits(
+        members, 100, {"strategy": "adaptive", "min_size": 10, "max_size": 100, "target_parts": 8}
+    ) == {"dir/small.csv": 10, "big.csv": 32}
+
+
+class DeleteErrorStore:
+    """LocalObjectStore whose DeleteObjects reports some keys as failed, like a partial S3 response."""
+
+    def __init__(self, store, batch_errors, stuck, copy_fails):
+        self.store = store
+        self.batch_errors = set(batch_errors)
+        self.stuck = set(stuck)
+        self.copy_fails = copy_fails
+        self.batches = []
+        self.single_deletes = []
+        self._lock = threading.Lock()
+
+    def copy_object(self, Key, **kwargs):
+        if Key.startswith(self.copy_fails):
+            raise ClientError({"Error": {"Code": "AccessDenied", "Message": "denied"}}, "CopyObject")
+        return self.store.copy_object(Key=Key, **kwargs)
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        keys = [obj["Key"] for obj in Delete["Objects"]]
+        with self._lock:
+            self.batches.append(keys)
+        failed = [key for key in keys if key in self.batch_errors | self.stuck]
+        self.store.delete_objects(Bucket=Bucket, Delete={"Objects": [{"Key": k} for k in keys if k not in failed]})
+        return {"Errors": [{"Key": key, "Code": "SlowDown", "Message": "Please reduce your request rate."} for key in failed]}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        with self._lock:
+            self.single_deletes.append(Key)
+        if Key in self.stuck:
+            raise ClientError({"Error": {"Code": "AccessDenied", "Message": "denied"}}, "DeleteObject")
+        return self.store.delete_object(Bucket=Bucket, Key=Key)
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+
+def test_archive_mover_batches_deletes_and_retries_partial_errors(tmp_path):
+    local = unzip_rom.LocalObjectStore(str(tmp_path))
+    for i in range(5):
+        local.put_object(Bucket="bkt", Key=f"SRC/z{i}.zip", Body=make_zip({"a.csv": b"id\n%d\n" % i}))
+    store = DeleteErrorStore(local, batch_errors=["SRC/z1.zip"], stuck=["SRC/z3.zip"],
+                             copy_fails=f"ARCH/{unzip_rom.today_folder()}/z4.zip")
+    metrics = unzip_rom.PipelineMetrics()
+    mover = unzip_rom.ArchiveMover(store, "bkt", 1024 * 1024, max_moves=2, delete_batch_size=2, metrics=metrics)
+
+    for i in range(5):
+        mover.submit(f"SRC/z{i}.zip", "ARCH", f"z{i}", fallback_prefix="REJ")
+    assert mover.close() is False
+
+    assert sorted(len(batch) for batch in store.batches) == [1, 2, 2]
+    assert sorted(key for batch in store.batches for key in batch) == [f"SRC/z{i}.zip" for i in range(5)]
+    assert sorted(store.single_deletes) == ["SRC/z1.zip", "SRC/z3.zip"]
+    assert mover.failed_deletes == 1
+    assert local.list_keys("bkt", "SRC/") == ["SRC/z3.zip"]
+    assert sorted(local.list_keys("bkt", "ARCH/")) == [f"ARCH/{unzip_rom.today_folder()}/z{i}.zip" for i in range(4)]
+    assert local.list_keys("bkt", "REJ/") == [f"REJ/{unzip_rom.today_folder()}/z4.zip"]
+    assert {name: entry["status"] for name, entry in metrics.zips.items()} == {
+        "z0": "archived", "z1": "archived", "z2": "archived", "z3": "archived", "z4": "rejected"
+    }
+
+
+def test_metrics_sample_counts_pending_upload_pool_tasks():
+    gate = threading.Event()
+    metrics = unzip_rom.PipelineMetrics()
+    pool = unzip_rom.TrackedThreadPool(max_workers=1)
+
+    def fail():
+        raise ValueError("boom")
+
+    futures = [pool.submit(gate.wait, 5), pool.submit(len, b"xy"), pool.submit(fail)]
+    metrics.sample(pool, unzip_rom.MemoryBudget(1024))
+    assert metrics.samples[-1]["upload_queue_depth"] == 3
+    assert metrics.samples[-1]["memory_in_use"] == 0
+
+    gate.set()
+    pool.shutdown(wait=True)
+    assert futures[1].result() == 2 and isinstance(futures[2].exception(), ValueError)
+    metrics.sample(pool)
+    assert metrics.samples[-1]["upload_queue_depth"] == 0
+    metrics.sample()
+    assert metrics.samples[-1]["upload_queue_depth"] is None
@@ -0,0 +1,1363 @@
+"""
+Pipeline pieces shared by unzip_rom.py and unzip_ram.py: ranged ZIP reads,
+memory budget, metrics, output codecs, record counting, the per-ZIP ledger,
+split checkpoints and the multipart split writer. The entry points keep only
+how they source a ZIP, lay out output keys and orchestrate a run.
+"""
+import io
+import os
+import csv
+import json
+import asyncio
+import zlib
+import time
+import struct
+import socket
+import logging
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+
+import boto3
+from botocore.exceptions import ClientError
+from boto3.s3.transfer import TransferConfig
+
+log = logging.getLogger(__name__)
+
+
+def today_folder():
+    return datetime.now().strftime("%Y%m%d")
+
+
+def normalize_prefix(value):
+    return str(value).strip().strip("/")
+
+
+def load_params_from_s3(bucket, param_key):
+    bootstrap_s3 = boto3.client("s3")
+    response = bootstrap_s3.get_object(Bucket=bucket, Key=param_key)
+    content = response["Body"].read().decode("utf-8")
+    return json.loads(content)
+
+
+def parse_bool(value, default=True):
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+
+    text = str(value).strip().lower()
+    if text in {"true", "1", "yes", "y"}:
+        return True
+    if text in {"false", "0", "no", "n"}:
+        return False
+
+    return default
+
+
+class S3RangeReader(io.RawIOBase):
+    """
+    Read-only, seekable file object over an S3 object using ranged GETs.
+    zipfile.ZipFile can open it directly: the central directory costs one or two
+    block-sized requests at the end of the object, and member data is fetched on
+    demand. Sequential reads fetch read_ahead_blocks at a time. Blocks live in a
+    small LRU cache shared by clone()s, so each thread can have its own position.
+    """
+
+    strategy = "ranged"
+
+    def __init__(
+        self,
+        s3,
+        bucket,
+        key,
+        size=None,
+        etag=None,
+        block_size=1024 * 1024,
+        read_ahead_blocks=8,
+        cache_blocks=64,
+        _shared=None
+    ):
+        super().__init__()
+        if size is None or etag is None:
+            head = s3.head_object(Bucket=bucket, Key=key)
+            size = head["ContentLength"]
+            etag = head["ETag"]
+
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.etag = etag
+        self.block_size = block_size
+        self.read_ahead_blocks = max(1, read_ahead_blocks)
+        self.cache_blocks = max(self.read_ahead_blocks, cache_blocks)
+        self._shared = _shared or {"cache": OrderedDict(), "lock": threading.Lock(), "requests": 0, "bytes": 0, "seconds": 0.0}
+        self._pos = 0
+        self._last_block = -2
+
+    def clone(self):
+        return S3RangeReader(
+            self.s3,
+            self.bucket,
+            self.key,
+            size=self.size,
+            etag=self.etag,
+            block_size=self.block_size,
+            read_ahead_blocks=self.read_ahead_blocks,
+            cache_blocks=self.cache_blocks,
+            _shared=self._shared
+        )
+
+    @property
+    def stats(self):
+        return {
+            "requests": self._shared["requests"],
+            "bytes": self._shared["bytes"],
+            "seconds": self._shared["seconds"]
+        }
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if pos < 0:
+            raise OSError("Negative seek position")
+        self._pos = pos
+        return pos
+
+    def readinto(self, buffer):
+        out = memoryview(buffer).cast("B")
+        n = min(len(out), self.size - self._pos)
+        done = 0
+        while done < n:
+            index = self._pos // self.block_size
+            block = self._get_block(index)
+            offset = self._pos - index * self.block_size
+            take = min(len(block) - offset, n - done)
+            if take <= 0:
+                raise IOError(f"No data at offset {self._pos} of s3://{self.bucket}/{self.key}")
+            out[done:done + take] = block[offset:offset + take]
+            done += take
+            self._pos += take
+        return max(done, 0)
+
+    def _fetch(self, start, end):
+        started = time.perf_counter()
+        response = self.s3.get_object(
+            Bucket=self.bucket,
+            Key=self.key,
+            Range=f"bytes={start}-{end}",
+            IfMatch=self.etag
+        )
+        data = response["Body"].read()
+        with self._shared["lock"]:
+            self._shared["requests"] += 1
+            self._shared["bytes"] += len(data)
+            self._shared["seconds"] += time.perf_counter() - started
+        return data
+
+    def _get_block(self, index):
+        cache = self._shared["cache"]
+        with self._shared["lock"]:
+            block = cache.get(index)
+            if block is not None:
+                cache.move_to_end(index)
+
+        if block is None:
+            total_blocks = (self.size + self.block_size - 1) // self.block_size
+            sequential = index in (self._last_block, self._last_block + 1)
+            count = min(self.read_ahead_blocks if sequential else 1, total_blocks - index)
+            start = index * self.block_size
+            end = min((index + count) * self.block_size, self.size) - 1
+            data = memoryview(self._fetch(start, end))
+            if len(data) != end - start + 1:
+                raise IOError(
+                    f"Short ranged read of s3://{self.bucket}/{self.key}: "
+                    f"expected {end - start + 1} bytes at {start}, got {len(data)}"
+                )
+
+            with self._shared["lock"]:
+                for i in range(count):
+                    piece = data[i * self.block_size:(i + 1) * self.block_size]
+                    cache[index + i] = piece
+                    cache.move_to_end(index + i)
+                while len(cache) > self.cache_blocks:
+                    cache.popitem(last=False)
+            block = data[:self.block_size]
+
+        self._last_block = index
+        return block
+
+
+MIN_MULTIPART_PART_SIZE = 5 * 1024 * 1024
+
+
+def is_valid_csv(member_name):
+    name = member_name.replace("\\", "/").strip("/")
+    base = os.path.basename(name)
+    return (
+        bool(name)
+        and not name.endswith("/")
+        and not name.startswith("__MACOSX/")
+        and not base.startswith("._")
+        and name.lower().endswith(".csv")
+    )
+
+
+def normalize_member_name(member_name):
+    return member_name.replace("\\", "/").strip("/")
+
+
+class ZipHandlePool:
+    def __init__(self, opener):
+        self.opener = opener
+        self._local = threading.local()
+        self._handles = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        zf = getattr(self._local, "zf", None)
+        if zf is None:
+            zf = self.opener()
+            self._local.zf = zf
+            with self._lock:
+                self._handles.append(zf)
+        return zf
+
+    def close(self):
+        with self._lock:
+            handles, self._handles = self._handles, []
+        for zf in handles:
+            reader = zf.fp
+            zf.close()
+            if reader is not None:
+                reader.close()
+
+
+class MemoryBudget:
+    def __init__(self, limit_bytes):
+        self.limit_bytes = limit_bytes
+        self.in_use = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, nbytes):
+        nbytes = min(nbytes, self.limit_bytes)
+        with self._cond:
+            while self.in_use + nbytes > self.limit_bytes:
+                self._cond.wait()
+            self.in_use += nbytes
+        return nbytes
+
+    def try_acquire(self, nbytes):
+        with self._cond:
+            if self.in_use + nbytes > self.limit_bytes:
+                return False
+            self.in_use += nbytes
+        return True
+
+    def release(self, nbytes):
+        with self._cond:
+            self.in_use -= nbytes
+            self._cond.notify_all()
+
+
+def submit_reserved(pool, memory_budget, nbytes, fn, *args):
+    # Reserve in the submitting thread and release when the task finishes. A pool
+    # worker must never wait on the budget: the tasks that would free it (split
+    # chunks from other ZIPs share the pool) could be queued behind it.
+    reserved = memory_budget.acquire(nbytes) if memory_budget is not None else 0
+
+    def release(_):
+        if memory_budget is not None:
+            memory_budget.release(reserved)
+
+    try:
+        future = pool.submit(fn, *args)
+    except Exception:
+        release(None)
+        raise
+
+    future.add_done_callback(release)
+    return future
+
+
+class StatsdClient:
+    def __init__(self, host, port=8125, prefix="unzip"):
+        self.address = (host, port)
+        self.prefix = prefix.rstrip(".")
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def _send(self, name, value, kind):
+        line = f"{self.prefix}.{name}:{value}|{kind}" if self.prefix else f"{name}:{value}|{kind}"
+        try:
+            self._sock.sendto(line.encode("utf-8"), self.address)
+        except OSError:
+            pass
+
+    def timing(self, name, seconds):
+        self._send(name, round(seconds * 1000, 3), "ms")
+
+    def count(self, name, value=1):
+        self._send(name, value, "c")
+
+    def gauge(self, name, value):
+        self._send(name, value, "g")
+
+    def close(self):
+        self._sock.close()
+
+
+def phase_totals(phases):
+    totals = {}
+    for phase, entry in phases.items():
+        totals[phase] = dict(entry)
+        totals[phase]["seconds"] = round(entry["seconds"], 6)
+        totals[phase]["mb_per_s"] = round(entry["bytes"] / 1048576 / entry["seconds"], 3) if entry["bytes"] and entry["seconds"] > 0 else None
+    return totals
+
+
+class PipelineMetrics:
+    def __init__(self, statsd=None):
+        self.statsd = statsd
+        self.started_at = datetime.now()
+        self.phases = {}
+        self.zips = {}
+        self.samples = []
+        self.s3_calls = 0
+        self.s3_retries = 0
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def _zip_entry(self, zip_name):
+        return self.zips.setdefault(zip_name, {"phases": {}, "members": {}})
+
+    def add(self, phase, seconds, nbytes=0, zip_name=None, member=None):
+        with self._lock:
+            targets = [self.phases]
+            if zip_name is not None:
+                entry = self._zip_entry(zip_name)
+                targets.append(entry["phases"])
+                if member is not None:
+                    targets.append(entry["members"].setdefault(member, {}))
+            for phases in targets:
+                totals = phases.setdefault(phase, {"count": 0, "seconds": 0.0, "bytes": 0})
+                totals["count"] += 1
+                totals["seconds"] += seconds
+                totals["bytes"] += nbytes
+
+        if self.statsd is not None:
+            self.statsd.timing(f"phase.{phase}", seconds)
+            if nbytes:
+                self.statsd.count(f"phase.{phase}.bytes", nbytes)
+
+    @contextmanager
+    def phase(self, phase, zip_name=None, member=None, nbytes=0):
+        record = {"bytes": nbytes}
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            self.add(phase, time.perf_counter() - started, record["bytes"], zip_name, member)
+
+    def annotate(self, zip_name, **info):
+        with self._lock:
+            self._zip_entry(zip_name).update(info)
+
+    def on_s3_call(self, parsed=None, **kwargs):
+        retries = (parsed or {}).get("ResponseMetadata", {}).get("RetryAttempts", 0)
+        with self._lock:
+            self.s3_calls += 1
+            self.s3_retries += retries
+        if retries and self.statsd is not None:
+            self.statsd.count("s3.retries", retries)
+
+    def sample(self, upload_pool=None, memory_budget=None):
+        sample = {
+            "elapsed_s": round(time.perf_counter() - self._started, 3),
+            # tasks submitted to the shared upload pool that have not finished yet
+            "upload_queue_depth": upload_pool.pending if upload_pool is not None else None,
+            "memory_in_use": memory_budget.in_use if memory_budget is not None else None,
+            "s3_retries": self.s3_retries
+        }
+        with self._lock:
+            self.samples.append(sample)
+
+        if self.statsd is not None:
+            for name in ("upload_queue_depth", "memory_in_use"):
+                if sample[name] is not None:
+                    self.statsd.gauge(name, sample[name])
+
+    def start_sampler(self, interval, upload_pool=None, memory_budget=None):
+        if interval <= 0:
+            return
+
+        def run():
+            while not self._stop.wait(interval):
+                self.sample(upload_pool, memory_budget)
+
+        self._sampler = threading.Thread(target=run, name="metrics-sampler", daemon=True)
+        self._sampler.start()
+
+    def stop_sampler(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+
+    def document(self):
+        with self._lock:
+            return {
+                "started_at": self.started_at.isoformat(timespec="seconds"),
+                "finished_at": datetime.now().isoformat(timespec="seconds"),
+                "phases": phase_totals(self.phases),
+                "zips": {
+                    zip_name: {
+                        **{k: v for k, v in entry.items() if k not in ("phases", "members")},
+                        "phases": phase_totals(entry["phases"]),
+                        "members": {member: phase_totals(phases) for member, phases in entry["members"].items()}
+                    }
+                    for zip_name, entry in self.zips.items()
+                },
+                "s3_calls": self.s3_calls,
+                "s3_retries": self.s3_retries,
+                "samples": list(self.samples)
+            }
+
+
+def metrics_phase(metrics, phase, zip_name=None, member=None, nbytes=0):
+    if metrics is None:
+        return nullcontext({"bytes": nbytes})
+    return metrics.phase(phase, zip_name, member, nbytes)
+
+
+def write_metrics(s3, bucket, metrics_folder, metrics):
+    key = f"{metrics_folder.rstrip('/')}/{today_folder()}/unzip_metrics_{metrics.started_at.strftime('%Y%m%d_%H%M%S')}.json"
+    s3.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=json.dumps(metrics.document(), indent=2).encode("utf-8"),
+        ContentType="application/json"
+    )
+    log.info("Wrote pipeline metrics: s3://%s/%s", bucket, key)
+    return key
+
+
+OUTPUT_COMPRESSION = ("none", "gzip", "zstd")
+
+
+class OutputCodec:
+    def __init__(self, name, level=None):
+        self.name = name
+        if name == "gzip":
+            self.level = 6 if level is None else level
+            self.suffix = ".gz"
+        elif name == "zstd":
+            try:
+                import zstandard
+            except ImportError:
+                raise ValueError("output_compression=zstd requires the zstandard package")
+            self.zstandard = zstandard
+            self.level = 3 if level is None else level
+            self.suffix = ".zst"
+        else:
+            raise ValueError(f"output_compression must be one of {', '.join(OUTPUT_COMPRESSION)}, got {name}")
+
+        self.content_encoding = name
+
+    def compressobj(self):
+        if self.name == "gzip":
+            return zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return self.zstandard.ZstdCompressor(level=self.level).compressobj()
+
+    def header(self):
+        if self.name == "gzip":
+            return b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+        return b""
+
+    def compress_chunk(self, data, final):
+        if self.name == "gzip":
+            c = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+            return c.compress(data) + c.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+        if not data:
+            return b""
+        return self.zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def trailer(self, crc32, size):
+        if self.name == "gzip":
+            return struct.pack("<II", crc32 & 0xFFFFFFFF, size & 0xFFFFFFFF)
+        return b""
+
+
+def load_output_codec(name, level=None):
+    name = str(name or "none").strip().lower()
+    if name == "none":
+        return None
+    return OutputCodec(name, level)
+
+
+def output_suffix(codec):
+    return codec.suffix if codec is not None else ""
+
+
+def output_extra_args(codec, metadata=None):
+    extra = {"ContentType": "text/csv"}
+    if codec is not None:
+        extra["ContentEncoding"] = codec.content_encoding
+    if metadata:
+        extra["Metadata"] = metadata
+    return extra
+
+
+def log_compression(key, raw_bytes, output_bytes, seconds):
+    log.info(
+        "Compressed %s | raw=%s | compressed=%s | ratio=%.2f | %.1f MB/s",
+        key,
+        raw_bytes,
+        output_bytes,
+        raw_bytes / output_bytes if output_bytes else 0.0,
+        raw_bytes / seconds / (1024 * 1024) if seconds else 0.0
+    )
+
+
+class CompressingStream(io.RawIOBase):
+    def __init__(self, raw, codec):
+        self.raw = raw
+        self.compressor = codec.compressobj()
+        self.pending = bytearray()
+        self.eof = False
+        self.raw_bytes = 0
+        self.output_bytes = 0
+        self.seconds = 0.0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def read(self, size=-1):
+        read_size = size if size and size > 0 else 1024 * 1024
+        while not self.eof and (size is None or size < 0 or len(self.pending) < size):
+            data = self.raw.read(read_size)
+            started = time.perf_counter()
+            if data:
+                self.raw_bytes += len(data)
+                self.pending += self.compressor.compress(data)
+            else:
+                self.pending += self.compressor.flush()
+                self.eof = True
+            self.seconds += time.perf_counter() - started
+
+        if size is None or size < 0:
+            size = len(self.pending)
+
+        out = bytes(self.pending[:size])
+        del self.pending[:size]
+        self.output_bytes += len(out)
+        return out
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+class RecordCounter:
+    def __init__(self, has_header=True, quotechar=b'"'):
+        self.has_header = has_header
+        self.quotechar = quotechar
+        self.bytes = 0
+        self.newlines = 0
+        self.crc32 = 0
+        self.quote_parity = 0
+        self.ends_with_newline = True
+        if quotechar:
+            self._drop = bytes(b for b in range(256) if b not in (quotechar[0], 10))
+
+    def update(self, data, start=0, end=None):
+        end = len(data) if end is None else end
+        if end <= start:
+            return
+
+        self.bytes += end - start
+        self.crc32 = zlib.crc32(memoryview(data)[start:end], self.crc32)
+
+        if self.quotechar and data.find(self.quotechar, start, end) != -1:
+            marks = data[start:end].translate(None, self._drop)
+            marks = marks.replace(self.quotechar * 2, b"")
+            segments = marks.split(self.quotechar)
+            quoted = b"".join(segments[1 - self.quote_parity::2]).count(b"\n")
+            self.newlines += marks.count(b"\n") - quoted
+            self.quote_parity ^= (len(segments) - 1) & 1
+        elif not self.quote_parity:
+            self.newlines += data.count(b"\n", start, end)
+
+        self.ends_with_newline = data[end - 1] == 10
+
+    def row_count(self):
+        records = self.newlines + (0 if self.ends_with_newline else 1)
+        if self.has_header and records:
+            records -= 1
+        return records
+
+    def summary(self):
+        return {
+            "bytes": self.bytes,
+            "row_count": self.row_count(),
+            "crc32": f"{self.crc32:08x}"
+        }
+
+
+def count_member(zf, member, counter, read_size):
+    with zf.open(member) as stream:
+        while True:
+            chunk = stream.read(read_size)
+            if not chunk:
+                break
+            counter.update(chunk)
+
+
+class NonSeekableStream(io.RawIOBase):
+    def __init__(self, raw, counter=None):
+        self.raw = raw
+        self.counter = counter
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def read(self, size=-1):
+        started = time.perf_counter()
+        data = self.raw.read(size)
+        self.seconds += time.perf_counter() - started
+        self.bytes += len(data)
+        if self.counter is not None:
+            self.counter.update(data)
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+def streaming_transfer_config(transfer_config):
+    return TransferConfig(
+        multipart_threshold=transfer_config.multipart_threshold,
+        multipart_chunksize=transfer_config.multipart_chunksize,
+        use_threads=False
+    )
+
+
+def stream_buffer_size(member, transfer_config, codec=None):
+    buffered = transfer_config.multipart_threshold + transfer_config.multipart_chunksize
+    if codec is not None:
+        buffered += transfer_config.multipart_chunksize
+    return min(member.file_size, buffered)
+
+
+class TrackedThreadPool(ThreadPoolExecutor):
+    """ThreadPoolExecutor that counts tasks submitted and not yet finished, for the metrics sampler."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pending = 0
+        self._pending_lock = threading.Lock()
+
+    def submit(self, fn, /, *args, **kwargs):
+        with self._pending_lock:
+            self.pending += 1
+        try:
+            future = super().submit(fn, *args, **kwargs)
+        except BaseException:
+            self._task_done(None)
+            raise
+        future.add_done_callback(self._task_done)
+        return future
+
+    def _task_done(self, _):
+        with self._pending_lock:
+            self.pending -= 1
+
+
+def upload_pool_scope(upload_pool, max_threads):
+    if upload_pool is not None:
+        return nullcontext(upload_pool)
+    return ThreadPoolExecutor(max_workers=max_threads)
+
+
+def wait_for_futures(futures):
+    results = []
+    try:
+        for future in as_completed(futures):
+            results.append(future.result())
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        wait(futures)
+        raise
+    return results
+
+
+def upload_bytes(s3, bucket, key, data, transfer_config):
+    s3.upload_fileobj(
+        Fileobj=io.BytesIO(data),
+        Bucket=bucket,
+        Key=key,
+        ExtraArgs={"ContentType": "text/csv"},
+        Config=transfer_config
+    )
+
+
+def upload_stream(s3, bucket, key, stream, transfer_config, counter=None, codec=None, metadata=None):
+    reader = NonSeekableStream(stream, counter)
+    source = reader if codec is None else CompressingStream(reader, codec)
+
+    s3.upload_fileobj(
+        Fileobj=source,
+        Bucket=bucket,
+        Key=key,
+        ExtraArgs=output_extra_args(codec, metadata),
+        Config=transfer_config
+    )
+
+    if codec is not None:
+        log_compression(key, source.raw_bytes, source.output_bytes, source.seconds)
+
+    return reader
+
+
+MAX_SINGLE_COPY_SIZE = 5 * 1024 * 1024 * 1024
+
+
+class AsyncS3Engine:
+    def __init__(self, max_concurrency=256, copy_part_size=256 * 1024 * 1024, max_attempts=5, client=None):
+        # client: an already-open async S3 client, e.g. a local stand-in for tests and benchmarks
+        if client is None:
+            try:
+                from aiobotocore.config import AioConfig
+                from aiobotocore.session import get_session
+            except ImportError:
+                raise ValueError("s3_engine=async requires the aiobotocore package")
+
+        self.max_concurrency = max_concurrency
+        self.copy_part_size = copy_part_size
+        self.loop = asyncio.new_event_loop()
+        self._limit = asyncio.Semaphore(max_concurrency)
+        self._thread = threading.Thread(target=self.loop.run_forever, name="s3-async-engine", daemon=True)
+        self._thread.start()
+
+        self._client_context = None
+        if client is None:
+            config = AioConfig(
+                max_pool_connections=max_concurrency,
+                retries={"max_attempts": max_attempts, "mode": "adaptive"}
+            )
+            self._client_context = get_session().create_client("s3", config=config)
+            client = self.run(self._client_context.__aenter__())
+        self.client = client
+
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def submit(self, fn, *args):
+        return asyncio.run_coroutine_threadsafe(self._limited(fn(*args)), self.loop)
+
+    async def _limited(self, coro):
+        async with self._limit:
+            return await coro
+
+    async def list_keys(self, bucket, prefix):
+        keys = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        async for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            keys.extend(obj["Key"] for obj in page.get("Contents", []))
+        return keys
+
+    async def move_object(self, bucket, source_key, target_key):
+        await self.copy_object(bucket, source_key, target_key)
+        await self.client.delete_object(Bucket=bucket, Key=source_key)
+
+    async def copy_object(self, bucket, source_key, target_key):
+        copy_source = {"Bucket": bucket, "Key": source_key}
+        head = await self.client.head_object(Bucket=bucket, Key=source_key)
+        size = head["ContentLength"]
+        etag = head["ETag"]
+
+        if size <= min(self.copy_part_size, MAX_SINGLE_COPY_SIZE):
+            await self._limited(self.client.copy_object(
+                Bucket=bucket,
+                Key=target_key,
+                CopySource=copy_source,
+                CopySourceIfMatch=etag
+            ))
+        else:
+            upload = await self.client.create_multipart_upload(
+                Bucket=bucket,
+                Key=target_key,
+                ContentType=head.get("ContentType", "binary/octet-stream"),
+                Metadata=head.get("Metadata", {})
+            )
+            upload_id = upload["UploadId"]
+            try:
+                parts = await asyncio.gather(*(
+                    self._limited(self._copy_part(bucket, target_key, upload_id, copy_source, etag, number, start, size))
+                    for number, start in enumerate(range(0, size, self.copy_part_size), start=1)
+                ))
+                await self.client.complete_multipart_upload(
+                    Bucket=bucket,
+                    Key=target_key,
+                    UploadId=upload_id,
+                    MultipartUpload={"Parts": list(parts)}
+                )
+            except BaseException:
+                await self.client.abort_multipart_upload(Bucket=bucket, Key=target_key, UploadId=upload_id)
+                raise
+
+    async def _copy_part(self, bucket, key, upload_id, copy_source, etag, part_number, start, size):
+        end = min(start + self.copy_part_size, size) - 1
+        response = await self.client.upload_part_copy(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            CopySource=copy_source,
+            CopySourceRange=f"bytes={start}-{end}",
+            CopySourceIfMatch=etag
+        )
+        return {"PartNumber": part_number, "ETag": response["CopyPartResult"]["ETag"]}
+
+    def close(self):
+        if self._client_context is not None:
+            self.run(self._client_context.__aexit__(None, None, None))
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+MANIFEST_FIELDS = [
+    "source_zip_key",
+    "source_full_csv_file_name",
+    "target_full_csv_file_name",
+    "is_split",
+    "bytes",
+    "row_count",
+    "crc32"
+]
+
+
+def build_count_key(count_folder, zip_name, count_format):
+    return f"{count_folder.rstrip('/')}/{today_folder()}/{zip_name}_counts.{count_format}"
+
+
+def write_count_manifest(s3, bucket, count_folder, zip_key, zip_name, rows, count_format="csv"):
+    count_key = build_count_key(count_folder, zip_name, count_format)
+
+    if count_format == "json":
+        body = json.dumps({
+            "source_zip_key": zip_key,
+            "generated_at": datetime.now().isoformat(timespec="seconds"),
+            "files": rows
+        }, indent=2)
+        content_type = "application/json"
+    else:
+        out = io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=MANIFEST_FIELDS, lineterminator="\n")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(dict(row, source_zip_key=zip_key))
+        body = out.getvalue()
+        content_type = "text/csv"
+
+    s3.put_object(Bucket=bucket, Key=count_key, Body=body.encode("utf-8"), ContentType=content_type)
+    log.info("Wrote row-count manifest: s3://%s/%s (%s files)", bucket, count_key, len(rows))
+    return count_key
+
+
+def member_metadata(member):
+    return {"source-crc32": f"{member.CRC:08x}", "source-size": str(member.file_size)}
+
+
+class ZipLedger:
+    def __init__(self, s3, bucket, key, zip_etag, zip_size, settings):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.zip_etag = zip_etag
+        self.zip_size = zip_size
+        self.settings = settings
+        self.members = {}
+        self.complete = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, s3, bucket, key, zip_etag, zip_size, settings, force=False):
+        ledger = cls(s3, bucket, key, zip_etag, zip_size, settings)
+        if force:
+            log.info("force=true | ignoring ledger s3://%s/%s", bucket, key)
+            return ledger
+
+        try:
+            data = json.loads(s3.get_object(Bucket=bucket, Key=key)["Body"].read())
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return ledger
+            raise
+
+        if data.get("settings") != settings:
+            log.info("Ledger settings changed, reprocessing all members: s3://%s/%s", bucket, key)
+            return ledger
+
+        ledger.members = data.get("members", {})
+        ledger.complete = (
+            data.get("complete", False)
+            and data.get("zip_etag") == zip_etag
+            and data.get("zip_size") == zip_size
+        )
+        return ledger
+
+    def record(self, member, rows):
+        with self._lock:
+            self.members[normalize_member_name(member.filename)] = {
+                "crc32": f"{member.CRC:08x}",
+                "size": member.file_size,
+                "rows": rows
+            }
+
+    def processed_rows(self, member):
+        entry = self.members.get(normalize_member_name(member.filename))
+        if not entry or entry["crc32"] != f"{member.CRC:08x}" or entry["size"] != member.file_size:
+            return None
+
+        for row in entry["rows"]:
+            try:
+                head = self.s3.head_object(Bucket=self.bucket, Key=row["target_full_csv_file_name"])
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                    return None
+                raise
+            if head.get("Metadata", {}).get("source-crc32") != entry["crc32"]:
+                return None
+
+        return entry["rows"]
+
+    def save(self, complete=False):
+        with self._lock:
+            self.complete = complete
+            body = json.dumps({
+                "zip_etag": self.zip_etag,
+                "zip_size": self.zip_size,
+                "settings": self.settings,
+                "complete": complete,
+                "updated_at": datetime.now().isoformat(timespec="seconds"),
+                "members": self.members
+            }, indent=2)
+        self.s3.put_object(Bucket=self.bucket, Key=self.key, Body=body.encode("utf-8"), ContentType="application/json")
+
+
+def build_ledger_key(ledger_folder, zip_name):
+    return f"{ledger_folder.rstrip('/')}/{zip_name}.json"
+
+
+def skip_processed_members(ledger, members, upload_pool, max_threads):
+    with upload_pool_scope(upload_pool, max_threads) as pool:
+        results = list(pool.map(ledger.processed_rows, members))
+
+    done_rows = []
+    pending = []
+    for member, rows in zip(members, results):
+        if rows is None:
+            pending.append(member)
+        else:
+            done_rows.extend(rows)
+
+    log.info("Ledger | already processed: %s | to process: %s", len(members) - len(pending), len(pending))
+    return done_rows, pending
+
+
+class SplitPartWriter:
+    def __init__(
+        self,
+        s3,
+        bucket,
+        key,
+        pool,
+        chunk_size,
+        in_flight,
+        memory_budget=None,
+        header=b"",
+        codec=None,
+        metadata=None,
+        engine=None
+    ):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.pool = pool
+        self.chunk_size = chunk_size
+        self.in_flight = in_flight
+        self.memory_budget = memory_budget
+        self.codec = codec
+        self.metadata = metadata
+        self.engine = engine
+        self.buffer = bytearray(header)
+        self.upload_id = None
+        self.chunk_count = 0
+        self.futures = []
+        self.completed = False
+        self.etag = None
+        self.compressing = deque()
+        self.compressed = bytearray(codec.header()) if codec is not None else None
+        self.raw_bytes = 0
+        self.raw_crc32 = 0
+        self.output_bytes = 0
+        self.compress_seconds = 0.0
+        self.upload_seconds = 0.0
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= self.chunk_size:
+            if self.codec is None:
+                self._submit_chunk(self._take_buffer())
+            else:
+                self._submit_compress(final=False)
+
+    def close(self):
+        if self.codec is not None:
+            self._submit_compress(final=True)
+            self._drain(wait_all=True)
+            self.compressed += self.codec.trailer(self.raw_crc32, self.raw_bytes)
+            self.buffer, self.compressed = self.compressed, None
+
+        data = self._take_buffer()
+        if self.upload_id is None:
+            self.output_bytes += len(data)
+            self._submit_upload(self._put_object, self._put_object_async, data)
+        elif data:
+            self._submit_chunk(data)
+
+    def complete(self):
+        parts = wait_for_futures(self.futures)
+        self.upload_seconds = sum(part.pop("Seconds") for part in parts)
+        if self.upload_id is not None:
+            response = self.s3.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self.upload_id,
+                MultipartUpload={"Parts": sorted(parts, key=lambda p: p["PartNumber"])}
+            )
+            self.etag = response["ETag"]
+        elif parts:
+            self.etag = parts[0]["ETag"]
+        self.completed = True
+
+        if self.codec is not None:
+            log_compression(self.key, self.raw_bytes, self.output_bytes, self.compress_seconds)
+
+    def abort(self):
+        futures = self.futures + list(self.compressing)
+        for future in futures:
+            future.cancel()
+        wait(futures)
+        if self.upload_id is not None and not self.completed:
+            try:
+                self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+            except ClientError:
+                log.exception("Failed aborting multipart upload: %s", self.key)
+
+    def _take_buffer(self):
+        data, self.buffer = self.buffer, bytearray()
+        return data
+
+    def _submit_chunk(self, chunk):
+        if self.upload_id is None:
+            upload = self.s3.create_multipart_upload(Bucket=self.bucket, Key=self.key, **output_extra_args(self.codec, self.metadata))
+            self.upload_id = upload["UploadId"]
+
+        self.chunk_count += 1
+        self.output_bytes += len(chunk)
+        self._submit_upload(self._upload_chunk, self._upload_chunk_async, self.chunk_count, chunk)
+
+    def _submit_compress(self, final):
+        chunk = self._take_buffer()
+        self.raw_bytes += len(chunk)
+        self.raw_crc32 = zlib.crc32(chunk, self.raw_crc32)
+        self._submit(self._compress_chunk, final, chunk, futures=self.compressing)
+        self._drain(wait_all=False)
+
+    def _drain(self, wait_all):
+        while self.compressing and (wait_all or self.compressing[0].done()):
+            data, seconds = self.compressing.popleft().result()
+            self.compressed += data
+            self.compress_seconds += seconds
+            if len(self.compressed) >= self.chunk_size:
+                chunk, self.compressed = self.compressed, bytearray()
+                self._submit_chunk(chunk)
+
+    def _submit_upload(self, fn, async_fn, *args):
+        if self.engine is None:
+            self._submit(fn, *args)
+        else:
+            self._submit(async_fn, *args, executor=self.engine)
+
+    def _submit(self, fn, *args, futures=None, executor=None):
+        nbytes = len(args[-1])
+        self.in_flight.acquire()
+        reserved = self.memory_budget.acquire(nbytes) if self.memory_budget is not None else 0
+
+        def release(_):
+            if self.memory_budget is not None:
+                self.memory_budget.release(reserved)
+            self.in_flight.release()
+
+        try:
+            future = (executor or self.pool).submit(fn, *args)
+        except Exception:
+            release(None)
+            raise
+
+        future.add_done_callback(release)
+        (self.futures if futures is None else futures).append(future)
+
+    def _compress_chunk(self, final, chunk):
+        started = time.perf_counter()
+        data = self.codec.compress_chunk(chunk, final)
+        return data, time.perf_counter() - started
+
+    def _upload_chunk(self, chunk_number, chunk):
+        started = time.perf_counter()
+        response = self.s3.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=chunk_number,
+            Body=chunk
+        )
+        return {"PartNumber": chunk_number, "ETag": response["ETag"], "Seconds": time.perf_counter() - started}
+
+    def _put_object(self, body):
+        started = time.perf_counter()
+        response = self.s3.put_object(Bucket=self.bucket, Key=self.key, Body=body, **output_extra_args(self.codec, self.metadata))
+        return {"ETag": response["ETag"], "Seconds": time.perf_counter() - started}
+
+    async def _upload_chunk_async(self, chunk_number, chunk):
+        started = time.perf_counter()
+        response = await self.engine.client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=chunk_number,
+            Body=bytes(chunk)
+        )
+        return {"PartNumber": chunk_number, "ETag": response["ETag"], "Seconds": time.perf_counter() - started}
+
+    async def _put_object_async(self, body):
+        started = time.perf_counter()
+        response = await self.engine.client.put_object(
+            Bucket=self.bucket,
+            Key=self.key,
+            Body=bytes(body),
+            **output_extra_args(self.codec, self.metadata)
+        )
+        return {"ETag": response["ETag"], "Seconds": time.perf_counter() - started}
+
+
+def find_record_boundary(data, start, pos, quote_parity=0, quotechar=b'"'):
+    if quotechar:
+        quote_parity ^= data.count(quotechar, start, pos) & 1
+
+    while True:
+        nl = data.find(b"\n", pos)
+        if nl == -1:
+            if quotechar:
+                quote_parity ^= data.count(quotechar, pos) & 1
+            return -1, quote_parity
+
+        if quotechar:
+            quote_parity ^= data.count(quotechar, pos, nl) & 1
+            if quote_parity:
+                pos = nl + 1
+                continue
+
+        return nl, 0
+
+
+def read_header(stream, read_block, quotechar=b'"'):
+    first = bytearray()
+    quote_parity = 0
+    while True:
+        chunk = stream.read(read_block)
+        if not chunk:
+            return bytes(first), b""
+
+        start = len(first)
+        first += chunk
+        pos, quote_parity = find_record_boundary(first, start, start, quote_parity, quotechar)
+        if pos != -1:
+            return bytes(first[:pos + 1]), bytes(first[pos + 1:])
+
+
+class SplitCutter:
+    """
+    Where to end split parts: at the first record boundary at or after split_size
+    bytes into the part, carrying quote parity across blocks so a cut never lands
+    inside a quoted field. An empty quotechar cuts at the next newline.
+    """
+
+    def __init__(self, split_size, quotechar=b'"'):
+        self.split_size = split_size
+        self.quotechar = quotechar
+        self.part_size = 0
+        self.quote_parity = 0
+
+    def next_cut(self, block, offset):
+        """Index in block just past the cut at or after offset, or -1 if the part runs past the block."""
+        if self.part_size + len(block) - offset >= self.split_size:
+            search = offset + max(self.split_size - self.part_size - 1, 0)
+            cut, self.quote_parity = find_record_boundary(block, offset, search, self.quote_parity, self.quotechar)
+        else:
+            cut = -1
+            if self.quotechar and block.find(self.quotechar, offset) != -1:
+                self.quote_parity ^= block.count(self.quotechar, offset) & 1
+
+        if cut == -1:
+            self.part_size += len(block) - offset
+            return -1
+
+        self.part_size = 0
+        return cut + 1
+
+
+class SplitCheckpoint:
+    def __init__(self, s3, bucket, key, identity):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.identity = identity
+        self.date_folder = today_folder()
+        self.parts = []
+        self.complete = False
+
+    @classmethod
+    def load(cls, s3, bucket, key, identity):
+        checkpoint = cls(s3, bucket, key, identity)
+
+        try:
+            data = json.loads(s3.get_object(Bucket=bucket, Key=key)["Body"].read())
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return checkpoint
+            raise
+
+        if data.get("identity") != identity:
+            log.warning("Checkpoint does not match member or split settings, starting over: s3://%s/%s", bucket, key)
+            return checkpoint
+
+        checkpoint.date_folder = data["date_folder"]
+        checkpoint.parts = data["parts"]
+        checkpoint.complete = data["complete"]
+        return checkpoint
+
+    @property
+    def resume_offset(self):
+        return self.parts[-1]["end_offset"] if self.parts else None
+
+    def add_part(self, part):
+        self.parts.append(part)
+        self.save()
+
+    def mark_complete(self):
+        self.complete = True
+        self.save()
+
+    def save(self):
+        body = json.dumps({
+            "identity": self.identity,
+            "date_folder": self.date_folder,
+            "complete": self.complete,
+            "parts": self.parts
+        }, indent=2)
+        self.s3.put_object(Bucket=self.bucket, Key=self.key, Body=body.encode("utf-8"), ContentType="application/json")
+
+
+def build_checkpoint_key(checkpoint_folder, zip_name, clean_name):
+    return f"{checkpoint_folder.rstrip('/')}/{zip_name}/{clean_name}.json"
+
+
+def delete_checkpoints(s3, bucket, checkpoint_folder, zip_name):
+    prefix = f"{checkpoint_folder.rstrip('/')}/{zip_name}/"
+    paginator = s3.get_paginator("list_objects_v2")
+
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        objects = [{"Key": obj["Key"]} for obj in page.get("Contents", [])]
+        if objects:
+            s3.delete_objects(Bucket=bucket, Delete={"Objects": objects, "Quiet": True})
+
+
+SPLIT_STRATEGIES = ("fixed", "adaptive")
+
+
+def plan_split_size(file_size, split_size, strategy="fixed", min_size=None, max_size=None, target_parts=0):
+    if strategy == "fixed":
+        return split_size if file_size >= split_size else None
+
+    parts = max(1, -(-file_size // max_size))
+    if target_parts:
+        parts = max(parts, min(target_parts, file_size // min_size))
+    if parts <= 1:
+        return None
+    return -(-file_size // parts)
+
+
+def plan_member_splits(members, split_size, split_config=None):
+    split_sizes = {}
+    for member in members:
+        size = plan_split_size(member.file_size, split_size, **(split_config or {}))
+        split_sizes[member.filename] = size
+        if size is not None and split_config and split_config.get("strategy") == "adaptive":
+            log.info(
+                "Adaptive split: %s | %s bytes -> %s parts of ~%s bytes",
+                member.filename,
+                member.file_size,
+                -(-member.file_size // size),
+                size
+            )
+    return split_sizes
+
+
+def split_identity(zip_name, zip_size, member, has_header, split_size, quotechar, count_rows, output_codec):
+    return {
+        "zip_name": zip_name,
+        "zip_size": zip_size,
+        "member": normalize_member_name(member.filename),
+        "member_crc": member.CRC,
+        "member_size": member.file_size,
+        "has_header": has_header,
+        "split_size": split_size,
+        "quotechar": quotechar.decode("utf-8"),
+        "count_rows": count_rows,
+        "output_compression": output_codec.name if output_codec is not None else "none"
+    }
@@ -1,16 +1,62 @@
 import sys
 import io
 import os
-import json
+import time
 import zipfile
 import logging
-from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import shutil
+import tempfile
+import threading
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
 
 import boto3
 from botocore.config import Config
 from boto3.s3.transfer import TransferConfig
 
+from unzip_common import (
+    today_folder,
+    normalize_prefix,
+    load_params_from_s3,
+    parse_bool,
+    S3RangeReader,
+    MIN_MULTIPART_PART_SIZE,
+    is_valid_csv,
+    normalize_member_name,
+    ZipHandlePool,
+    MemoryBudget,
+    submit_reserved,
+    StatsdClient,
+    PipelineMetrics,
+    metrics_phase,
+    write_metrics,
+    load_output_codec,
+    output_suffix,
+    RecordCounter,
+    streaming_transfer_config,
+    stream_buffer_size,
+    TrackedThreadPool,
+    upload_pool_scope,
+    wait_for_futures,
+    upload_stream,
+    AsyncS3Engine,
+    write_count_manifest,
+    member_metadata,
+    ZipLedger,
+    build_ledger_key,
+    skip_processed_members,
+    SplitPartWriter,
+    read_header,
+    SplitCutter,
+    SplitCheckpoint,
+    build_checkpoint_key,
+    delete_checkpoints,
+    SPLIT_STRATEGIES,
+    plan_member_splits,
+    split_identity,
+)
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s | %(levelname)s | %(message)s"
@@ -19,40 +65,13 @@ logging.basicConfig(
 log = logging.getLogger(__name__)
 
 
-def today_folder():
-    return datetime.now().strftime("%Y%m%d")
-
-
-def normalize_prefix(value):
-    return str(value).strip().strip("/")
-
-
-def load_params_from_s3(bucket, param_key):
-    bootstrap_s3 = boto3.client("s3")
-    response = bootstrap_s3.get_object(Bucket=bucket, Key=param_key)
-    content = response["Body"].read().decode("utf-8")
-    return json.loads(content)
-
-
-def parse_bool(value, default=True):
-    if value is None:
-        return default
-    if isinstance(value, bool):
-        return value
-
-    text = str(value).strip().lower()
-    if text in {"true", "1", "yes", "y"}:
-        return True
-    if text in {"false", "0", "no", "n"}:
-        return False
-
-    return default
-
-
-def get_zip_keys(s3, bucket, source_folder, zip_input):
+def get_zip_keys(s3, bucket, source_folder, zip_input, engine=None):
     zip_keys = []
 
-    if str(zip_input).strip().upper() == "ALL":
+    if str(zip_input).strip().upper() == "ALL" and engine is not None:
+        keys = engine.run(engine.list_keys(bucket, source_folder.rstrip("/") + "/"))
+        zip_keys.extend(key for key in keys if key.lower().endswith(".zip"))
+    elif str(zip_input).strip().upper() == "ALL":
         paginator = s3.get_paginator("list_objects_v2")
         for page in paginator.paginate(Bucket=bucket, Prefix=source_folder.rstrip("/") + "/"):
             for obj in page.get("Contents", []):
@@ -68,43 +87,106 @@ def get_zip_keys(s3, bucket, source_folder, zip_input):
     return zip_keys
 
 
-def is_valid_csv(member_name):
-    name = member_name.replace("\\", "/").strip("/")
-    base = os.path.basename(name)
-    return (
-        bool(name)
-        and not name.endswith("/")
-        and not name.startswith("__MACOSX/")
-        and not base.startswith("._")
-        and name.lower().endswith(".csv")
+ZIP_STRATEGIES = ("memory", "spool", "ranged")
+
+
+class ZipSource:
+    def __init__(self, strategy, size, etag, data=None, path=None, reader=None, memory_reservation=None):
+        self.strategy = strategy
+        self.size = size
+        self.etag = etag
+        self.data = data
+        self.path = path
+        self.reader = reader
+        self.memory_reservation = memory_reservation
+
+    def open_zip(self):
+        if self.strategy == "memory":
+            return zipfile.ZipFile(io.BytesIO(self.data))
+        if self.strategy == "spool":
+            return zipfile.ZipFile(self.path)
+        return zipfile.ZipFile(self.reader.clone())
+
+    def close(self):
+        self.data = None
+        if self.memory_reservation is not None:
+            budget, nbytes = self.memory_reservation
+            budget.release(nbytes)
+            self.memory_reservation = None
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+
+def choose_zip_strategy(size, zip_memory, spool_max_bytes, spool_dir):
+    if zip_memory is not None and zip_memory.try_acquire(size):
+        return "memory", f"size {size} fits zip_memory_mb ({zip_memory.in_use} of {zip_memory.limit_bytes} bytes reserved)"
+
+    reason = "no zip memory budget" if zip_memory is None else (
+        f"size {size} does not fit zip_memory_mb ({zip_memory.in_use} of {zip_memory.limit_bytes} bytes in use)"
     )
 
+    if size > spool_max_bytes:
+        return "ranged", f"{reason}; size exceeds spool_max_mb ({spool_max_bytes} bytes)"
 
-def get_csv_files(zip_bytes):
+    free = shutil.disk_usage(spool_dir).free
+    if size > free:
+        return "ranged", f"{reason}; only {free} bytes free in {spool_dir}"
+
+    return "spool", f"{reason}; spooling to {spool_dir} ({free} bytes free)"
+
+
+def load_zip_source(s3, bucket, zip_key, size, etag, transfer_config, zip_memory, spool_max_bytes, spool_dir, reader_config=None):
+    strategy, reason = choose_zip_strategy(size, zip_memory, spool_max_bytes, spool_dir)
+    log.info("ZIP strategy: %s | s3://%s/%s | %s", strategy, bucket, zip_key, reason)
+
+    if strategy == "memory":
+        source = ZipSource(strategy, size, etag, memory_reservation=(zip_memory, size))
+        try:
+            source.data = s3.get_object(Bucket=bucket, Key=zip_key, IfMatch=etag)["Body"].read()
+        except Exception:
+            source.close()
+            raise
+        return source
+
+    if strategy == "spool":
+        fd, path = tempfile.mkstemp(dir=spool_dir, suffix=".zip")
+        source = ZipSource(strategy, size, etag, path=path)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                s3.download_fileobj(bucket, zip_key, f, Config=transfer_config)
+        except Exception:
+            source.close()
+            raise
+        return source
+
+    reader = S3RangeReader(s3, bucket, zip_key, size=size, etag=etag, **(reader_config or {}))
+    return ZipSource(strategy, size, etag, reader=reader)
+
+
+def get_csv_files(zip_source):
     csv_files = []
-    with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zf:
+    with zip_source.open_zip() as zf:
         for member in zf.infolist():
             if is_valid_csv(member.filename):
                 csv_files.append(member)
     return csv_files
 
 
-def upload_bytes(s3, bucket, key, data, transfer_config):
-    s3.upload_fileobj(
-        Fileobj=io.BytesIO(data),
-        Bucket=bucket,
-        Key=key,
-        ExtraArgs={"ContentType": "text/csv"},
-        Config=transfer_config
-    )
-
-
-def move_s3_object(s3, bucket, source_key, target_base_prefix):
+def move_s3_object(s3, bucket, source_key, target_base_prefix, engine=None):
     base_prefix = normalize_prefix(target_base_prefix)
     dated_prefix = f"{base_prefix}/{today_folder()}"
     target_key = f"{dated_prefix}/{os.path.basename(source_key)}"
 
     log.info("Moving zip from s3://%s/%s to s3://%s/%s", bucket, source_key, bucket, target_key)
+
+    if engine is not None:
+        engine.run(engine.move_object(bucket, source_key, target_key))
+        return target_key
+
     s3.copy_object(
         Bucket=bucket,
         CopySource={"Bucket": bucket, "Key": source_key},
@@ -115,13 +197,13 @@ def move_s3_object(s3, bucket, source_key, target_base_prefix):
 
 
 def build_small_file_key(target_folder, zip_name, member_name):
-    clean_name = member_name.replace("\\", "/").strip("/")
+    clean_name = normalize_member_name(member_name)
     return f"{target_folder.rstrip('/')}/{today_folder()}/{zip_name}/all_small_files/{clean_name}"
 
 
-def build_large_file_key(target_folder, zip_name, clean_name, file_base, part_number):
+def build_large_file_key(target_folder, zip_name, clean_name, file_base, part_number, date_folder=None):
     return (
-        f"{target_folder.rstrip('/')}/{today_folder()}/{zip_name}/"
+        f"{target_folder.rstrip('/')}/{date_folder or today_folder()}/{zip_name}/"
         f"all_large_files/{file_base}/{file_base}_part{str(part_number).zfill(3)}.csv"
     )
 
@@ -130,188 +212,270 @@ def upload_small_file(
     s3,
     bucket,
     target_folder,
-    zip_bytes,
+    zip_source,
     zip_name,
-    member_name,
-    transfer_config
+    member,
+    transfer_config,
+    zip_handles=None,
+    count_config=None,
+    output_codec=None,
+    metrics=None
 ):
-    with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zf:
-        data = zf.read(member_name)
+    member_name = member.filename
+    clean_name = normalize_member_name(member_name)
+    out_key = build_small_file_key(target_folder, zip_name, member_name) + output_suffix(output_codec)
+    counter = RecordCounter(**count_config) if count_config is not None else None
+
+    if zip_handles is not None:
+        zf_scope = nullcontext(zip_handles.get())
+    else:
+        zf_scope = zip_source.open_zip()
+
+    with zf_scope as zf:
+        with zf.open(member) as stream:
+            started = time.perf_counter()
+            reader = upload_stream(
+                s3, bucket, out_key, stream, transfer_config, counter, output_codec, member_metadata(member)
+            )
+            elapsed = time.perf_counter() - started
 
-    clean_name = member_name.replace("\\", "/").strip("/")
-    out_key = build_small_file_key(target_folder, zip_name, member_name)
+    if metrics is not None:
+        metrics.add("decompress", reader.seconds, reader.bytes, zip_name, clean_name)
+        metrics.add("upload", elapsed - reader.seconds, member.file_size, zip_name, clean_name)
 
-    upload_bytes(s3, bucket, out_key, data, transfer_config)
     log.info("Uploaded small file: %s", out_key)
 
-    return {
+    row = {
         "source_full_csv_file_name": clean_name,
         "target_full_csv_file_name": out_key,
         "is_split": False
     }
+    if counter is not None:
+        row.update(counter.summary())
+
+    return row
 
 
 def upload_small_files(
     s3,
     bucket,
     target_folder,
-    zip_bytes,
+    zip_source,
     zip_name,
     small_files,
     max_threads,
-    transfer_config
+    transfer_config,
+    upload_pool=None,
+    memory_budget=None,
+    count_config=None,
+    output_codec=None,
+    ledger=None,
+    metrics=None
 ):
-    results = []
-
-    log.info("Phase 1: uploading small files in parallel")
-
-    with ThreadPoolExecutor(max_workers=max_threads) as pool:
-        futures = [
-            pool.submit(
-                upload_small_file,
-                s3,
-                bucket,
-                target_folder,
-                zip_bytes,
-                zip_name,
-                m.filename,
-                transfer_config
-            )
-            for m in small_files
-        ]
-
-        for future in as_completed(futures):
-            results.append(future.result())
-
-    return results
-
+    log.info("Phase 1: uploading small files in parallel | files=%s | threads=%s", len(small_files), max_threads)
+
+    zip_handles = ZipHandlePool(zip_source.open_zip)
+    stream_config = streaming_transfer_config(transfer_config)
+
+    def upload(member):
+        row = upload_small_file(
+            s3,
+            bucket,
+            target_folder,
+            zip_source,
+            zip_name,
+            member,
+            stream_config,
+            zip_handles,
+            count_config,
+            output_codec,
+            metrics
+        )
+        if ledger is not None:
+            ledger.record(member, [row])
+        return row
 
+    try:
+        with upload_pool_scope(upload_pool, max_threads) as pool:
+            futures = [
+                submit_reserved(pool, memory_budget, stream_buffer_size(member, stream_config, output_codec), upload, member)
+                for member in sorted(small_files, key=lambda m: m.file_size, reverse=True)
+            ]
+
+            return wait_for_futures(futures)
+    finally:
+        zip_handles.close()
+
+
+# Peak memory per split, independent of member size:
+#   read_block                                   current decompressed block
+#   + chunk_size + read_block                    chunk being filled
+#   + max_in_flight_chunks * (chunk_size + read_block)   chunks queued or uploading
+# (chunk_size = max(multipart_chunksize, 5 MB)). In-flight chunks also count
+# against the shared memory budget, so the process-wide ceiling stays memory_budget_mb.
 def split_large_file(
     s3,
     bucket,
     target_folder,
-    zip_bytes,
+    zip_source,
     zip_name,
     member_name,
     has_header,
     split_size,
     read_block,
     max_threads,
-    transfer_config
+    transfer_config,
+    upload_pool=None,
+    max_in_flight_chunks=None,
+    in_flight=None,
+    memory_budget=None,
+    quotechar=b'"',
+    count_rows=False,
+    output_codec=None,
+    checkpoint_folder="",
+    metrics=None,
+    engine=None
 ):
-    clean_name = member_name.replace("\\", "/").strip("/")
+    clean_name = normalize_member_name(member_name)
     file_base = os.path.splitext(os.path.basename(clean_name))[0]
+    chunk_size = max(transfer_config.multipart_chunksize, MIN_MULTIPART_PART_SIZE)
+    in_flight = in_flight or threading.BoundedSemaphore(max_in_flight_chunks or max_threads)
 
-    header = b""
-    leftover = b""
-    current_part = bytearray()
-    part_number = 1
-    uploaded_rows = []
-
-    with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zf:
-        with zf.open(member_name) as stream:
-            if has_header:
-                first = bytearray()
-                while b"\n" not in first:
-                    chunk = stream.read(read_block)
-                    if not chunk:
-                        break
-                    first.extend(chunk)
-
-                pos = first.find(b"\n")
-                if pos != -1:
-                    header = bytes(first[:pos + 1])
-                    leftover = bytes(first[pos + 1:])
-                else:
-                    header = bytes(first)
-                    leftover = b""
+    with zip_source.open_zip() as zf:
+        member = zf.getinfo(member_name)
 
-            upload_futures = []
+        checkpoint = None
+        if checkpoint_folder:
+            checkpoint = SplitCheckpoint.load(
+                s3,
+                bucket,
+                build_checkpoint_key(checkpoint_folder, zip_name, clean_name),
+                split_identity(zip_name, zip_source.size, member, has_header, split_size, quotechar, count_rows, output_codec)
+            )
+            if checkpoint.complete:
+                log.info("Checkpoint complete, skipping split: %s (%s parts)", clean_name, len(checkpoint.parts))
+                return [part["row"] for part in checkpoint.parts]
+
+        date_folder = checkpoint.date_folder if checkpoint is not None else today_folder()
+        uploaded_rows = [part["row"] for part in checkpoint.parts] if checkpoint is not None else []
+        part_number = len(uploaded_rows)
+
+        open_parts = deque()
+        writer = None
+        part = None
+        counter = None
+        cutter = SplitCutter(split_size, quotechar)
+
+        def complete_ready(block):
+            while open_parts and (block or all(f.done() for f in open_parts[0][0].futures)):
+                w, p, c = open_parts[0]
+                w.complete()
+                open_parts.popleft()
+                if metrics is not None:
+                    metrics.add("upload", w.upload_seconds, w.output_bytes, zip_name, clean_name)
+                p["etag"] = w.etag
+                if c is not None:
+                    p["row"].update(c.summary())
+                if checkpoint is not None:
+                    checkpoint.add_part(p)
+
+        with zf.open(member) as stream, upload_pool_scope(upload_pool, max_threads) as pool, \
+                metrics_phase(metrics, "split", zip_name, clean_name, member.file_size):
+            try:
+                header, pending = read_header(stream, read_block, quotechar) if has_header else (b"", b"")
+                position = len(header)
+
+                resume_offset = checkpoint.resume_offset if checkpoint is not None else None
+                if resume_offset is not None:
+                    if resume_offset - position <= len(pending):
+                        pending = pending[resume_offset - position:]
+                    else:
+                        stream.seek(resume_offset)
+                        pending = b""
+                    position = resume_offset
+                    log.info("Resuming split of %s after part %s at offset %s", clean_name, part_number, resume_offset)
 
-            with ThreadPoolExecutor(max_workers=max_threads) as pool:
                 while True:
-                    block = stream.read(read_block)
-                    data = leftover + block
-                    leftover = b""
-
+                    if pending:
+                        block, pending = pending, b""
+                    else:
+                        with metrics_phase(metrics, "decompress", zip_name, clean_name) as record:
+                            block = stream.read(read_block)
+                            record["bytes"] = len(block)
                     if not block:
-                        current_part.extend(data)
                         break
 
-                    pos = data.rfind(b"\n")
-                    if pos == -1:
-                        leftover = data
-                        continue
-
-                    leftover = data[pos + 1:]
-                    data = data[:pos + 1]
-                    current_part.extend(data)
-
-                    if len(current_part) >= split_size:
-                        out_key = build_large_file_key(
-                            target_folder=target_folder,
-                            zip_name=zip_name,
-                            clean_name=clean_name,
-                            file_base=file_base,
-                            part_number=part_number
-                        )
-                        payload = header + bytes(current_part)
-
-                        upload_futures.append(
-                            pool.submit(
-                                upload_bytes,
-                                s3,
-                                bucket,
-                                out_key,
-                                payload,
-                                transfer_config
+                    view = memoryview(block)
+                    while view:
+                        offset = len(block) - len(view)
+
+                        if writer is None:
+                            part_number += 1
+                            out_key = build_large_file_key(
+                                target_folder=target_folder,
+                                zip_name=zip_name,
+                                clean_name=clean_name,
+                                file_base=file_base,
+                                part_number=part_number,
+                                date_folder=date_folder
+                            ) + output_suffix(output_codec)
+                            writer = SplitPartWriter(
+                                s3, bucket, out_key, pool, chunk_size, in_flight, memory_budget, header, output_codec,
+                                member_metadata(member), engine
                             )
-                        )
-
-                        uploaded_rows.append({
-                            "source_full_csv_file_name": clean_name,
-                            "target_full_csv_file_name": out_key,
-                            "is_split": True
-                        })
-
-                        log.info("Uploading split file: %s", out_key)
-                        part_number += 1
-                        current_part = bytearray()
-
-                if leftover:
-                    current_part.extend(leftover)
-
-                if current_part:
-                    out_key = build_large_file_key(
-                        target_folder=target_folder,
-                        zip_name=zip_name,
-                        clean_name=clean_name,
-                        file_base=file_base,
-                        part_number=part_number
-                    )
-                    payload = header + bytes(current_part)
-
-                    upload_futures.append(
-                        pool.submit(
-                            upload_bytes,
-                            s3,
-                            bucket,
-                            out_key,
-                            payload,
-                            transfer_config
-                        )
-                    )
-
-                    uploaded_rows.append({
-                        "source_full_csv_file_name": clean_name,
-                        "target_full_csv_file_name": out_key,
-                        "is_split": True
-                    })
-
-                    log.info("Uploading split file: %s", out_key)
-
-                for future in as_completed(upload_futures):
-                    future.result()
+                            if count_rows:
+                                counter = RecordCounter(has_header, quotechar)
+                                counter.update(header)
+                            part = {
+                                "part_number": part_number,
+                                "start_offset": position + offset,
+                                "row": {
+                                    "source_full_csv_file_name": clean_name,
+                                    "target_full_csv_file_name": out_key,
+                                    "is_split": True
+                                }
+                            }
+                            uploaded_rows.append(part["row"])
+
+                        cut = cutter.next_cut(block, offset)
+                        if cut == -1:
+                            writer.write(view)
+                            if counter is not None:
+                                counter.update(block, offset)
+                            break
+
+                        writer.write(view[:cut - offset])
+                        if counter is not None:
+                            counter.update(block, offset, cut)
+                        view = view[cut - offset:]
+
+                        part["end_offset"] = position + cut
+                        writer.close()
+                        log.info("Uploading split file: %s", writer.key)
+                        open_parts.append((writer, part, counter))
+                        writer = None
+                        complete_ready(block=False)
+
+                    position += len(block)
+
+                if writer is not None:
+                    part["end_offset"] = position
+                    writer.close()
+                    log.info("Uploading split file: %s", writer.key)
+                    open_parts.append((writer, part, counter))
+                    writer = None
+
+                complete_ready(block=True)
+
+                if checkpoint is not None:
+                    checkpoint.mark_complete()
+
+            except BaseException:
+                for w, _, _ in open_parts:
+                    w.abort()
+                if writer is not None:
+                    writer.abort()
+                raise
 
     return uploaded_rows
 
@@ -325,462 +489,272 @@ def process_zip_file(
     split_size,
     read_block,
     max_threads,
-    transfer_config
+    transfer_config,
+    upload_pool=None,
+    zip_memory=None,
+    spool_max_bytes=10 * 1024 * 1024 * 1024,
+    spool_dir="",
+    reader_config=None,
+    split_config=None,
+    memory_budget=None,
+    max_in_flight_chunks=None,
+    in_flight=None,
+    max_parallel_large_members=1,
+    quotechar=b'"',
+    count_folder="",
+    count_format="csv",
+    output_codec=None,
+    checkpoint_folder="",
+    ledger_folder="",
+    force=False,
+    metrics=None,
+    engine=None
 ):
     log.info("Processing ZIP: %s", zip_key)
 
-    zip_bytes = s3.get_object(Bucket=bucket, Key=zip_key)["Body"].read()
     zip_name = os.path.splitext(os.path.basename(zip_key))[0]
 
-    csv_files = get_csv_files(zip_bytes)
-    small_files = [m for m in csv_files if m.file_size < split_size]
-    large_files = [m for m in csv_files if m.file_size >= split_size]
+    count_config = {"has_header": has_header, "quotechar": quotechar} if count_folder else None
+    manifest_rows = []
+
+    with metrics_phase(metrics, "head", zip_name):
+        head = s3.head_object(Bucket=bucket, Key=zip_key)
+
+    ledger = None
+    if ledger_folder:
+        ledger = ZipLedger.load(
+            s3,
+            bucket,
+            build_ledger_key(ledger_folder, zip_name),
+            head["ETag"],
+            head["ContentLength"],
+            {
+                "target_folder": target_folder,
+                "split_size": split_size,
+                "split_config": split_config or {},
+                "has_header": has_header,
+                "quotechar": quotechar.decode("utf-8"),
+                "count_rows": count_config is not None,
+                "output_compression": output_codec.name if output_codec else "none"
+            },
+            force
+        )
+        if ledger.complete:
+            log.info("ZIP already processed with the same ETag and settings, skipping: %s", zip_key)
+            return
+
+    with metrics_phase(metrics, "download", zip_name) as record:
+        zip_source = load_zip_source(
+            s3,
+            bucket,
+            zip_key,
+            head["ContentLength"],
+            head["ETag"],
+            transfer_config,
+            zip_memory,
+            spool_max_bytes,
+            spool_dir or tempfile.gettempdir(),
+            reader_config
+        )
+        record["bytes"] = zip_source.size if zip_source.reader is None else 0
+
+    if metrics is not None:
+        metrics.annotate(zip_name, zip_key=zip_key, size=zip_source.size, strategy=zip_source.strategy)
 
-    log.info("Small files: %s | Large files: %s", len(small_files), len(large_files))
+    completed = False
+    try:
+        with metrics_phase(metrics, "central_directory", zip_name):
+            csv_files = get_csv_files(zip_source)
 
-    if small_files:
-        upload_small_files(
-            s3=s3,
-            bucket=bucket,
-            target_folder=target_folder,
-            zip_bytes=zip_bytes,
-            zip_name=zip_name,
-            small_files=small_files,
-            max_threads=max_threads,
-            transfer_config=transfer_config
-        )
+        if ledger is not None:
+            done_rows, csv_files = skip_processed_members(ledger, csv_files, upload_pool, max_threads)
+            manifest_rows += done_rows
 
-    if large_files:
-        log.info("Phase 2: processing large files one by one")
-        for member in large_files:
-            log.info("Splitting file: %s", member.filename)
+        split_sizes = plan_member_splits(csv_files, split_size, split_config)
+        small_files = [m for m in csv_files if split_sizes[m.filename] is None]
+        large_files = [m for m in csv_files if split_sizes[m.filename] is not None]
 
-            split_large_file(
+        log.info("Small files: %s | Large files: %s", len(small_files), len(large_files))
+
+        if small_files:
+            manifest_rows += upload_small_files(
                 s3=s3,
                 bucket=bucket,
                 target_folder=target_folder,
-                zip_bytes=zip_bytes,
+                zip_source=zip_source,
                 zip_name=zip_name,
-                member_name=member.filename,
-                has_header=has_header,
-                split_size=split_size,
-                read_block=read_block,
+                small_files=small_files,
                 max_threads=max_threads,
-                transfer_config=transfer_config
+                transfer_config=transfer_config,
+                upload_pool=upload_pool,
+                memory_budget=memory_budget,
+                count_config=count_config,
+                output_codec=output_codec,
+                ledger=ledger,
+                metrics=metrics
             )
 
-    del zip_bytes
-
-
-def main():
-    if len(sys.argv) != 3:
-        print("Usage:")
-        print("python3 unzip_s3_csv.py <s3_bucket> <parameter_file_location>")
-        sys.exit(1)
-
-    bucket = sys.argv[1]
-    parameter_file_location = sys.argv[2]
-
-    try:
-        params = load_params_from_s3(bucket, parameter_file_location)
-
-        source_folder = normalize_prefix(params["s3_source_files_location"])
-        target_folder = normalize_prefix(params["s3_target_files_location"])
-        archive_folder = normalize_prefix(params["archive_files_location"])
-        rejected_folder = normalize_prefix(params["rejected_files_location"])
-
-        zip_input = str(params.get("zip_file_name", "ALL")).strip()
-        has_header = parse_bool(params.get("has_header", True), default=True)
-
-        split_size_mb = int(params.get("split_size_mb", 250))
-        read_block_mb = int(params.get("read_block_mb", 16))
-        max_threads = int(params.get("max_threads", min((os.cpu_count() or 4) * 2, 12)))
-        max_pool_connections = int(params.get("max_pool_connections", max(50, max_threads * 4)))
-        transfer_max_concurrency = int(params.get("transfer_max_concurrency", max_threads))
-
-        split_size = split_size_mb * 1024 * 1024
-        read_block = read_block_mb * 1024 * 1024
-
-        s3_config = Config(
-            max_pool_connections=max_pool_connections,
-            retries={"max_attempts": 5, "mode": "adaptive"},
-            tcp_keepalive=True
-        )
-        s3 = boto3.client("s3", config=s3_config)
-
-        transfer_config = TransferConfig(
-            multipart_threshold=8 * 1024 * 1024,
-            multipart_chunksize=8 * 1024 * 1024,
-            max_concurrency=transfer_max_concurrency,
-            use_threads=True
-        )
-
-        log.info(
-            "S3 config | max_threads=%s | max_pool_connections=%s | transfer_max_concurrency=%s",
-            max_threads,
-            max_pool_connections,
-            transfer_max_concurrency
-        )
-
-        zip_keys = get_zip_keys(s3, bucket, source_folder, zip_input)
+        if large_files:
+            log.info("Phase 2: processing large files")
 
-        if not zip_keys:
-            log.info("No zip files found. Exiting successfully.")
-            sys.exit(0)
-
-        failed = False
+            def split_member(member):
+                log.info("Splitting file: %s", member.filename)
 
-        for zip_key in zip_keys:
-            try:
-                process_zip_file(
+                member_rows = split_large_file(
                     s3=s3,
                     bucket=bucket,
                     target_folder=target_folder,
-                    zip_key=zip_key,
+                    zip_source=zip_source,
+                    zip_name=zip_name,
+                    member_name=member.filename,
                     has_header=has_header,
-                    split_size=split_size,
+                    split_size=split_sizes[member.filename],
                     read_block=read_block,
                     max_threads=max_threads,
-                    transfer_config=transfer_config
+                    transfer_config=transfer_config,
+                    upload_pool=upload_pool,
+                    max_in_flight_chunks=max_in_flight_chunks,
+                    in_flight=in_flight,
+                    memory_budget=memory_budget,
+                    quotechar=quotechar,
+                    count_rows=count_config is not None,
+                    output_codec=output_codec,
+                    checkpoint_folder=checkpoint_folder,
+                    metrics=metrics,
+                    engine=engine
                 )
-
-                archived_key = move_s3_object(s3, bucket, zip_key, archive_folder)
-                log.info("Archived ZIP successfully: s3://%s/%s", bucket, archived_key)
-
-            except Exception:
-                failed = True
-                log.exception("Failed processing ZIP: %s", zip_key)
-                try:
-                    rejected_key = move_s3_object(s3, bucket, zip_key, rejected_folder)
-                    log.info("Moved failed ZIP to rejected: s3://%s/%s", bucket, rejected_key)
-                except Exception:
-                    log.exception("Failed moving ZIP to rejected folder: %s", zip_key)
-
-        if failed:
-            sys.exit(1)
-
-        log.info("Done")
-        sys.exit(0)
-
-    except Exception:
-        log.exception("Job failed")
-        sys.exit(1)
-
-
-if __name__ == "__main__":
-    main()def parse_bool(value, default=True):
-    if value is None:
-        return default
-    if isinstance(value, bool):
-        return value
-
-    text = str(value).strip().lower()
-    if text in {"true", "1", "yes", "y"}:
-        return True
-    if text in {"false", "0", "no", "n"}:
-        return False
-
-    return default
-
-
-def get_zip_keys(s3, bucket, source_folder, zip_input):
-    zip_keys = []
-
-    if str(zip_input).strip().upper() == "ALL":
-        paginator = s3.get_paginator("list_objects_v2")
-        for page in paginator.paginate(Bucket=bucket, Prefix=source_folder.rstrip("/") + "/"):
-            for obj in page.get("Contents", []):
-                key = obj["Key"]
-                if key.lower().endswith(".zip"):
-                    zip_keys.append(key)
-    else:
-        for name in str(zip_input).split(","):
-            name = name.strip()
-            if name:
-                zip_keys.append(source_folder.rstrip("/") + "/" + name)
-
-    return zip_keys
-
-
-def is_valid_csv(member_name):
-    name = member_name.replace("\\", "/").strip("/")
-    base = os.path.basename(name)
-    return (
-        bool(name)
-        and not name.endswith("/")
-        and not name.startswith("__MACOSX/")
-        and not base.startswith("._")
-        and name.lower().endswith(".csv")
-    )
-
-
-def get_csv_files(zip_bytes):
-    csv_files = []
-    with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zf:
-        for member in zf.infolist():
-            if is_valid_csv(member.filename):
-                csv_files.append(member)
-    return csv_files
-
-
-def upload_bytes(s3, bucket, key, data, transfer_config):
-    s3.upload_fileobj(
-        Fileobj=io.BytesIO(data),
-        Bucket=bucket,
-        Key=key,
-        ExtraArgs={"ContentType": "text/csv"},
-        Config=transfer_config
-    )
-
-
-def move_s3_object(s3, bucket, source_key, target_base_prefix):
-    base_prefix = normalize_prefix(target_base_prefix)
-    dated_prefix = f"{base_prefix}/{today_folder()}"
-    target_key = f"{dated_prefix}/{os.path.basename(source_key)}"
-
-    log.info("Moving zip from s3://%s/%s to s3://%s/%s", bucket, source_key, bucket, target_key)
-    s3.copy_object(
-        Bucket=bucket,
-        CopySource={"Bucket": bucket, "Key": source_key},
-        Key=target_key
-    )
-    s3.delete_object(Bucket=bucket, Key=source_key)
-    return target_key
-
-
-def upload_small_file(
-    s3,
-    bucket,
-    target_folder,
-    zip_bytes,
-    zip_name,
-    member_name,
-    transfer_config
-):
-    with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zf:
-        data = zf.read(member_name)
-
-    clean_name = member_name.replace("\\", "/").strip("/")
-    out_key = f"{target_folder.rstrip('/')}/{zip_name}/{clean_name}"
-
-    upload_bytes(s3, bucket, out_key, data, transfer_config)
-    log.info("Uploaded small file: %s", out_key)
-
-    return {
-        "source_full_csv_file_name": clean_name,
-        "target_full_csv_file_name": out_key,
-        "is_split": False
-    }
-
-
-def upload_small_files(
-    s3,
-    bucket,
-    target_folder,
-    zip_bytes,
-    zip_name,
-    small_files,
-    max_threads,
-    transfer_config
-):
-    results = []
-
-    log.info("Phase 1: uploading small files in parallel")
-
-    with ThreadPoolExecutor(max_workers=max_threads) as pool:
-        futures = [
-            pool.submit(
-                upload_small_file,
-                s3,
-                bucket,
-                target_folder,
-                zip_bytes,
-                zip_name,
-                m.filename,
-                transfer_config
+                if ledger is not None:
+                    ledger.record(member, member_rows)
+                return member_rows
+
+            if max_parallel_large_members <= 1 or len(large_files) == 1:
+                for member in large_files:
+                    manifest_rows += split_member(member)
+            else:
+                log.info(
+                    "Splitting %s large files with max_parallel_large_members=%s",
+                    len(large_files),
+                    max_parallel_large_members
+                )
+                with ThreadPoolExecutor(max_workers=min(max_parallel_large_members, len(large_files))) as split_pool:
+                    futures = {
+                        member.filename: split_pool.submit(split_member, member)
+                        for member in sorted(large_files, key=lambda m: m.file_size, reverse=True)
+                    }
+                    wait_for_futures(list(futures.values()))
+                for member in large_files:
+                    manifest_rows += futures[member.filename].result()
+
+        if count_folder:
+            write_count_manifest(s3, bucket, count_folder, zip_key, zip_name, manifest_rows, count_format)
+
+        if checkpoint_folder:
+            delete_checkpoints(s3, bucket, checkpoint_folder, zip_name)
+
+        completed = True
+
+    finally:
+        if ledger is not None:
+            ledger.save(completed)
+
+        if zip_source.reader is not None:
+            stats = zip_source.reader.stats
+            log.info(
+                "Ranged GETs for %s | requests=%s | bytes=%s | object_size=%s",
+                zip_key,
+                stats["requests"],
+                stats["bytes"],
+                zip_source.size
             )
-            for m in small_files
-        ]
-
-        for future in as_completed(futures):
-            results.append(future.result())
+            if metrics is not None:
+                metrics.add("download", stats["seconds"], stats["bytes"], zip_name)
+        zip_source.close()
 
-    return results
 
-
-def split_large_file(
-    s3,
-    bucket,
-    target_folder,
-    zip_bytes,
-    zip_name,
-    member_name,
-    has_header,
-    split_size,
-    read_block,
-    max_threads,
-    transfer_config
-):
-    clean_name = member_name.replace("\\", "/").strip("/")
-    file_base = os.path.splitext(os.path.basename(clean_name))[0]
-    out_dir = f"{target_folder.rstrip('/')}/{zip_name}/{file_base}"
-
-    header = b""
-    leftover = b""
-    current_part = bytearray()
-    part_number = 1
-    uploaded_rows = []
-
-    with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zf:
-        with zf.open(member_name) as stream:
-            if has_header:
-                first = bytearray()
-                while b"\n" not in first:
-                    chunk = stream.read(read_block)
-                    if not chunk:
-                        break
-                    first.extend(chunk)
-
-                pos = first.find(b"\n")
-                if pos != -1:
-                    header = bytes(first[:pos + 1])
-                    leftover = bytes(first[pos + 1:])
-                else:
-                    header = bytes(first)
-                    leftover = b""
-
-            upload_futures = []
-
-            with ThreadPoolExecutor(max_workers=max_threads) as pool:
-                while True:
-                    block = stream.read(read_block)
-                    data = leftover + block
-                    leftover = b""
-
-                    if not block:
-                        current_part.extend(data)
-                        break
-
-                    pos = data.rfind(b"\n")
-                    if pos == -1:
-                        leftover = data
-                        continue
-
-                    leftover = data[pos + 1:]
-                    data = data[:pos + 1]
-                    current_part.extend(data)
-
-                    if len(current_part) >= split_size:
-                        out_key = f"{out_dir}/{file_base}_part{str(part_number).zfill(3)}.csv"
-                        payload = header + bytes(current_part)
-
-                        upload_futures.append(
-                            pool.submit(
-                                upload_bytes,
-                                s3,
-                                bucket,
-                                out_key,
-                                payload,
-                                transfer_config
-                            )
-                        )
-
-                        uploaded_rows.append({
-                            "source_full_csv_file_name": clean_name,
-                            "target_full_csv_file_name": out_key,
-                            "is_split": True
-                        })
-
-                        log.info("Uploading split file: %s", out_key)
-                        part_number += 1
-                        current_part = bytearray()
-
-                if leftover:
-                    current_part.extend(leftover)
-
-                if current_part:
-                    out_key = f"{out_dir}/{file_base}_part{str(part_number).zfill(3)}.csv"
-                    payload = header + bytes(current_part)
-
-                    upload_futures.append(
-                        pool.submit(
-                            upload_bytes,
-                            s3,
-                            bucket,
-                            out_key,
-                            payload,
-                            transfer_config
-                        )
-                    )
-
-                    uploaded_rows.append({
-                        "source_full_csv_file_name": clean_name,
-                        "target_full_csv_file_name": out_key,
-                        "is_split": True
-                    })
-
-                    log.info("Uploading split file: %s", out_key)
-
-                for future in as_completed(upload_futures):
-                    future.result()
-
-    return uploaded_rows
-
-
-def process_zip_file(
+def process_and_archive_zip(
     s3,
     bucket,
     target_folder,
+    archive_folder,
+    rejected_folder,
     zip_key,
     has_header,
     split_size,
     read_block,
     max_threads,
-    transfer_config
+    transfer_config,
+    upload_pool=None,
+    zip_memory=None,
+    spool_max_bytes=10 * 1024 * 1024 * 1024,
+    spool_dir="",
+    reader_config=None,
+    split_config=None,
+    memory_budget=None,
+    max_in_flight_chunks=None,
+    in_flight=None,
+    max_parallel_large_members=1,
+    quotechar=b'"',
+    count_folder="",
+    count_format="csv",
+    output_codec=None,
+    checkpoint_folder="",
+    ledger_folder="",
+    force=False,
+    metrics=None,
+    engine=None
 ):
-    log.info("Processing ZIP: %s", zip_key)
-
-    zip_bytes = s3.get_object(Bucket=bucket, Key=zip_key)["Body"].read()
     zip_name = os.path.splitext(os.path.basename(zip_key))[0]
 
-    csv_files = get_csv_files(zip_bytes)
-    small_files = [m for m in csv_files if m.file_size < split_size]
-    large_files = [m for m in csv_files if m.file_size >= split_size]
-
-    log.info("Small files: %s | Large files: %s", len(small_files), len(large_files))
-
-    if small_files:
-        upload_small_files(
+    try:
+        process_zip_file(
             s3=s3,
             bucket=bucket,
             target_folder=target_folder,
-            zip_bytes=zip_bytes,
-            zip_name=zip_name,
-            small_files=small_files,
+            zip_key=zip_key,
+            has_header=has_header,
+            split_size=split_size,
+            read_block=read_block,
             max_threads=max_threads,
-            transfer_config=transfer_config
+            transfer_config=transfer_config,
+            upload_pool=upload_pool,
+            zip_memory=zip_memory,
+            spool_max_bytes=spool_max_bytes,
+            spool_dir=spool_dir,
+            reader_config=reader_config,
+            split_config=split_config,
+            memory_budget=memory_budget,
+            max_in_flight_chunks=max_in_flight_chunks,
+            in_flight=in_flight,
+            max_parallel_large_members=max_parallel_large_members,
+            quotechar=quotechar,
+            count_folder=count_folder,
+            count_format=count_format,
+            output_codec=output_codec,
+            checkpoint_folder=checkpoint_folder,
+            ledger_folder=ledger_folder,
+            force=force,
+            metrics=metrics,
+            engine=engine
         )
 
-    if large_files:
-        log.info("Phase 2: processing large files one by one")
-        for member in large_files:
-            log.info("Splitting file: %s", member.filename)
-
-            split_large_file(
-                s3=s3,
-                bucket=bucket,
-                target_folder=target_folder,
-                zip_bytes=zip_bytes,
-                zip_name=zip_name,
-                member_name=member.filename,
-                has_header=has_header,
-                split_size=split_size,
-                read_block=read_block,
-                max_threads=max_threads,
-                transfer_config=transfer_config
-            )
+        with metrics_phase(metrics, "archive", zip_name):
+            archived_key = move_s3_object(s3, bucket, zip_key, archive_folder, engine)
+        log.info("Archived ZIP successfully: s3://%s/%s", bucket, archived_key)
+        if metrics is not None:
+            metrics.annotate(zip_name, status="archived")
+        return True
 
-    del zip_bytes
+    except Exception:
+        log.exception("Failed processing ZIP: %s", zip_key)
+        try:
+            with metrics_phase(metrics, "archive", zip_name):
+                rejected_key = move_s3_object(s3, bucket, zip_key, rejected_folder, engine)
+            log.info("Moved failed ZIP to rejected: s3://%s/%s", bucket, rejected_key)
+        except Exception:
+            log.exception("Failed moving ZIP to rejected folder: %s", zip_key)
+        if metrics is not None:
+            metrics.annotate(zip_name, status="rejected")
+        return False
 
 
 def main():
@@ -792,6 +766,7 @@ def main():
     bucket = sys.argv[1]
     parameter_file_location = sys.argv[2]
 
+    engine = None
     try:
         params = load_params_from_s3(bucket, parameter_file_location)
 
@@ -804,12 +779,55 @@ def main():
         has_header = parse_bool(params.get("has_header", True), default=True)
 
         split_size_mb = int(params.get("split_size_mb", 250))
+        split_strategy = str(params.get("split_strategy", "fixed")).strip().lower()
+        split_min_mb = int(params.get("split_min_mb", 100))
+        split_max_mb = int(params.get("split_max_mb", split_size_mb))
+        split_target_parts = int(params.get("split_target_parts", 0))
         read_block_mb = int(params.get("read_block_mb", 16))
         max_threads = int(params.get("max_threads", min((os.cpu_count() or 4) * 2, 12)))
+        max_parallel_zips = int(params.get("max_parallel_zips", 1))
         max_pool_connections = int(params.get("max_pool_connections", max(50, max_threads * 4)))
         transfer_max_concurrency = int(params.get("transfer_max_concurrency", max_threads))
+        memory_budget_mb = int(params.get("memory_budget_mb", 1024))
+        zip_memory_mb = int(params.get("zip_memory_mb", 512))
+        spool_max_mb = int(params.get("spool_max_mb", 10240))
+        spool_dir = str(params.get("spool_dir", "")).strip()
+        range_block_mb = int(params.get("range_block_mb", 1))
+        range_read_ahead_blocks = int(params.get("range_read_ahead_blocks", 8))
+        range_cache_blocks = int(params.get("range_cache_blocks", 64))
+        max_parallel_large_members = int(params.get("max_parallel_large_members", 1))
+        s3_engine = str(params.get("s3_engine", "threads")).strip().lower()
+        async_max_concurrency = int(params.get("async_max_concurrency", 256))
+        max_in_flight_chunks = int(params.get(
+            "max_in_flight_chunks",
+            async_max_concurrency if s3_engine == "async" else max_threads
+        ))
+        # csv_quotechar: split cuts track quote parity so a part never ends inside a
+        # quoted field. That scan reads every byte: ~1.7 GB/s on quote-dense CSV
+        # (bench_split_scan.py), still several times inflate speed, so splits stay
+        # inflate-bound. "" cuts at the next newline instead; only for data with no
+        # quoted newlines.
+        quotechar = str(params.get("csv_quotechar", '"')).encode("utf-8")
+        count_folder = normalize_prefix(params.get("count_location", ""))
+        count_format = str(params.get("count_format", "csv")).strip().lower()
+        output_compression = params.get("output_compression", "none")
+        checkpoint_folder = normalize_prefix(params.get("checkpoint_location", ""))
+        ledger_folder = normalize_prefix(params.get("ledger_location", ""))
+        force = parse_bool(params.get("force"), default=False)
+        metrics_folder = normalize_prefix(params.get("metrics_location", ""))
+        statsd_host = str(params.get("statsd_host", "")).strip()
+        statsd_port = int(params.get("statsd_port", 8125))
+        statsd_prefix = str(params.get("statsd_prefix", "unzip")).strip()
+        metrics_sample_seconds = float(params.get("metrics_sample_seconds", 5))
+        output_compression_level = params.get("output_compression_level")
 
         split_size = split_size_mb * 1024 * 1024
+        split_config = {
+            "strategy": split_strategy,
+            "min_size": split_min_mb * 1024 * 1024,
+            "max_size": split_max_mb * 1024 * 1024,
+            "target_parts": split_target_parts
+        }
         read_block = read_block_mb * 1024 * 1024
 
         s3_config = Config(
@@ -819,6 +837,31 @@ def main():
         )
         s3 = boto3.client("s3", config=s3_config)
 
+        if s3_engine not in ("threads", "async"):
+            log.error("s3_engine must be threads or async, got %s", s3_engine)
+            sys.exit(1)
+
+        if s3_engine == "async":
+            try:
+                engine = AsyncS3Engine(async_max_concurrency)
+            except ValueError as e:
+                log.error("%s", e)
+                sys.exit(1)
+            log.info("S3 engine: async | async_max_concurrency=%s", async_max_concurrency)
+
+        metrics = None
+        if metrics_folder or statsd_host:
+            statsd = StatsdClient(statsd_host, statsd_port, statsd_prefix) if statsd_host else None
+            metrics = PipelineMetrics(statsd)
+            s3.meta.events.register("after-call.s3", metrics.on_s3_call)
+            if engine is not None:
+                engine.client.meta.events.register("after-call.s3", metrics.on_s3_call)
+            log.info(
+                "Metrics enabled | metrics_location=%s | statsd=%s",
+                metrics_folder or "-",
+                f"{statsd_host}:{statsd_port}" if statsd_host else "-"
+            )
+
         transfer_config = TransferConfig(
             multipart_threshold=8 * 1024 * 1024,
             multipart_chunksize=8 * 1024 * 1024,
@@ -826,14 +869,54 @@ def main():
             use_threads=True
         )
 
+        memory_budget = MemoryBudget(memory_budget_mb * 1024 * 1024) if memory_budget_mb > 0 else None
+        zip_memory = MemoryBudget(zip_memory_mb * 1024 * 1024) if zip_memory_mb > 0 else None
+        spool_max_bytes = spool_max_mb * 1024 * 1024
+
+        reader_config = {
+            "block_size": range_block_mb * 1024 * 1024,
+            "read_ahead_blocks": range_read_ahead_blocks,
+            "cache_blocks": range_cache_blocks
+        }
+
         log.info(
-            "S3 config | max_threads=%s | max_pool_connections=%s | transfer_max_concurrency=%s",
+            "S3 config | max_threads=%s | max_parallel_zips=%s | max_pool_connections=%s | transfer_max_concurrency=%s | memory_budget_mb=%s",
             max_threads,
+            max_parallel_zips,
             max_pool_connections,
-            transfer_max_concurrency
+            transfer_max_concurrency,
+            memory_budget_mb
         )
+        log.info(
+            "ZIP strategy limits | zip_memory_mb=%s | spool_max_mb=%s | spool_dir=%s",
+            zip_memory_mb,
+            spool_max_mb,
+            spool_dir or tempfile.gettempdir()
+        )
+
+        if split_strategy not in SPLIT_STRATEGIES:
+            log.error("split_strategy must be one of %s, got %s", ", ".join(SPLIT_STRATEGIES), split_strategy)
+            sys.exit(1)
+
+        if split_strategy == "adaptive" and not 0 < split_min_mb <= split_max_mb:
+            log.error("split_min_mb must be positive and not above split_max_mb (%s > %s)", split_min_mb, split_max_mb)
+            sys.exit(1)
 
-        zip_keys = get_zip_keys(s3, bucket, source_folder, zip_input)
+        if count_format not in ("csv", "json"):
+            log.error("count_format must be csv or json, got %s", count_format)
+            sys.exit(1)
+
+        try:
+            output_codec = load_output_codec(
+                output_compression,
+                int(output_compression_level) if output_compression_level is not None else None
+            )
+        except ValueError as e:
+            log.error("%s", e)
+            sys.exit(1)
+
+        with metrics_phase(metrics, "list"):
+            zip_keys = get_zip_keys(s3, bucket, source_folder, zip_input, engine)
 
         if not zip_keys:
             log.info("No zip files found. Exiting successfully.")
@@ -841,31 +924,64 @@ def main():
 
         failed = False
 
-        for zip_key in zip_keys:
-            try:
-                process_zip_file(
-                    s3=s3,
-                    bucket=bucket,
-                    target_folder=target_folder,
-                    zip_key=zip_key,
-                    has_header=has_header,
-                    split_size=split_size,
-                    read_block=read_block,
-                    max_threads=max_threads,
-                    transfer_config=transfer_config
-                )
-
-                archived_key = move_s3_object(s3, bucket, zip_key, archive_folder)
-                log.info("Archived ZIP successfully: s3://%s/%s", bucket, archived_key)
+        with TrackedThreadPool(max_workers=max_threads) as upload_pool:
+            zip_kwargs = dict(
+                s3=s3,
+                bucket=bucket,
+                target_folder=target_folder,
+                archive_folder=archive_folder,
+                rejected_folder=rejected_folder,
+                has_header=has_header,
+                split_size=split_size,
+                read_block=read_block,
+                max_threads=max_threads,
+                transfer_config=transfer_config,
+                upload_pool=upload_pool,
+                zip_memory=zip_memory,
+                spool_max_bytes=spool_max_bytes,
+                spool_dir=spool_dir,
+                reader_config=reader_config,
+                split_config=split_config,
+                memory_budget=memory_budget,
+                max_in_flight_chunks=max_in_flight_chunks,
+                in_flight=threading.BoundedSemaphore(max_in_flight_chunks),
+                max_parallel_large_members=max_parallel_large_members,
+                quotechar=quotechar,
+                count_folder=count_folder,
+                count_format=count_format,
+                output_codec=output_codec,
+                checkpoint_folder=checkpoint_folder,
+                ledger_folder=ledger_folder,
+                force=force,
+                metrics=metrics,
+                engine=engine
+            )
 
-            except Exception:
-                failed = True
-                log.exception("Failed processing ZIP: %s", zip_key)
-                try:
-                    rejected_key = move_s3_object(s3, bucket, zip_key, rejected_folder)
-                    log.info("Moved failed ZIP to rejected: s3://%s/%s", bucket, rejected_key)
-                except Exception:
-                    log.exception("Failed moving ZIP to rejected folder: %s", zip_key)
+            if metrics is not None:
+                metrics.start_sampler(metrics_sample_seconds, upload_pool, memory_budget)
+
+            if max_parallel_zips <= 1 or len(zip_keys) == 1:
+                for zip_key in zip_keys:
+                    if not process_and_archive_zip(zip_key=zip_key, **zip_kwargs):
+                        failed = True
+            else:
+                log.info("Processing %s ZIPs with max_parallel_zips=%s", len(zip_keys), max_parallel_zips)
+                with ThreadPoolExecutor(max_workers=max_parallel_zips) as zip_pool:
+                    futures = [
+                        zip_pool.submit(process_and_archive_zip, zip_key=zip_key, **zip_kwargs)
+                        for zip_key in zip_keys
+                    ]
+                    for ok in wait_for_futures(futures):
+                        if not ok:
+                            failed = True
+
+        if metrics is not None:
+            metrics.stop_sampler()
+            metrics.sample(None, memory_budget)
+            if metrics_folder:
+                write_metrics(s3, bucket, metrics_folder, metrics)
+            if metrics.statsd is not None:
+                metrics.statsd.close()
 
         if failed:
             sys.exit(1)
@@ -876,6 +992,9 @@ def main():
     except Exception:
         log.exception("Job failed")
         sys.exit(1)
+    finally:
+        if engine is not None:
+            engine.close()
 
 
 if __name__ == "__main__":
@@ -3,16 +3,71 @@ import sys
 import io
 import os
 import json
+import mmap
+import uuid
+import shutil
+import zlib
+import time
+import struct
+import signal
 import zipfile
 import logging
+import threading
+from collections import deque
+from contextlib import nullcontext
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import unquote_plus
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 import boto3
 from botocore.config import Config
 from botocore.exceptions import ClientError
 from boto3.s3.transfer import TransferConfig
 
+from unzip_common import (
+    today_folder,
+    normalize_prefix,
+    load_params_from_s3,
+    parse_bool,
+    S3RangeReader,
+    MIN_MULTIPART_PART_SIZE,
+    is_valid_csv,
+    normalize_member_name,
+    ZipHandlePool,
+    MemoryBudget,
+    submit_reserved,
+    StatsdClient,
+    PipelineMetrics,
+    metrics_phase,
+    write_metrics,
+    load_output_codec,
+    output_suffix,
+    RecordCounter,
+    count_member,
+    streaming_transfer_config,
+    stream_buffer_size,
+    TrackedThreadPool,
+    upload_pool_scope,
+    wait_for_futures,
+    upload_stream,
+    MAX_SINGLE_COPY_SIZE,
+    AsyncS3Engine,
+    write_count_manifest,
+    member_metadata,
+    ZipLedger,
+    build_ledger_key,
+    skip_processed_members,
+    SplitPartWriter,
+    read_header,
+    SplitCutter,
+    SplitCheckpoint,
+    build_checkpoint_key,
+    delete_checkpoints,
+    SPLIT_STRATEGIES,
+    plan_member_splits,
+    split_identity,
+)
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s | %(levelname)s | %(message)s"
@@ -21,34 +76,9 @@ logging.basicConfig(
 log = logging.getLogger(__name__)
 
 
-def today_folder():
-    return datetime.now().strftime("%Y%m%d")
-
-
-def normalize_prefix(value):
-    return str(value).strip().strip("/")
-
-
-def load_params_from_s3(bucket, param_key):
-    bootstrap_s3 = boto3.client("s3")
-    response = bootstrap_s3.get_object(Bucket=bucket, Key=param_key)
-    content = response["Body"].read().decode("utf-8")
-    return json.loads(content)
-
-
-def parse_bool(value, default=True):
-    if value is None:
-        return default
-    if isinstance(value, bool):
-        return value
-
-    text = str(value).strip().lower()
-    if text in {"true", "1", "yes", "y"}:
-        return True
-    if text in {"false", "0", "no", "n"}:
-        return False
-
-    return default
+def load_params_from_file(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
 
 
 def ensure_s3_object_exists(s3, bucket, key):
@@ -62,13 +92,16 @@ def ensure_s3_object_exists(s3, bucket, key):
         raise
 
 
-def get_zip_keys(s3, bucket, source_folder, zip_files_config):
+def get_zip_keys(s3, bucket, source_folder, zip_files_config, engine=None):
     zip_keys = []
 
     all_zip_files = parse_bool(zip_files_config.get("all_zip_files"), default=False)
     zip_file_name = str(zip_files_config.get("zip_file_name", "")).strip()
 
-    if all_zip_files:
+    if all_zip_files and engine is not None:
+        keys = engine.run(engine.list_keys(bucket, source_folder.rstrip("/") + "/"))
+        zip_keys.extend(key for key in keys if key.lower().endswith(".zip"))
+    elif all_zip_files:
         paginator = s3.get_paginator("list_objects_v2")
         for page in paginator.paginate(Bucket=bucket, Prefix=source_folder.rstrip("/") + "/"):
             for obj in page.get("Contents", []):
@@ -89,23 +122,391 @@ def get_zip_keys(s3, bucket, source_folder, zip_files_config):
     return zip_keys
 
 
-def is_valid_csv(member_name):
-    name = member_name.replace("\\", "/").strip("/")
-    base = os.path.basename(name)
+class LocalRangeReader(S3RangeReader):
+    strategy = "mmap"
+
+    def __init__(self, store, bucket, key, _shared=None):
+        io.RawIOBase.__init__(self)
+        # only the reader that mapped the file unmaps it; clones share the mapping
+        self._owner = _shared is None
+        if _shared is None:
+            head = store.head_object(Bucket=bucket, Key=key)
+            path = store.object_path(bucket, key)
+            with open(path, "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if head["ContentLength"] else b""
+            _shared = {
+                "data": data,
+                "size": head["ContentLength"],
+                "etag": head["ETag"],
+                "lock": threading.Lock(),
+                "requests": 0,
+                "bytes": 0,
+                "seconds": 0.0
+            }
+
+        self.s3 = store
+        self.bucket = bucket
+        self.key = key
+        self.size = _shared["size"]
+        self.etag = _shared["etag"]
+        self._shared = _shared
+        self._pos = 0
+
+    def clone(self):
+        return LocalRangeReader(self.s3, self.bucket, self.key, _shared=self._shared)
+
+    def readinto(self, buffer):
+        started = time.perf_counter()
+        out = memoryview(buffer).cast("B")
+        n = max(min(len(out), self.size - self._pos), 0)
+        out[:n] = self._shared["data"][self._pos:self._pos + n]
+        self._pos += n
+        with self._shared["lock"]:
+            self._shared["requests"] += 1
+            self._shared["bytes"] += n
+            self._shared["seconds"] += time.perf_counter() - started
+        return n
+
+    def close(self):
+        if self._owner and not self.closed and isinstance(self._shared["data"], mmap.mmap):
+            self._shared["data"].close()
+        super().close()
+
+
+class LocalPaginator:
+    def __init__(self, store, page_size=1000):
+        self.store = store
+        self.page_size = page_size
+
+    def paginate(self, Bucket, Prefix="", **kwargs):
+        page = []
+        for key in self.store.list_keys(Bucket, Prefix):
+            head = self.store.head_object(Bucket=Bucket, Key=key)
+            page.append({"Key": key, "Size": head["ContentLength"], "ETag": head["ETag"], "LastModified": head["LastModified"]})
+            if len(page) == self.page_size:
+                yield {"Contents": page, "KeyCount": len(page)}
+                page = []
+        if page:
+            yield {"Contents": page, "KeyCount": len(page)}
+
+
+class LocalObjectStore:
+    """
+    Object storage on a local or NFS directory with the same call surface as the
+    boto3 S3 client calls this script makes (list, head, ranged get, put,
+    multipart upload, copy, delete), so every function that takes ``s3`` runs
+    unchanged. A bucket is a directory under root and a key is a path inside it.
+    Writes go to a temp file and are renamed into place; ZIPs are read via mmap.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.state_dir = os.path.join(self.root, ".unzip-local")
+        self.uploads_dir = os.path.join(self.state_dir, "uploads")
+        self.meta_dir = os.path.join(self.state_dir, "meta")
+        os.makedirs(self.uploads_dir, exist_ok=True)
+        os.makedirs(self.meta_dir, exist_ok=True)
+
+    def object_path(self, bucket, key):
+        parts = [part for part in str(key).split("/") if part]
+        if not parts or any(part in (".", "..") for part in parts) or bucket in ("", ".", "..", ".unzip-local"):
+            raise ValueError(f"Invalid local object: {bucket}/{key}")
+        return os.path.join(self.root, bucket, *parts)
+
+    def _meta_path(self, bucket, key):
+        return os.path.join(self.meta_dir, bucket, *[part for part in key.split("/") if part]) + ".json"
+
+    def _error(self, code, message, operation):
+        status = {"404": 404, "NoSuchKey": 404, "NoSuchUpload": 404, "PreconditionFailed": 412}.get(code, 400)
+        return ClientError({"Error": {"Code": code, "Message": message}, "ResponseMetadata": {"HTTPStatusCode": status}}, operation)
+
+    def _etag(self, stat):
+        return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+    def _stat(self, bucket, key, operation, code="NoSuchKey"):
+        path = self.object_path(bucket, key)
+        if not os.path.isfile(path):
+            raise self._error(code, f"Not found: {bucket}/{key}", operation)
+        return os.stat(path)
+
+    def _check_if_match(self, stat, if_match, operation):
+        if if_match and if_match != self._etag(stat):
+            raise self._error("PreconditionFailed", "ETag changed", operation)
+
+    def _into_dir(self, path, write):
+        # a concurrent delete may prune the parent directory between makedirs and write
+        while True:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                return write()
+            except FileNotFoundError:
+                if os.path.isdir(os.path.dirname(path)):
+                    raise
+
+    def _prune_dirs(self, path, stop_dir):
+        directory = os.path.dirname(path)
+        while directory != stop_dir and directory.startswith(stop_dir + os.sep):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                return
+            directory = os.path.dirname(directory)
+
+    def _publish(self, tmp_path, bucket, key, metadata=None, content_type=None):
+        path = self.object_path(bucket, key)
+        self._into_dir(path, lambda: os.replace(tmp_path, path))
+
+        meta_path = self._meta_path(bucket, key)
+        if metadata or content_type:
+            def write_meta():
+                with open(meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"Metadata": metadata or {}, "ContentType": content_type}, f)
+            self._into_dir(meta_path, write_meta)
+        elif os.path.exists(meta_path):
+            os.remove(meta_path)
+        return {"ETag": self._etag(os.stat(path))}
+
+    def _temp_path(self):
+        return os.path.join(self.state_dir, f"tmp-{uuid.uuid4().hex}")
+
+    def list_keys(self, bucket, prefix=""):
+        bucket_dir = os.path.join(self.root, bucket)
+        keys = []
+        for directory, dirnames, filenames in os.walk(bucket_dir):
+            relative = os.path.relpath(directory, bucket_dir).replace(os.sep, "/")
+            relative = "" if relative == "." else relative + "/"
+            dirnames[:] = [d for d in dirnames if (relative + d + "/").startswith(prefix) or prefix.startswith(relative + d + "/")]
+            keys.extend(relative + name for name in filenames if (relative + name).startswith(prefix))
+        return sorted(keys)
+
+    def get_paginator(self, operation_name):
+        if operation_name != "list_objects_v2":
+            raise ValueError(f"Local storage does not support {operation_name}")
+        return LocalPaginator(self)
+
+    def head_object(self, Bucket, Key, IfMatch=None, **kwargs):
+        stat = self._stat(Bucket, Key, "HeadObject", code="404")
+        self._check_if_match(stat, IfMatch, "HeadObject")
+
+        meta = {}
+        meta_path = self._meta_path(Bucket, Key)
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        return {
+            "ContentLength": stat.st_size,
+            "ETag": self._etag(stat),
+            "LastModified": datetime.fromtimestamp(stat.st_mtime),
+            "Metadata": meta.get("Metadata", {}),
+            "ContentType": meta.get("ContentType") or "binary/octet-stream"
+        }
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None, **kwargs):
+        stat = self._stat(Bucket, Key, "GetObject")
+        self._check_if_match(stat, IfMatch, "GetObject")
+
+        start, end = 0, stat.st_size - 1
+        if Range:
+            first, _, last = Range.replace("bytes=", "").partition("-")
+            start = int(first)
+            end = min(int(last), stat.st_size - 1) if last else stat.st_size - 1
+
+        with open(self.object_path(Bucket, Key), "rb") as f:
+            if end < start:
+                data = b""
+            else:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    data = mm[start:end + 1]
+        return {"Body": io.BytesIO(data), "ContentLength": len(data), "ETag": self._etag(stat)}
+
+    def put_object(self, Bucket, Key, Body=b"", Metadata=None, ContentType=None, **kwargs):
+        tmp_path = self._temp_path()
+        with open(tmp_path, "wb") as f:
+            if isinstance(Body, (bytes, bytearray, memoryview)):
+                f.write(Body)
+            else:
+                shutil.copyfileobj(Body, f, 8 * 1024 * 1024)
+        return self._publish(tmp_path, Bucket, Key, Metadata, ContentType)
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, Config=None, **kwargs):
+        extra_args = ExtraArgs or {}
+        chunk_size = Config.multipart_chunksize if Config is not None else 8 * 1024 * 1024
+        tmp_path = self._temp_path()
+        with open(tmp_path, "wb") as f:
+            while True:
+                data = Fileobj.read(chunk_size)
+                if not data:
+                    break
+                f.write(data)
+        self._publish(tmp_path, Bucket, Key, extra_args.get("Metadata"), extra_args.get("ContentType"))
+
+    def create_multipart_upload(self, Bucket, Key, Metadata=None, ContentType=None, **kwargs):
+        upload_id = uuid.uuid4().hex
+        upload_dir = os.path.join(self.uploads_dir, upload_id)
+        os.makedirs(upload_dir)
+        with open(os.path.join(upload_dir, "upload.json"), "w", encoding="utf-8") as f:
+            json.dump({"Bucket": Bucket, "Key": Key, "Metadata": Metadata, "ContentType": ContentType}, f)
+        return {"Bucket": Bucket, "Key": Key, "UploadId": upload_id}
+
+    def _upload_dir(self, upload_id, operation):
+        upload_dir = os.path.join(self.uploads_dir, os.path.basename(upload_id))
+        if not os.path.isdir(upload_dir):
+            raise self._error("NoSuchUpload", f"Unknown upload: {upload_id}", operation)
+        return upload_dir
+
+    def _write_part(self, upload_id, part_number, data, operation):
+        part_path = os.path.join(self._upload_dir(upload_id, operation), f"{part_number:05d}.part")
+        with open(part_path, "wb") as f:
+            f.write(data)
+        return f'"{zlib.crc32(data):08x}-{len(data):x}"'
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        data = Body if isinstance(Body, (bytes, bytearray, memoryview)) else Body.read()
+        return {"ETag": self._write_part(UploadId, PartNumber, data, "UploadPart")}
+
+    def upload_part_copy(self, Bucket, Key, UploadId, PartNumber, CopySource, CopySourceRange=None, CopySourceIfMatch=None, **kwargs):
+        data = self.get_object(
+            Bucket=CopySource["Bucket"],
+            Key=CopySource["Key"],
+            Range=CopySourceRange,
+            IfMatch=CopySourceIfMatch
+        )["Body"].read()
+        return {"CopyPartResult": {"ETag": self._write_part(UploadId, PartNumber, data, "UploadPartCopy")}}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        upload_dir = self._upload_dir(UploadId, "CompleteMultipartUpload")
+        with open(os.path.join(upload_dir, "upload.json"), encoding="utf-8") as f:
+            upload = json.load(f)
+
+        tmp_path = self._temp_path()
+        with open(tmp_path, "wb") as out:
+            for part in MultipartUpload["Parts"]:
+                with open(os.path.join(upload_dir, f"{part['PartNumber']:05d}.part"), "rb") as f:
+                    shutil.copyfileobj(f, out, 8 * 1024 * 1024)
+        response = self._publish(tmp_path, Bucket, Key, upload.get("Metadata"), upload.get("ContentType"))
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        return dict(response, Bucket=Bucket, Key=Key)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        shutil.rmtree(self._upload_dir(UploadId, "AbortMultipartUpload"), ignore_errors=True)
+        return {}
+
+    def copy_object(self, Bucket, Key, CopySource, CopySourceIfMatch=None, **kwargs):
+        head = self.head_object(Bucket=CopySource["Bucket"], Key=CopySource["Key"], IfMatch=CopySourceIfMatch)
+        tmp_path = self._temp_path()
+        shutil.copyfile(self.object_path(CopySource["Bucket"], CopySource["Key"]), tmp_path)
+        response = self._publish(tmp_path, Bucket, Key, head["Metadata"], head["ContentType"])
+        return {"CopyObjectResult": response}
+
+    def copy(self, CopySource, Bucket, Key, ExtraArgs=None, Config=None, **kwargs):
+        self.copy_object(Bucket=Bucket, Key=Key, CopySource=CopySource)
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        for path, stop_dir in (
+            (self.object_path(Bucket, Key), os.path.join(self.root, Bucket)),
+            (self._meta_path(Bucket, Key), os.path.join(self.meta_dir, Bucket))
+        ):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            # S3 has no directories; drop the ones this key left empty
+            self._prune_dirs(path, stop_dir)
+        return {}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        for obj in Delete.get("Objects", []):
+            self.delete_object(Bucket=Bucket, Key=obj["Key"])
+        return {}
+
+
+def open_zip_source(s3, bucket, zip_key, reader_config=None):
+    if isinstance(s3, LocalObjectStore):
+        return LocalRangeReader(s3, bucket, zip_key)
+    return S3RangeReader(s3, bucket, zip_key, **(reader_config or {}))
+
+
+ZIP_LOCAL_NAME_LENGTH = 10
+ZIP_LOCAL_EXTRA_LENGTH = 11
+
+
+def get_member_data_range(zip_source, member):
+    reader = zip_source.clone()
+    reader.seek(member.header_offset)
+    header = reader.read(zipfile.sizeFileHeader)
+    if len(header) != zipfile.sizeFileHeader:
+        raise zipfile.BadZipFile(f"Truncated local header for {member.filename}")
+
+    fields = struct.unpack(zipfile.structFileHeader, header)
+    if fields[0] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"Bad local header magic for {member.filename}")
+
+    start = (
+        member.header_offset
+        + zipfile.sizeFileHeader
+        + fields[ZIP_LOCAL_NAME_LENGTH]
+        + fields[ZIP_LOCAL_EXTRA_LENGTH]
+    )
+    return start, start + member.compress_size
+
+
+def can_copy_stored_member(zip_source, member, stored_copy_min_size):
     return (
-        bool(name)
-        and not name.endswith("/")
-        and not name.startswith("__MACOSX/")
-        and not base.startswith("._")
-        and name.lower().endswith(".csv")
+        stored_copy_min_size is not None
+        and isinstance(zip_source, S3RangeReader)
+        and member.compress_type == zipfile.ZIP_STORED
+        and not member.flag_bits & 0x1
+        and member.file_size >= max(stored_copy_min_size, 1)
     )
 
 
-def normalize_member_name(member_name):
-    return member_name.replace("\\", "/").strip("/")
+def copy_stored_member(s3, bucket, zip_source, member, out_key, copy_part_size):
+    start, end = get_member_data_range(zip_source, member)
+    copy_source = {"Bucket": zip_source.bucket, "Key": zip_source.key}
+
+    upload = s3.create_multipart_upload(
+        Bucket=bucket,
+        Key=out_key,
+        ContentType="text/csv",
+        Metadata=member_metadata(member)
+    )
+    upload_id = upload["UploadId"]
+
+    try:
+        parts = []
+        for part_number, part_start in enumerate(range(start, end, copy_part_size), start=1):
+            part_end = min(part_start + copy_part_size, end) - 1
+            response = s3.upload_part_copy(
+                Bucket=bucket,
+                Key=out_key,
+                UploadId=upload_id,
+                PartNumber=part_number,
+                CopySource=copy_source,
+                CopySourceRange=f"bytes={part_start}-{part_end}",
+                CopySourceIfMatch=zip_source.etag
+            )
+            parts.append({"PartNumber": part_number, "ETag": response["CopyPartResult"]["ETag"]})
+
+        s3.complete_multipart_upload(
+            Bucket=bucket,
+            Key=out_key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts}
+        )
+    except BaseException:
+        s3.abort_multipart_upload(Bucket=bucket, Key=out_key, UploadId=upload_id)
+        raise
+
+    return len(parts)
+
 
+def open_zip(zip_source):
+    if isinstance(zip_source, S3RangeReader):
+        return zipfile.ZipFile(zip_source.clone())
+    return zipfile.ZipFile(zip_source)
 
-def get_csv_files(local_zip_path, file_config):
+
+def get_csv_files(zip_source, file_config):
     csv_files = []
 
     all_file = parse_bool(file_config.get("all_file"), default=True)
@@ -126,7 +527,7 @@ def get_csv_files(local_zip_path, file_config):
             if str(name).strip()
         }
 
-    with zipfile.ZipFile(local_zip_path) as zf:
+    with open_zip(zip_source) as zf:
         for member in zf.infolist():
             if not is_valid_csv(member.filename):
                 continue
@@ -144,23 +545,21 @@ def get_csv_files(local_zip_path, file_config):
     return csv_files
 
 
-def upload_bytes(s3, bucket, key, data, transfer_config):
-    s3.upload_fileobj(
-        Fileobj=io.BytesIO(data),
-        Bucket=bucket,
-        Key=key,
-        ExtraArgs={"ContentType": "text/csv"},
-        Config=transfer_config
-    )
+def zip_handle_scope(zip_handles, zip_source):
+    if zip_handles is not None:
+        return nullcontext(zip_handles.get())
+    return open_zip(zip_source)
 
 
-def move_s3_object(s3, bucket, source_key, target_base_prefix, transfer_config):
-    base_prefix = normalize_prefix(target_base_prefix)
-    dated_prefix = f"{base_prefix}/{today_folder()}"
-    target_key = f"{dated_prefix}/{os.path.basename(source_key)}"
+def move_s3_object(s3, bucket, source_key, target_base_prefix, transfer_config, engine=None):
+    target_key = build_move_key(source_key, target_base_prefix)
 
     log.info("Moving file from s3://%s/%s to s3://%s/%s", bucket, source_key, bucket, target_key)
 
+    if engine is not None:
+        engine.run(engine.move_object(bucket, source_key, target_key))
+        return target_key
+
     copy_source = {
         "Bucket": bucket,
         "Key": source_key
@@ -177,14 +576,192 @@ def move_s3_object(s3, bucket, source_key, target_base_prefix, transfer_config):
     return target_key
 
 
+def build_move_key(source_key, target_base_prefix):
+    return f"{normalize_prefix(target_base_prefix)}/{today_folder()}/{os.path.basename(source_key)}"
+
+
+def copy_s3_object(s3, bucket, source_key, target_key, copy_part_size, part_pool=None):
+    head = s3.head_object(Bucket=bucket, Key=source_key)
+    size = head["ContentLength"]
+    etag = head["ETag"]
+    copy_source = {"Bucket": bucket, "Key": source_key}
+
+    if size <= min(copy_part_size, MAX_SINGLE_COPY_SIZE):
+        s3.copy_object(Bucket=bucket, Key=target_key, CopySource=copy_source, CopySourceIfMatch=etag)
+        return 1
+
+    upload = s3.create_multipart_upload(
+        Bucket=bucket,
+        Key=target_key,
+        ContentType=head.get("ContentType", "binary/octet-stream"),
+        Metadata=head.get("Metadata", {})
+    )
+    upload_id = upload["UploadId"]
+
+    def copy_part(part_number, start):
+        end = min(start + copy_part_size, size) - 1
+        response = s3.upload_part_copy(
+            Bucket=bucket,
+            Key=target_key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            CopySource=copy_source,
+            CopySourceRange=f"bytes={start}-{end}",
+            CopySourceIfMatch=etag
+        )
+        return {"PartNumber": part_number, "ETag": response["CopyPartResult"]["ETag"]}
+
+    try:
+        ranges = list(enumerate(range(0, size, copy_part_size), start=1))
+        if part_pool is None:
+            parts = [copy_part(part_number, start) for part_number, start in ranges]
+        else:
+            parts = wait_for_futures([part_pool.submit(copy_part, part_number, start) for part_number, start in ranges])
+
+        s3.complete_multipart_upload(
+            Bucket=bucket,
+            Key=target_key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": sorted(parts, key=lambda p: p["PartNumber"])}
+        )
+    except BaseException:
+        s3.abort_multipart_upload(Bucket=bucket, Key=target_key, UploadId=upload_id)
+        raise
+
+    return len(parts)
+
+
+class ArchiveMover:
+    def __init__(
+        self,
+        s3,
+        bucket,
+        copy_part_size,
+        max_moves=4,
+        max_part_copies=8,
+        delete_batch_size=100,
+        engine=None,
+        metrics=None
+    ):
+        self.s3 = s3
+        self.bucket = bucket
+        self.copy_part_size = copy_part_size
+        self.delete_batch_size = max(1, min(delete_batch_size, 1000))
+        self.engine = engine
+        self.metrics = metrics
+        self.move_pool = ThreadPoolExecutor(max_workers=max(max_moves, 1), thread_name_prefix="archive-move")
+        self.part_pool = ThreadPoolExecutor(max_workers=max(max_part_copies, 1), thread_name_prefix="archive-part")
+        self.futures = []
+        self.pending_deletes = []
+        self.failed_deletes = 0
+        self._lock = threading.Lock()
+
+    def submit(self, zip_key, target_base_prefix, zip_name=None, fallback_prefix=None, status="archived"):
+        future = self.move_pool.submit(self._move, zip_key, target_base_prefix, zip_name, fallback_prefix, status)
+        with self._lock:
+            self.futures.append(future)
+        return future
+
+    def _copy(self, zip_key, target_base_prefix, zip_name):
+        target_key = build_move_key(zip_key, target_base_prefix)
+        log.info("Moving file from s3://%s/%s to s3://%s/%s", self.bucket, zip_key, self.bucket, target_key)
+
+        with metrics_phase(self.metrics, "archive", zip_name):
+            if self.engine is not None:
+                self.engine.run(self.engine.copy_object(self.bucket, zip_key, target_key))
+            else:
+                copy_s3_object(self.s3, self.bucket, zip_key, target_key, self.copy_part_size, self.part_pool)
+        return target_key
+
+    def _annotate(self, zip_name, status):
+        if self.metrics is not None:
+            self.metrics.annotate(zip_name, status=status)
+
+    def _move(self, zip_key, target_base_prefix, zip_name, fallback_prefix, status):
+        try:
+            target_key = self._copy(zip_key, target_base_prefix, zip_name)
+        except Exception:
+            if not fallback_prefix:
+                log.exception("Failed moving ZIP: %s", zip_key)
+                self._annotate(zip_name, status)
+                return False
+
+            log.exception("Failed archiving ZIP, moving it to rejected: %s", zip_key)
+            self._annotate(zip_name, "rejected")
+            try:
+                target_key = self._copy(zip_key, fallback_prefix, zip_name)
+            except Exception:
+                log.exception("Failed moving ZIP to rejected folder: %s", zip_key)
+                return False
+
+            log.info("Moved failed ZIP to rejected: s3://%s/%s", self.bucket, target_key)
+            self._queue_delete(zip_key)
+            return False
+
+        log.info("Moved ZIP: s3://%s/%s", self.bucket, target_key)
+        self._annotate(zip_name, status)
+        self._queue_delete(zip_key)
+        return True
+
+    def _queue_delete(self, zip_key):
+        with self._lock:
+            self.pending_deletes.append(zip_key)
+            if len(self.pending_deletes) < self.delete_batch_size:
+                return
+            batch, self.pending_deletes = self.pending_deletes, []
+        self._delete(batch)
+
+    def _delete(self, keys):
+        try:
+            response = self.s3.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True}
+            )
+            errors = response.get("Errors", [])
+        except ClientError as e:
+            log.warning("DeleteObjects failed, deleting %s moved source ZIP(s) one by one: %s", len(keys), e)
+            errors = [{"Key": key, "Message": str(e)} for key in keys]
+
+        # DeleteObjects reports SlowDown / InternalError per key; retry those keys on their own
+        failed = 0
+        for error in errors:
+            log.warning("Batch delete failed for s3://%s/%s (%s), retrying alone", self.bucket, error.get("Key"), error.get("Message"))
+            try:
+                self.s3.delete_object(Bucket=self.bucket, Key=error["Key"])
+            except ClientError as e:
+                log.error("Failed deleting moved source ZIP s3://%s/%s: %s", self.bucket, error["Key"], e)
+                failed += 1
+        with self._lock:
+            self.failed_deletes += failed
+        log.info(
+            "Deleted %s moved source ZIP(s) | batched=%s | retried=%s | failed=%s",
+            len(keys) - failed,
+            len(keys) - len(errors),
+            len(errors),
+            failed
+        )
+
+    def close(self):
+        self.move_pool.shutdown(wait=True)
+        ok = all(future.result() for future in self.futures)
+
+        with self._lock:
+            batch, self.pending_deletes = self.pending_deletes, []
+        if batch:
+            self._delete(batch)
+
+        self.part_pool.shutdown(wait=True)
+        return ok and not self.failed_deletes
+
+
 def build_small_file_key(target_folder, zip_name, member_name):
     clean_name = normalize_member_name(member_name)
     return f"{target_folder.rstrip('/')}/{today_folder()}/{zip_name}/{clean_name}"
 
 
-def build_large_file_key(target_folder, zip_name, file_base, part_number):
+def build_large_file_key(target_folder, zip_name, file_base, part_number, date_folder=None):
     return (
-        f"{target_folder.rstrip('/')}/{today_folder()}/{zip_name}/"
+        f"{target_folder.rstrip('/')}/{date_folder or today_folder()}/{zip_name}/"
         f"{file_base}/{file_base}_part{str(part_number).zfill(3)}.csv"
     )
 
@@ -193,186 +770,283 @@ def upload_small_file(
     s3,
     bucket,
     target_folder,
-    local_zip_path,
+    zip_source,
     zip_name,
-    member_name,
-    transfer_config
+    member,
+    transfer_config,
+    stored_copy_min_size=None,
+    copy_part_size=256 * 1024 * 1024,
+    zip_handles=None,
+    count_config=None,
+    output_codec=None,
+    metrics=None
 ):
-    with zipfile.ZipFile(local_zip_path) as zf:
-        data = zf.read(member_name)
-
+    member_name = member.filename
     clean_name = normalize_member_name(member_name)
-    out_key = build_small_file_key(target_folder, zip_name, member_name)
+    out_key = build_small_file_key(target_folder, zip_name, member_name) + output_suffix(output_codec)
+    counter = RecordCounter(**count_config) if count_config is not None else None
+
+    if can_copy_stored_member(zip_source, member, stored_copy_min_size):
+        with metrics_phase(metrics, "upload", zip_name, clean_name, member.file_size):
+            parts = copy_stored_member(s3, bucket, zip_source, member, out_key, copy_part_size)
+        log.info("Copied stored file server-side: %s (%s bytes, %s parts)", out_key, member.file_size, parts)
+
+        if counter is not None:
+            with zip_handle_scope(zip_handles, zip_source) as zf, \
+                    metrics_phase(metrics, "decompress", zip_name, clean_name, member.file_size):
+                count_member(zf, member, counter, transfer_config.multipart_chunksize)
+    else:
+        with zip_handle_scope(zip_handles, zip_source) as zf:
+            with zf.open(member) as stream:
+                started = time.perf_counter()
+                reader = upload_stream(
+                    s3, bucket, out_key, stream, transfer_config, counter, output_codec, member_metadata(member)
+                )
+                elapsed = time.perf_counter() - started
 
-    upload_bytes(s3, bucket, out_key, data, transfer_config)
-    log.info("Uploaded full file: %s", out_key)
+        if metrics is not None:
+            metrics.add("decompress", reader.seconds, reader.bytes, zip_name, clean_name)
+            metrics.add("upload", elapsed - reader.seconds, member.file_size, zip_name, clean_name)
 
-    return {
+        log.info("Uploaded full file: %s", out_key)
+
+    row = {
         "source_full_csv_file_name": clean_name,
         "target_full_csv_file_name": out_key,
         "is_split": False
     }
+    if counter is not None:
+        row.update(counter.summary())
+
+    return row
 
 
 def upload_small_files(
     s3,
     bucket,
     target_folder,
-    local_zip_path,
+    zip_source,
     zip_name,
     files_to_upload,
     max_threads,
-    transfer_config
+    transfer_config,
+    upload_pool=None,
+    stored_copy_min_size=None,
+    copy_part_size=256 * 1024 * 1024,
+    memory_budget=None,
+    count_config=None,
+    output_codec=None,
+    ledger=None,
+    metrics=None
 ):
-    results = []
-
-    log.info("Uploading full files in parallel")
-
-    with ThreadPoolExecutor(max_workers=max_threads) as pool:
-        futures = [
-            pool.submit(
-                upload_small_file,
-                s3,
-                bucket,
-                target_folder,
-                local_zip_path,
-                zip_name,
-                m.filename,
-                transfer_config
-            )
-            for m in files_to_upload
-        ]
+    log.info("Uploading full files in parallel | files=%s | threads=%s", len(files_to_upload), max_threads)
+
+    zip_handles = ZipHandlePool(lambda: open_zip(zip_source))
+    stream_config = streaming_transfer_config(transfer_config)
+
+    def upload(member):
+        row = upload_small_file(
+            s3,
+            bucket,
+            target_folder,
+            zip_source,
+            zip_name,
+            member,
+            stream_config,
+            stored_copy_min_size,
+            copy_part_size,
+            zip_handles,
+            count_config,
+            output_codec,
+            metrics
+        )
+        if ledger is not None:
+            ledger.record(member, [row])
+        return row
 
-        for future in as_completed(futures):
-            results.append(future.result())
+    try:
+        with upload_pool_scope(upload_pool, max_threads) as pool:
+            futures = []
+            for member in sorted(files_to_upload, key=lambda m: m.file_size, reverse=True):
+                if can_copy_stored_member(zip_source, member, stored_copy_min_size):
+                    nbytes = 0
+                else:
+                    nbytes = stream_buffer_size(member, stream_config, output_codec)
+                futures.append(submit_reserved(pool, memory_budget, nbytes, upload, member))
 
-    return results
+            return wait_for_futures(futures)
+    finally:
+        zip_handles.close()
 
 
+# Peak memory per split, independent of member size:
+#   read_block                                   current decompressed block
+#   + chunk_size + read_block                    chunk being filled
+#   + max_in_flight_chunks * (chunk_size + read_block)   chunks queued or uploading
+# (chunk_size = max(multipart_chunksize, 5 MB)). In-flight chunks also count
+# against the shared memory budget, so the process-wide ceiling stays memory_budget_mb.
 def split_large_file(
     s3,
     bucket,
     target_folder,
-    local_zip_path,
+    zip_source,
     zip_name,
     member_name,
     has_header,
     split_size,
     read_block,
     max_threads,
-    transfer_config
+    transfer_config,
+    upload_pool=None,
+    max_in_flight_chunks=None,
+    in_flight=None,
+    memory_budget=None,
+    quotechar=b'"',
+    count_rows=False,
+    output_codec=None,
+    checkpoint_folder="",
+    metrics=None,
+    engine=None
 ):
     clean_name = normalize_member_name(member_name)
     file_base = os.path.splitext(os.path.basename(clean_name))[0]
+    chunk_size = max(transfer_config.multipart_chunksize, MIN_MULTIPART_PART_SIZE)
+    in_flight = in_flight or threading.BoundedSemaphore(max_in_flight_chunks or max_threads)
 
-    header = b""
-    leftover = b""
-    current_part = bytearray()
-    part_number = 1
-    uploaded_rows = []
-
-    with zipfile.ZipFile(local_zip_path) as zf:
-        with zf.open(member_name) as stream:
-            if has_header:
-                first = bytearray()
-                while b"\n" not in first:
-                    chunk = stream.read(read_block)
-                    if not chunk:
-                        break
-                    first.extend(chunk)
-
-                pos = first.find(b"\n")
-                if pos != -1:
-                    header = bytes(first[:pos + 1])
-                    leftover = bytes(first[pos + 1:])
-                else:
-                    header = bytes(first)
-                    leftover = b""
+    with open_zip(zip_source) as zf:
+        member = zf.getinfo(member_name)
 
-            upload_futures = []
+        checkpoint = None
+        if checkpoint_folder:
+            checkpoint = SplitCheckpoint.load(
+                s3,
+                bucket,
+                build_checkpoint_key(checkpoint_folder, zip_name, clean_name),
+                split_identity(zip_name, zip_source.size, member, has_header, split_size, quotechar, count_rows, output_codec)
+            )
+            if checkpoint.complete:
+                log.info("Checkpoint complete, skipping split: %s (%s parts)", clean_name, len(checkpoint.parts))
+                return [part["row"] for part in checkpoint.parts]
+
+        date_folder = checkpoint.date_folder if checkpoint is not None else today_folder()
+        uploaded_rows = [part["row"] for part in checkpoint.parts] if checkpoint is not None else []
+        part_number = len(uploaded_rows)
+
+        open_parts = deque()
+        writer = None
+        part = None
+        counter = None
+        cutter = SplitCutter(split_size, quotechar)
+
+        def complete_ready(block):
+            while open_parts and (block or all(f.done() for f in open_parts[0][0].futures)):
+                w, p, c = open_parts[0]
+                w.complete()
+                open_parts.popleft()
+                if metrics is not None:
+                    metrics.add("upload", w.upload_seconds, w.output_bytes, zip_name, clean_name)
+                p["etag"] = w.etag
+                if c is not None:
+                    p["row"].update(c.summary())
+                if checkpoint is not None:
+                    checkpoint.add_part(p)
+
+        with zf.open(member) as stream, upload_pool_scope(upload_pool, max_threads) as pool, \
+                metrics_phase(metrics, "split", zip_name, clean_name, member.file_size):
+            try:
+                header, pending = read_header(stream, read_block, quotechar) if has_header else (b"", b"")
+                position = len(header)
+
+                resume_offset = checkpoint.resume_offset if checkpoint is not None else None
+                if resume_offset is not None:
+                    if resume_offset - position <= len(pending):
+                        pending = pending[resume_offset - position:]
+                    else:
+                        stream.seek(resume_offset)
+                        pending = b""
+                    position = resume_offset
+                    log.info("Resuming split of %s after part %s at offset %s", clean_name, part_number, resume_offset)
 
-            with ThreadPoolExecutor(max_workers=max_threads) as pool:
                 while True:
-                    block = stream.read(read_block)
-                    data = leftover + block
-                    leftover = b""
-
+                    if pending:
+                        block, pending = pending, b""
+                    else:
+                        with metrics_phase(metrics, "decompress", zip_name, clean_name) as record:
+                            block = stream.read(read_block)
+                            record["bytes"] = len(block)
                     if not block:
-                        current_part.extend(data)
                         break
 
-                    pos = data.rfind(b"\n")
-                    if pos == -1:
-                        leftover = data
-                        continue
-
-                    leftover = data[pos + 1:]
-                    data = data[:pos + 1]
-                    current_part.extend(data)
-
-                    if len(current_part) >= split_size:
-                        out_key = build_large_file_key(
-                            target_folder=target_folder,
-                            zip_name=zip_name,
-                            file_base=file_base,
-                            part_number=part_number
-                        )
-                        payload = header + bytes(current_part)
-
-                        upload_futures.append(
-                            pool.submit(
-                                upload_bytes,
-                                s3,
-                                bucket,
-                                out_key,
-                                payload,
-                                transfer_config
+                    view = memoryview(block)
+                    while view:
+                        offset = len(block) - len(view)
+
+                        if writer is None:
+                            part_number += 1
+                            out_key = build_large_file_key(
+                                target_folder=target_folder,
+                                zip_name=zip_name,
+                                file_base=file_base,
+                                part_number=part_number,
+                                date_folder=date_folder
+                            ) + output_suffix(output_codec)
+                            writer = SplitPartWriter(
+                                s3, bucket, out_key, pool, chunk_size, in_flight, memory_budget, header, output_codec,
+                                member_metadata(member), engine
                             )
-                        )
-
-                        uploaded_rows.append({
-                            "source_full_csv_file_name": clean_name,
-                            "target_full_csv_file_name": out_key,
-                            "is_split": True
-                        })
-
-                        log.info("Uploading split file: %s", out_key)
-                        part_number += 1
-                        current_part = bytearray()
-
-                if leftover:
-                    current_part.extend(leftover)
-
-                if current_part:
-                    out_key = build_large_file_key(
-                        target_folder=target_folder,
-                        zip_name=zip_name,
-                        file_base=file_base,
-                        part_number=part_number
-                    )
-                    payload = header + bytes(current_part)
-
-                    upload_futures.append(
-                        pool.submit(
-                            upload_bytes,
-                            s3,
-                            bucket,
-                            out_key,
-                            payload,
-                            transfer_config
-                        )
-                    )
-
-                    uploaded_rows.append({
-                        "source_full_csv_file_name": clean_name,
-                        "target_full_csv_file_name": out_key,
-                        "is_split": True
-                    })
-
-                    log.info("Uploading split file: %s", out_key)
-
-                for future in as_completed(upload_futures):
-                    future.result()
+                            if count_rows:
+                                counter = RecordCounter(has_header, quotechar)
+                                counter.update(header)
+                            part = {
+                                "part_number": part_number,
+                                "start_offset": position + offset,
+                                "row": {
+                                    "source_full_csv_file_name": clean_name,
+                                    "target_full_csv_file_name": out_key,
+                                    "is_split": True
+                                }
+                            }
+                            uploaded_rows.append(part["row"])
+
+                        cut = cutter.next_cut(block, offset)
+                        if cut == -1:
+                            writer.write(view)
+                            if counter is not None:
+                                counter.update(block, offset)
+                            break
+
+                        writer.write(view[:cut - offset])
+                        if counter is not None:
+                            counter.update(block, offset, cut)
+                        view = view[cut - offset:]
+
+                        part["end_offset"] = position + cut
+                        writer.close()
+                        log.info("Uploading split file: %s", writer.key)
+                        open_parts.append((writer, part, counter))
+                        writer = None
+                        complete_ready(block=False)
+
+                    position += len(block)
+
+                if writer is not None:
+                    part["end_offset"] = position
+                    writer.close()
+                    log.info("Uploading split file: %s", writer.key)
+                    open_parts.append((writer, part, counter))
+                    writer = None
+
+                complete_ready(block=True)
+
+                if checkpoint is not None:
+                    checkpoint.mark_complete()
+
+            except BaseException:
+                for w, _, _ in open_parts:
+                    w.abort()
+                if writer is not None:
+                    writer.abort()
+                raise
 
     return uploaded_rows
 
@@ -388,86 +1062,665 @@ def process_zip_file(
     split_size,
     read_block,
     max_threads,
-    transfer_config
+    transfer_config,
+    reader_config=None,
+    split_config=None,
+    upload_pool=None,
+    stored_copy_min_size=None,
+    copy_part_size=256 * 1024 * 1024,
+    memory_budget=None,
+    max_in_flight_chunks=None,
+    in_flight=None,
+    max_parallel_large_members=1,
+    quotechar=b'"',
+    count_folder="",
+    count_format="csv",
+    output_codec=None,
+    checkpoint_folder="",
+    ledger_folder="",
+    force=False,
+    metrics=None,
+    engine=None
 ):
     log.info("Processing ZIP: %s", zip_key)
 
     zip_name = os.path.splitext(os.path.basename(zip_key))[0]
-    local_zip_path = os.path.join(os.getcwd(), os.path.basename(zip_key))
 
-    try:
+    with metrics_phase(metrics, "head", zip_name):
         ensure_s3_object_exists(s3, bucket, zip_key)
+        zip_source = open_zip_source(s3, bucket, zip_key, reader_config)
+
+    if metrics is not None:
+        metrics.annotate(zip_name, zip_key=zip_key, size=zip_source.size, strategy=zip_source.strategy)
+    log.info("Reading ZIP with %s reads: s3://%s/%s (%s bytes)", zip_source.strategy, bucket, zip_key, zip_source.size)
+
+    count_config = {"has_header": has_header, "quotechar": quotechar} if count_folder else None
+    manifest_rows = []
+
+    ledger = None
+    if ledger_folder:
+        ledger = ZipLedger.load(
+            s3,
+            bucket,
+            build_ledger_key(ledger_folder, zip_name),
+            zip_source.etag,
+            zip_source.size,
+            {
+                "target_folder": target_folder,
+                "file_config": file_config,
+                "split_enabled": split_enabled,
+                "split_size": split_size,
+                "split_config": split_config or {},
+                "has_header": has_header,
+                "quotechar": quotechar.decode("utf-8"),
+                "count_rows": count_config is not None,
+                "output_compression": output_codec.name if output_codec else "none"
+            },
+            force
+        )
+        if ledger.complete:
+            log.info("ZIP already processed with the same ETag and settings, skipping: %s", zip_key)
+            zip_source.close()
+            return
 
-        log.info("Downloading ZIP to current working directory: %s", local_zip_path)
-        s3.download_file(bucket, zip_key, local_zip_path)
+    completed = False
+    try:
+        with metrics_phase(metrics, "central_directory", zip_name):
+            csv_files = get_csv_files(zip_source, file_config)
 
-        csv_files = get_csv_files(local_zip_path, file_config)
+        if ledger is not None:
+            done_rows, csv_files = skip_processed_members(ledger, csv_files, upload_pool, max_threads)
+            manifest_rows += done_rows
 
         if split_enabled:
-            small_files = [m for m in csv_files if m.file_size < split_size]
-            large_files = [m for m in csv_files if m.file_size >= split_size]
+            split_sizes = plan_member_splits(csv_files, split_size, split_config)
+            small_files = [m for m in csv_files if split_sizes[m.filename] is None]
+            large_files = [m for m in csv_files if split_sizes[m.filename] is not None]
 
             log.info("Split enabled | Small files: %s | Large files: %s", len(small_files), len(large_files))
 
             if small_files:
-                upload_small_files(
+                manifest_rows += upload_small_files(
                     s3=s3,
                     bucket=bucket,
                     target_folder=target_folder,
-                    local_zip_path=local_zip_path,
+                    zip_source=zip_source,
                     zip_name=zip_name,
                     files_to_upload=small_files,
                     max_threads=max_threads,
-                    transfer_config=transfer_config
+                    transfer_config=transfer_config,
+                    upload_pool=upload_pool,
+                    stored_copy_min_size=stored_copy_min_size,
+                    copy_part_size=copy_part_size,
+                    memory_budget=memory_budget,
+                    count_config=count_config,
+                    output_codec=output_codec,
+                    ledger=ledger,
+                    metrics=metrics
                 )
 
             if large_files:
                 log.info("Processing large files with splitting")
-                for member in large_files:
+
+                def split_member(member):
                     log.info("Splitting file: %s", member.filename)
-                    split_large_file(
+                    member_rows = split_large_file(
                         s3=s3,
                         bucket=bucket,
                         target_folder=target_folder,
-                        local_zip_path=local_zip_path,
+                        zip_source=zip_source,
                         zip_name=zip_name,
                         member_name=member.filename,
                         has_header=has_header,
-                        split_size=split_size,
+                        split_size=split_sizes[member.filename],
                         read_block=read_block,
                         max_threads=max_threads,
-                        transfer_config=transfer_config
+                        transfer_config=transfer_config,
+                        upload_pool=upload_pool,
+                        max_in_flight_chunks=max_in_flight_chunks,
+                        in_flight=in_flight,
+                        memory_budget=memory_budget,
+                        quotechar=quotechar,
+                        count_rows=count_config is not None,
+                        output_codec=output_codec,
+                        checkpoint_folder=checkpoint_folder,
+                        metrics=metrics,
+                        engine=engine
                     )
+                    if ledger is not None:
+                        ledger.record(member, member_rows)
+                    return member_rows
+
+                if max_parallel_large_members <= 1 or len(large_files) == 1:
+                    for member in large_files:
+                        manifest_rows += split_member(member)
+                else:
+                    log.info(
+                        "Splitting %s large files with max_parallel_large_members=%s",
+                        len(large_files),
+                        max_parallel_large_members
+                    )
+                    with ThreadPoolExecutor(max_workers=min(max_parallel_large_members, len(large_files))) as split_pool:
+                        futures = {
+                            member.filename: split_pool.submit(split_member, member)
+                            for member in sorted(large_files, key=lambda m: m.file_size, reverse=True)
+                        }
+                        wait_for_futures(list(futures.values()))
+                    for member in large_files:
+                        manifest_rows += futures[member.filename].result()
         else:
             log.info("Split disabled | Uploading selected CSV files as full files")
-            upload_small_files(
+            manifest_rows += upload_small_files(
                 s3=s3,
                 bucket=bucket,
                 target_folder=target_folder,
-                local_zip_path=local_zip_path,
+                zip_source=zip_source,
                 zip_name=zip_name,
                 files_to_upload=csv_files,
                 max_threads=max_threads,
-                transfer_config=transfer_config
+                transfer_config=transfer_config,
+                upload_pool=upload_pool,
+                stored_copy_min_size=stored_copy_min_size,
+                copy_part_size=copy_part_size,
+                memory_budget=memory_budget,
+                count_config=count_config,
+                output_codec=output_codec,
+                ledger=ledger,
+                metrics=metrics
             )
 
+        if count_folder:
+            write_count_manifest(s3, bucket, count_folder, zip_key, zip_name, manifest_rows, count_format)
+
+        if checkpoint_folder:
+            delete_checkpoints(s3, bucket, checkpoint_folder, zip_name)
+
+        completed = True
+
     finally:
-        if os.path.exists(local_zip_path):
-            os.remove(local_zip_path)
-            log.info("Deleted local ZIP file: %s", local_zip_path)
+        if ledger is not None:
+            ledger.save(completed)
+
+        stats = zip_source.stats
+        log.info(
+            "ZIP reads (%s) for %s | requests=%s | bytes=%s | object_size=%s",
+            zip_source.strategy,
+            zip_key,
+            stats["requests"],
+            stats["bytes"],
+            zip_source.size
+        )
+        if metrics is not None:
+            metrics.add("download", stats["seconds"], stats["bytes"], zip_name)
+        zip_source.close()
+
+
+def process_and_archive_zip(
+    s3,
+    bucket,
+    target_folder,
+    rejected_folder,
+    archive_enabled,
+    archive_folder,
+    zip_key,
+    file_config,
+    split_enabled,
+    has_header,
+    split_size,
+    read_block,
+    max_threads,
+    transfer_config,
+    reader_config=None,
+    split_config=None,
+    upload_pool=None,
+    stored_copy_min_size=None,
+    copy_part_size=256 * 1024 * 1024,
+    memory_budget=None,
+    max_in_flight_chunks=None,
+    in_flight=None,
+    max_parallel_large_members=1,
+    quotechar=b'"',
+    count_folder="",
+    count_format="csv",
+    output_codec=None,
+    checkpoint_folder="",
+    ledger_folder="",
+    force=False,
+    metrics=None,
+    engine=None,
+    archiver=None
+):
+    zip_name = os.path.splitext(os.path.basename(zip_key))[0]
+
+    try:
+        process_zip_file(
+            s3=s3,
+            bucket=bucket,
+            target_folder=target_folder,
+            zip_key=zip_key,
+            file_config=file_config,
+            split_enabled=split_enabled,
+            has_header=has_header,
+            split_size=split_size,
+            read_block=read_block,
+            max_threads=max_threads,
+            transfer_config=transfer_config,
+            reader_config=reader_config,
+            split_config=split_config,
+            upload_pool=upload_pool,
+            stored_copy_min_size=stored_copy_min_size,
+            copy_part_size=copy_part_size,
+            memory_budget=memory_budget,
+            max_in_flight_chunks=max_in_flight_chunks,
+            in_flight=in_flight,
+            max_parallel_large_members=max_parallel_large_members,
+            quotechar=quotechar,
+            count_folder=count_folder,
+            count_format=count_format,
+            output_codec=output_codec,
+            checkpoint_folder=checkpoint_folder,
+            ledger_folder=ledger_folder,
+            force=force,
+            metrics=metrics,
+            engine=engine
+        )
+
+        if archive_enabled and archiver is not None:
+            archiver.submit(zip_key, archive_folder, zip_name, fallback_prefix=rejected_folder)
+            log.info("Queued archive move in background: s3://%s/%s", bucket, zip_key)
+            return True
+
+        if archive_enabled:
+            with metrics_phase(metrics, "archive", zip_name):
+                archived_key = move_s3_object(
+                    s3=s3,
+                    bucket=bucket,
+                    source_key=zip_key,
+                    target_base_prefix=archive_folder,
+                    transfer_config=transfer_config,
+                    engine=engine
+                )
+            log.info("Archived ZIP successfully: s3://%s/%s", bucket, archived_key)
+        else:
+            log.info("Archive disabled | Source ZIP left in place: s3://%s/%s", bucket, zip_key)
+
+        if metrics is not None:
+            metrics.annotate(zip_name, status="archived")
+        return True
+
+    except SystemExit:
+        raise
+    except Exception:
+        log.exception("Failed processing ZIP: %s", zip_key)
+
+        if archiver is not None:
+            archiver.submit(zip_key, rejected_folder, zip_name, status="rejected")
+            log.info("Queued reject move in background: s3://%s/%s", bucket, zip_key)
+            return False
+
+        try:
+            ensure_s3_object_exists(s3, bucket, zip_key)
+
+            with metrics_phase(metrics, "archive", zip_name):
+                rejected_key = move_s3_object(
+                    s3=s3,
+                    bucket=bucket,
+                    source_key=zip_key,
+                    target_base_prefix=rejected_folder,
+                    transfer_config=transfer_config,
+                    engine=engine
+                )
+            log.info("Moved failed ZIP to rejected: s3://%s/%s", bucket, rejected_key)
+
+        except SystemExit:
+            raise
+        except Exception:
+            log.exception("Failed moving ZIP to rejected folder: %s", zip_key)
+
+        if metrics is not None:
+            metrics.annotate(zip_name, status="rejected")
+        return False
+
+
+def split_peak_memory(read_block, chunk_size, max_in_flight_chunks, concurrent_splits=1):
+    return concurrent_splits * (2 * read_block + chunk_size) + max_in_flight_chunks * (chunk_size + read_block)
+
+
+def plan_zip(
+    s3,
+    bucket,
+    zip_key,
+    file_config,
+    split_enabled,
+    split_size,
+    read_block,
+    transfer_config,
+    reader_config=None,
+    split_config=None,
+    stored_copy_min_size=None,
+    max_threads=1,
+    max_in_flight_chunks=1,
+    max_parallel_large_members=1,
+    output_codec=None
+):
+    zip_source = None
+    try:
+        ensure_s3_object_exists(s3, bucket, zip_key)
+        zip_source = open_zip_source(s3, bucket, zip_key, reader_config)
+        csv_files = get_csv_files(zip_source, file_config)
+    except (Exception, SystemExit) as e:
+        if isinstance(e, SystemExit):
+            # Missing ZIP or no requested members: the cause is already logged and the
+            # run would reject this ZIP, so plan the rest rather than exit mid-plan.
+            log.error("ZIP failed validation: %s", zip_key)
+            error = "failed validation"
+        else:
+            log.exception("Failed reading central directory: %s", zip_key)
+            error = str(e)
+        if zip_source is not None:
+            zip_source.close()
+        return {"zip_key": zip_key, "error": error}
+
+    split_sizes = plan_member_splits(csv_files, split_size, split_config) if split_enabled else {}
+    chunk_size = max(transfer_config.multipart_chunksize, MIN_MULTIPART_PART_SIZE)
+
+    members = []
+    for member in csv_files:
+        member_split_size = split_sizes.get(member.filename)
+        if member_split_size is not None:
+            mode = "split"
+            parts = -(-member.file_size // member_split_size)
+            memory = split_peak_memory(read_block, chunk_size, max_in_flight_chunks)
+        elif can_copy_stored_member(zip_source, member, stored_copy_min_size):
+            mode, parts, memory = "stored_copy", 1, 0
+        else:
+            mode, parts, memory = "stream", 1, stream_buffer_size(member, transfer_config, output_codec)
+
+        members.append({
+            "member": normalize_member_name(member.filename),
+            "mode": mode,
+            "compressed_bytes": member.compress_size,
+            "uncompressed_bytes": member.file_size,
+            "split_size": member_split_size,
+            "parts": parts,
+            "peak_memory_bytes": memory,
+            "upload_bytes": 0 if mode == "stored_copy" else member.file_size
+        })
+
+    small_memory = sorted((m["peak_memory_bytes"] for m in members if m["mode"] != "split"), reverse=True)
+    large_count = sum(1 for m in members if m["mode"] == "split")
+    large_memory = 0
+    if large_count:
+        large_memory = split_peak_memory(
+            read_block,
+            chunk_size,
+            max_in_flight_chunks,
+            min(max(max_parallel_large_members, 1), large_count)
+        )
+
+    stats = zip_source.stats
+    zip_source.close()
+    return {
+        "zip_key": zip_key,
+        "zip_bytes": zip_source.size,
+        "central_directory_reads": stats["requests"],
+        "central_directory_bytes": stats["bytes"],
+        "members": members,
+        "parts": sum(m["parts"] for m in members),
+        "uncompressed_bytes": sum(m["uncompressed_bytes"] for m in members),
+        "upload_bytes": sum(m["upload_bytes"] for m in members),
+        "server_side_copy_bytes": sum(m["uncompressed_bytes"] for m in members if m["mode"] == "stored_copy"),
+        "peak_memory_bytes": max(sum(small_memory[:max(max_threads, 1)]), large_memory)
+    }
+
+
+def summarize_plan(zip_plans, max_parallel_zips=1, memory_budget=None, output_codec=None):
+    planned = [p for p in zip_plans if "error" not in p]
+    peaks = sorted((p["peak_memory_bytes"] for p in planned), reverse=True)
+    peak = sum(peaks[:max(max_parallel_zips, 1)])
+    budget = memory_budget.limit_bytes if memory_budget is not None else None
+
+    for zip_plan in planned:
+        log.info(
+            "Plan %s | members=%s | parts=%s | uncompressed_bytes=%s | upload_bytes=%s | peak_memory_bytes=%s",
+            zip_plan["zip_key"],
+            len(zip_plan["members"]),
+            zip_plan["parts"],
+            zip_plan["uncompressed_bytes"],
+            zip_plan["upload_bytes"],
+            zip_plan["peak_memory_bytes"]
+        )
+    if budget is not None and peak > budget:
+        log.warning("Estimated peak memory %s bytes exceeds memory_budget_mb; uploads will be throttled to %s bytes", peak, budget)
+
+    return {
+        "zips": zip_plans,
+        "totals": {
+            "zips": len(zip_plans),
+            "failed": len(zip_plans) - len(planned),
+            "parts": sum(p["parts"] for p in planned),
+            "uncompressed_bytes": sum(p["uncompressed_bytes"] for p in planned),
+            "upload_bytes": sum(p["upload_bytes"] for p in planned),
+            "server_side_copy_bytes": sum(p["server_side_copy_bytes"] for p in planned),
+            "output_compression": output_codec.name if output_codec is not None else "none",
+            "peak_memory_bytes": peak if budget is None else min(peak, budget),
+            "unthrottled_peak_memory_bytes": peak,
+            "memory_budget_bytes": budget
+        }
+    }
+
+
+def process_zip_or_reject(zip_key, **zip_kwargs):
+    try:
+        return process_and_archive_zip(zip_key=zip_key, **zip_kwargs)
+    except SystemExit:
+        log.error("ZIP failed validation, moving it to rejected: %s", zip_key)
+
+    s3 = zip_kwargs["s3"]
+    bucket = zip_kwargs["bucket"]
+    metrics = zip_kwargs.get("metrics")
+    zip_name = os.path.splitext(os.path.basename(zip_key))[0]
+
+    with metrics_phase(metrics, "archive", zip_name):
+        rejected_key = move_s3_object(
+            s3=s3,
+            bucket=bucket,
+            source_key=zip_key,
+            target_base_prefix=zip_kwargs["rejected_folder"],
+            transfer_config=zip_kwargs["transfer_config"],
+            engine=zip_kwargs.get("engine")
+        )
+    log.info("Moved failed ZIP to rejected: s3://%s/%s", bucket, rejected_key)
+
+    if metrics is not None:
+        metrics.annotate(zip_name, status="rejected")
+    return False
+
+
+def parse_zip_notifications(body, bucket, source_folder):
+    event = json.loads(body)
+    if "Message" in event and "Records" not in event:
+        event = json.loads(event["Message"])
+
+    objects = []
+    if event.get("detail-type") == "Object Created":
+        detail = event.get("detail", {})
+        objects.append((detail.get("bucket", {}).get("name"), detail.get("object", {}).get("key", "")))
+    for record in event.get("Records", []):
+        if not str(record.get("eventName", "")).startswith("ObjectCreated"):
+            continue
+        s3_info = record.get("s3", {})
+        objects.append((s3_info.get("bucket", {}).get("name"), unquote_plus(s3_info.get("object", {}).get("key", ""))))
+
+    zip_keys = []
+    prefix = source_folder.rstrip("/") + "/"
+    for event_bucket, key in objects:
+        if event_bucket != bucket:
+            log.warning("Ignoring notification for another bucket: s3://%s/%s", event_bucket, key)
+        elif key.startswith(prefix) and key.lower().endswith(".zip"):
+            zip_keys.append(key)
+        else:
+            log.info("Ignoring notification outside %s*.zip: %s", prefix, key)
+    return zip_keys
+
+
+def s3_object_exists(s3, bucket, key):
+    try:
+        s3.head_object(Bucket=bucket, Key=key)
+        return True
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code", "") in {"404", "NoSuchKey", "NotFound"}:
+            return False
+        raise
+
+
+class VisibilityHeartbeat:
+    def __init__(self, sqs, queue_url, visibility_timeout):
+        self.sqs = sqs
+        self.queue_url = queue_url
+        self.visibility_timeout = visibility_timeout
+        self.receipts = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sqs-visibility", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def track(self, receipt_handle):
+        with self._lock:
+            self.receipts.add(receipt_handle)
+
+    def untrack(self, receipt_handle):
+        with self._lock:
+            self.receipts.discard(receipt_handle)
+
+    def _run(self):
+        while not self._stop.wait(max(self.visibility_timeout / 2, 1)):
+            with self._lock:
+                receipts = list(self.receipts)
+            for receipt_handle in receipts:
+                try:
+                    self.sqs.change_message_visibility(
+                        QueueUrl=self.queue_url,
+                        ReceiptHandle=receipt_handle,
+                        VisibilityTimeout=self.visibility_timeout
+                    )
+                except ClientError:
+                    log.exception("Failed extending message visibility")
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def handle_queue_message(sqs, queue_url, s3, bucket, source_folder, message, heartbeat, process_zip, active_keys, active_lock):
+    receipt_handle = message["ReceiptHandle"]
+    heartbeat.track(receipt_handle)
+    try:
+        for zip_key in parse_zip_notifications(message["Body"], bucket, source_folder):
+            with active_lock:
+                if zip_key in active_keys:
+                    log.info("ZIP already in progress, leaving duplicate notification for redelivery: %s", zip_key)
+                    return
+                active_keys.add(zip_key)
+            try:
+                if not s3_object_exists(s3, bucket, zip_key):
+                    log.info("ZIP no longer in source, already handled: s3://%s/%s", bucket, zip_key)
+                    continue
+                process_zip(zip_key)
+            finally:
+                with active_lock:
+                    active_keys.discard(zip_key)
+
+        sqs.delete_message(QueueUrl=queue_url, ReceiptHandle=receipt_handle)
+
+    except (Exception, SystemExit):
+        log.exception("Failed handling queue message %s, leaving it for redelivery", message.get("MessageId"))
+    finally:
+        heartbeat.untrack(receipt_handle)
+
+
+def run_unzip_daemon(
+    sqs,
+    queue_url,
+    s3,
+    bucket,
+    source_folder,
+    process_zip,
+    max_parallel_zips,
+    wait_time_seconds,
+    visibility_timeout,
+    stop_event
+):
+    log.info(
+        "Daemon mode | queue=%s | max_parallel_zips=%s | visibility_timeout=%s",
+        queue_url,
+        max_parallel_zips,
+        visibility_timeout
+    )
+
+    heartbeat = VisibilityHeartbeat(sqs, queue_url, visibility_timeout)
+    heartbeat.start()
+    pending = set()
+    active_keys = set()
+    active_lock = threading.Lock()
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_parallel_zips) as zip_pool:
+            while not stop_event.is_set():
+                free = max_parallel_zips - len(pending)
+                if free <= 0:
+                    _, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    continue
+
+                response = sqs.receive_message(
+                    QueueUrl=queue_url,
+                    MaxNumberOfMessages=min(free, 10),
+                    WaitTimeSeconds=wait_time_seconds,
+                    VisibilityTimeout=visibility_timeout
+                )
+                for message in response.get("Messages", []):
+                    pending.add(zip_pool.submit(
+                        handle_queue_message,
+                        sqs,
+                        queue_url,
+                        s3,
+                        bucket,
+                        source_folder,
+                        message,
+                        heartbeat,
+                        process_zip,
+                        active_keys,
+                        active_lock
+                    ))
+                pending = {f for f in pending if not f.done()}
+
+            if pending:
+                log.info("Shutting down | waiting for %s in-flight message(s)", len(pending))
+            wait(pending)
+    finally:
+        heartbeat.stop()
+
+    log.info("Daemon stopped")
 
 
 def main():
-    if len(sys.argv) != 3:
+    if len(sys.argv) not in (3, 4) or (len(sys.argv) == 4 and sys.argv[3] != "--plan"):
         print("Usage:")
-        print("python3 unzip_rom.py <s3_bucket> <parameter_file_location>")
+        print("python3 unzip_rom.py <s3_bucket> <parameter_file_location> [--plan]")
         sys.exit(1)
 
     bucket = sys.argv[1]
     parameter_file_location = sys.argv[2]
+    plan_mode = len(sys.argv) == 4
 
+    engine = None
     try:
-        params = load_params_from_s3(bucket, parameter_file_location)
+        if parameter_file_location.startswith("file://"):
+            params = load_params_from_file(parameter_file_location[len("file://"):])
+        else:
+            params = load_params_from_s3(bucket, parameter_file_location)
 
         source_folder = normalize_prefix(params["s3_source_files_location"])
         target_folder = normalize_prefix(params["s3_target_files_location"])
@@ -476,6 +1729,9 @@ def main():
         archive_config = params.get("archive", {})
         archive_enabled = parse_bool(archive_config.get("archive"), default=True)
         archive_folder = normalize_prefix(archive_config.get("archive_files_location", "")) if archive_enabled else ""
+        archive_in_background = parse_bool(archive_config.get("background"), default=True)
+        archive_max_parallel_moves = int(archive_config.get("max_parallel_moves", 4))
+        archive_delete_batch_size = int(archive_config.get("delete_batch_size", 100))
 
         zip_files_config = params["zip_files"]
         file_config = zip_files_config.get("file", {})
@@ -483,20 +1739,113 @@ def main():
 
         has_header = parse_bool(params.get("has_header", True), default=True)
 
+        storage = str(params.get("storage", "s3")).strip().lower()
+        local_storage_root = str(params.get("local_storage_root", "")).strip()
+
+        daemon_config = params.get("daemon", {})
+        daemon_enabled = parse_bool(daemon_config.get("enabled"), default=False)
+        queue_url = str(daemon_config.get("queue_url", "")).strip()
+        queue_wait_seconds = int(daemon_config.get("wait_time_seconds", 20))
+        queue_visibility_timeout = int(daemon_config.get("visibility_timeout", 600))
+
         split_size_mb = int(params.get("split_size_mb", 250))
+        split_strategy = str(params.get("split_strategy", "fixed")).strip().lower()
+        split_min_mb = int(params.get("split_min_mb", 100))
+        split_max_mb = int(params.get("split_max_mb", split_size_mb))
+        split_target_parts = int(params.get("split_target_parts", 0))
         read_block_mb = int(params.get("read_block_mb", 16))
         max_threads = int(params.get("max_threads", min((os.cpu_count() or 4) * 2, 12)))
+        max_parallel_zips = int(params.get("max_parallel_zips", 1))
+        range_block_mb = int(params.get("range_block_mb", 1))
+        range_read_ahead_blocks = int(params.get("range_read_ahead_blocks", 8))
+        range_cache_blocks = int(params.get("range_cache_blocks", 64))
+        stored_copy_enabled = parse_bool(params.get("stored_copy"), default=True)
+        stored_copy_min_mb = int(params.get("stored_copy_min_mb", 5))
+        copy_part_size_mb = int(params.get("copy_part_size_mb", 256))
+        memory_budget_mb = int(params.get("memory_budget_mb", 1024))
+        max_parallel_large_members = int(params.get("max_parallel_large_members", 1))
+        s3_engine = str(params.get("s3_engine", "threads")).strip().lower()
+        async_max_concurrency = int(params.get("async_max_concurrency", 256))
+        max_in_flight_chunks = int(params.get(
+            "max_in_flight_chunks",
+            async_max_concurrency if s3_engine == "async" else max_threads
+        ))
+        # csv_quotechar: split cuts track quote parity so a part never ends inside a
+        # quoted field. That scan reads every byte: ~1.7 GB/s on quote-dense CSV
+        # (bench_split_scan.py), still several times inflate speed, so splits stay
+        # inflate-bound. "" cuts at the next newline instead; only for data with no
+        # quoted newlines.
+        quotechar = str(params.get("csv_quotechar", '"')).encode("utf-8")
+        count_folder = normalize_prefix(params.get("count_location", ""))
+        count_format = str(params.get("count_format", "csv")).strip().lower()
+        output_compression = params.get("output_compression", "none")
+        checkpoint_folder = normalize_prefix(params.get("checkpoint_location", ""))
+        ledger_folder = normalize_prefix(params.get("ledger_location", ""))
+        force = parse_bool(params.get("force"), default=False)
+        metrics_folder = normalize_prefix(params.get("metrics_location", ""))
+        statsd_host = str(params.get("statsd_host", "")).strip()
+        statsd_port = int(params.get("statsd_port", 8125))
+        statsd_prefix = str(params.get("statsd_prefix", "unzip")).strip()
+        metrics_sample_seconds = float(params.get("metrics_sample_seconds", 5))
+        output_compression_level = params.get("output_compression_level")
         max_pool_connections = int(params.get("max_pool_connections", max(50, max_threads * 4)))
         transfer_max_concurrency = int(params.get("transfer_max_concurrency", max_threads))
 
         split_size = split_size_mb * 1024 * 1024
+        split_config = {
+            "strategy": split_strategy,
+            "min_size": split_min_mb * 1024 * 1024,
+            "max_size": split_max_mb * 1024 * 1024,
+            "target_parts": split_target_parts
+        }
         read_block = read_block_mb * 1024 * 1024
+        copy_part_size = max(copy_part_size_mb, 5) * 1024 * 1024
 
         s3_config = Config(
             max_pool_connections=max_pool_connections,
             retries={"max_attempts": 5, "mode": "adaptive"}
         )
-        s3 = boto3.client("s3", config=s3_config)
+        if storage not in ("s3", "local"):
+            log.error("storage must be s3 or local, got %s", storage)
+            sys.exit(1)
+
+        if storage == "local":
+            if not local_storage_root:
+                log.error("local_storage_root is required when storage is local")
+                sys.exit(1)
+            if s3_engine == "async":
+                log.error("s3_engine=async is only supported with storage=s3")
+                sys.exit(1)
+            s3 = LocalObjectStore(local_storage_root)
+            log.info("Storage: local | root=%s", s3.root)
+        else:
+            s3 = boto3.client("s3", config=s3_config)
+
+        if s3_engine not in ("threads", "async"):
+            log.error("s3_engine must be threads or async, got %s", s3_engine)
+            sys.exit(1)
+
+        if s3_engine == "async":
+            try:
+                engine = AsyncS3Engine(async_max_concurrency, copy_part_size)
+            except ValueError as e:
+                log.error("%s", e)
+                sys.exit(1)
+            log.info("S3 engine: async | async_max_concurrency=%s", async_max_concurrency)
+
+        metrics = None
+        if metrics_folder or statsd_host:
+            statsd = StatsdClient(statsd_host, statsd_port, statsd_prefix) if statsd_host else None
+            metrics = PipelineMetrics(statsd)
+            if storage == "s3":
+                s3.meta.events.register("after-call.s3", metrics.on_s3_call)
+            if engine is not None:
+                engine.client.meta.events.register("after-call.s3", metrics.on_s3_call)
+            log.info(
+                "Metrics enabled | metrics_location=%s | statsd=%s",
+                metrics_folder or "-",
+                f"{statsd_host}:{statsd_port}" if statsd_host else "-"
+            )
 
         transfer_config = TransferConfig(
             multipart_threshold=8 * 1024 * 1024,
@@ -505,75 +1854,194 @@ def main():
             use_threads=True
         )
 
+        stored_copy_min_size = stored_copy_min_mb * 1024 * 1024 if stored_copy_enabled else None
+        memory_budget = MemoryBudget(memory_budget_mb * 1024 * 1024) if memory_budget_mb > 0 else None
+
+        reader_config = {
+            "block_size": range_block_mb * 1024 * 1024,
+            "read_ahead_blocks": range_read_ahead_blocks,
+            "cache_blocks": range_cache_blocks
+        }
+
         log.info(
-            "S3 config | max_threads=%s | max_pool_connections=%s | transfer_max_concurrency=%s",
+            "S3 config | max_threads=%s | max_parallel_zips=%s | max_pool_connections=%s | transfer_max_concurrency=%s | memory_budget_mb=%s",
             max_threads,
+            max_parallel_zips,
             max_pool_connections,
-            transfer_max_concurrency
+            transfer_max_concurrency,
+            memory_budget_mb
         )
 
-        zip_keys = get_zip_keys(s3, bucket, source_folder, zip_files_config)
+        if daemon_enabled and not queue_url:
+            log.error("daemon.queue_url is required when daemon.enabled is true")
+            sys.exit(1)
 
-        if not zip_keys:
-            log.info("No zip files found. Exiting successfully.")
-            sys.exit(0)
+        zip_keys = []
+        if plan_mode or not daemon_enabled:
+            with metrics_phase(metrics, "list"):
+                zip_keys = get_zip_keys(s3, bucket, source_folder, zip_files_config, engine)
 
-        failed = False
+            if not zip_keys:
+                log.info("No zip files found. Exiting successfully.")
+                sys.exit(0)
 
-        for zip_key in zip_keys:
-            try:
-                process_zip_file(
+        if archive_enabled and not archive_folder:
+            log.error("archive.archive_files_location is required when archive.archive is true")
+            sys.exit(1)
+
+        if split_strategy not in SPLIT_STRATEGIES:
+            log.error("split_strategy must be one of %s, got %s", ", ".join(SPLIT_STRATEGIES), split_strategy)
+            sys.exit(1)
+
+        if split_strategy == "adaptive" and not 0 < split_min_mb <= split_max_mb:
+            log.error("split_min_mb must be positive and not above split_max_mb (%s > %s)", split_min_mb, split_max_mb)
+            sys.exit(1)
+
+        if count_format not in ("csv", "json"):
+            log.error("count_format must be csv or json, got %s", count_format)
+            sys.exit(1)
+
+        try:
+            output_codec = load_output_codec(
+                output_compression,
+                int(output_compression_level) if output_compression_level is not None else None
+            )
+        except ValueError as e:
+            log.error("%s", e)
+            sys.exit(1)
+
+        if output_codec is not None and stored_copy_min_size is not None:
+            log.info("output_compression=%s | stored members are compressed instead of copied server-side", output_codec.name)
+            stored_copy_min_size = None
+
+        if plan_mode:
+            zip_plans = [
+                plan_zip(
                     s3=s3,
                     bucket=bucket,
-                    target_folder=target_folder,
                     zip_key=zip_key,
                     file_config=file_config,
                     split_enabled=split_enabled,
-                    has_header=has_header,
                     split_size=split_size,
                     read_block=read_block,
+                    transfer_config=transfer_config,
+                    reader_config=reader_config,
+                    split_config=split_config,
+                    stored_copy_min_size=stored_copy_min_size,
                     max_threads=max_threads,
-                    transfer_config=transfer_config
+                    max_in_flight_chunks=max_in_flight_chunks,
+                    max_parallel_large_members=max_parallel_large_members,
+                    output_codec=output_codec
                 )
+                for zip_key in zip_keys
+            ]
+            plan = summarize_plan(zip_plans, max_parallel_zips, memory_budget, output_codec)
+            print(json.dumps(plan, indent=2))
+            sys.exit(1 if plan["totals"]["failed"] else 0)
 
-                if archive_enabled:
-                    if not archive_folder:
-                        log.error("archive.archive_files_location is required when archive.archive is true")
-                        sys.exit(1)
+        failed = False
 
-                    archived_key = move_s3_object(
-                        s3=s3,
-                        bucket=bucket,
-                        source_key=zip_key,
-                        target_base_prefix=archive_folder,
-                        transfer_config=transfer_config
-                    )
-                    log.info("Archived ZIP successfully: s3://%s/%s", bucket, archived_key)
-                else:
-                    log.info("Archive disabled | Source ZIP left in place: s3://%s/%s", bucket, zip_key)
+        with TrackedThreadPool(max_workers=max_threads) as upload_pool:
+            archiver = None
+            if archive_in_background and not daemon_enabled:
+                archiver = ArchiveMover(
+                    s3=s3,
+                    bucket=bucket,
+                    copy_part_size=copy_part_size,
+                    max_moves=archive_max_parallel_moves,
+                    max_part_copies=max_threads,
+                    delete_batch_size=archive_delete_batch_size,
+                    engine=engine,
+                    metrics=metrics
+                )
 
-            except SystemExit:
-                raise
-            except Exception:
-                failed = True
-                log.exception("Failed processing ZIP: %s", zip_key)
+            zip_kwargs = dict(
+                s3=s3,
+                bucket=bucket,
+                target_folder=target_folder,
+                rejected_folder=rejected_folder,
+                archive_enabled=archive_enabled,
+                archive_folder=archive_folder,
+                file_config=file_config,
+                split_enabled=split_enabled,
+                has_header=has_header,
+                split_size=split_size,
+                read_block=read_block,
+                max_threads=max_threads,
+                transfer_config=transfer_config,
+                reader_config=reader_config,
+                split_config=split_config,
+                upload_pool=upload_pool,
+                stored_copy_min_size=stored_copy_min_size,
+                copy_part_size=copy_part_size,
+                memory_budget=memory_budget,
+                max_in_flight_chunks=max_in_flight_chunks,
+                in_flight=threading.BoundedSemaphore(max_in_flight_chunks),
+                max_parallel_large_members=max_parallel_large_members,
+                quotechar=quotechar,
+                count_folder=count_folder,
+                count_format=count_format,
+                output_codec=output_codec,
+                checkpoint_folder=checkpoint_folder,
+                ledger_folder=ledger_folder,
+                force=force,
+                metrics=metrics,
+                engine=engine,
+                archiver=archiver
+            )
 
-                try:
-                    ensure_s3_object_exists(s3, bucket, zip_key)
+            if metrics is not None:
+                metrics.start_sampler(metrics_sample_seconds, upload_pool, memory_budget)
 
-                    rejected_key = move_s3_object(
-                        s3=s3,
-                        bucket=bucket,
-                        source_key=zip_key,
-                        target_base_prefix=rejected_folder,
-                        transfer_config=transfer_config
-                    )
-                    log.info("Moved failed ZIP to rejected: s3://%s/%s", bucket, rejected_key)
+            if daemon_enabled:
+                stop_event = threading.Event()
 
-                except SystemExit:
-                    raise
-                except Exception:
-                    log.exception("Failed moving ZIP to rejected folder: %s", zip_key)
+                def request_stop(signum, frame):
+                    log.info("Received signal %s | finishing in-flight archives, then stopping", signum)
+                    stop_event.set()
+
+                signal.signal(signal.SIGTERM, request_stop)
+                signal.signal(signal.SIGINT, request_stop)
+
+                run_unzip_daemon(
+                    sqs=boto3.client("sqs", config=s3_config),
+                    queue_url=queue_url,
+                    s3=s3,
+                    bucket=bucket,
+                    source_folder=source_folder,
+                    process_zip=lambda zip_key: process_zip_or_reject(zip_key, **zip_kwargs),
+                    max_parallel_zips=max(max_parallel_zips, 1),
+                    wait_time_seconds=queue_wait_seconds,
+                    visibility_timeout=queue_visibility_timeout,
+                    stop_event=stop_event
+                )
+            elif max_parallel_zips <= 1 or len(zip_keys) == 1:
+                for zip_key in zip_keys:
+                    if not process_and_archive_zip(zip_key=zip_key, **zip_kwargs):
+                        failed = True
+            else:
+                log.info("Processing %s ZIPs with max_parallel_zips=%s", len(zip_keys), max_parallel_zips)
+                with ThreadPoolExecutor(max_workers=max_parallel_zips) as zip_pool:
+                    futures = [
+                        zip_pool.submit(process_and_archive_zip, zip_key=zip_key, **zip_kwargs)
+                        for zip_key in zip_keys
+                    ]
+                    for ok in wait_for_futures(futures):
+                        if not ok:
+                            failed = True
+
+            if archiver is not None:
+                log.info("Waiting for background archive moves")
+                if not archiver.close():
+                    failed = True
+
+        if metrics is not None:
+            metrics.stop_sampler()
+            metrics.sample(None, memory_budget)
+            if metrics_folder:
+                write_metrics(s3, bucket, metrics_folder, metrics)
+            if metrics.statsd is not None:
+                metrics.statsd.close()
 
         if failed:
             sys.exit(1)
@@ -586,6 +2054,9 @@ def main():
     except Exception:
         log.exception("Job failed")
         sys.exit(1)
+    finally:
+        if engine is not None:
+            engine.close()
 
 
 if __name__ == "__main__":